@@ -0,0 +1,825 @@
+"""
+性能基准脚本
+用法: python bench.py <名称> [参数]    例如: python bench.py poll --ticks 50
+      python bench.py e2e --save-baseline   之后 python bench.py e2e 若有阶段回退则以 1 退出
+"""
+import io
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import importlib.util
+import subprocess
+import tempfile
+import threading
+import contextlib
+import statistics
+import tracemalloc
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+import test as app
+from PIL import Image, ImageDraw
+
+BENCHES = {}
+
+def bench(fn):
+    BENCHES[fn.__name__[len("bench_"):]] = fn
+    return fn
+
+def measure(fn, ticks):
+    """返回 (每次 CPU 毫秒, 每次峰值分配 KB)"""
+    fn()
+    tracemalloc.start()
+    peak = 0
+    cpu = 0.0
+    for _ in range(ticks):
+        tracemalloc.reset_peak()
+        t0 = time.process_time()
+        fn()
+        cpu += time.process_time() - t0
+        peak = max(peak, tracemalloc.get_traced_memory()[1])
+    tracemalloc.stop()
+    return cpu * 1000 / ticks, peak / 1024
+
+def report(rows):
+    w = max(len(r[0]) for r in rows)
+    for name, *vals in rows:
+        print(f"  {name:<{w}}  " + "  ".join(vals))
+
+# ------------------------------------------------------------------------------
+# 剪贴板轮询：每次 tick 的变化检测开销
+# ------------------------------------------------------------------------------
+
+@bench
+def bench_poll(args):
+    img = Image.new("RGBA", (args.width, args.height), (30, 30, 30, 255))
+    poller = app.ClipboardPoller()
+    rows = []
+    cpu, mem = measure(lambda: hash(img.tobytes()), args.ticks)
+    rows.append(("full-buffer hash (old)", f"{cpu:8.2f} ms/tick", f"{mem:10.0f} KB/tick"))
+    cpu, mem = measure(lambda: poller._fingerprint(img), args.ticks)
+    rows.append(("strided fingerprint", f"{cpu:8.2f} ms/tick", f"{mem:10.0f} KB/tick"))
+    if poller.seq_source:
+        cpu, mem = measure(poller._seq, args.ticks)
+        rows.append((f"sequence number ({poller.seq_source})", f"{cpu:8.2f} ms/tick", f"{mem:10.0f} KB/tick"))
+    print(f"Clipboard poll, {args.width}x{args.height} RGBA, {args.ticks} ticks")
+    report(rows)
+
+# ------------------------------------------------------------------------------
+# 流式聊天渲染：合帧追加 vs 每个 token 全量 setHtml
+# ------------------------------------------------------------------------------
+
+def synthetic_tokens(n):
+    words = ["the ", "model ", "streams ", "tokens ", "翻译", "结果", "，", "and ", "renders ", "them", ".\n"]
+    return [words[i % len(words)] for i in range(n)]
+
+@bench
+def bench_render(args):
+    from PyQt6.QtWidgets import QApplication
+    _ = QApplication.instance() or QApplication(sys.argv)  # 保持实例存活到函数结束
+    tokens = synthetic_tokens(args.tokens)
+    per_frame = max(1, round(args.rate * app.AutoResizingTextEdit.FRAME_MS / 1000))
+
+    def old():
+        bubble = app.MessageBubble("...", False)
+        acc = ""
+        for t in tokens:
+            acc += t
+            bubble.update_text(acc)
+
+    def new():
+        bubble = app.MessageBubble("...", False)
+        for i, t in enumerate(tokens):
+            bubble.append_text(t)
+            if (i + 1) % per_frame == 0: bubble.text_view.flush()  # 模拟每帧一次的定时器
+        bubble.text_view.flush()
+
+    rows = []
+    runs = [("coalesced append (new)", new)] + ([] if args.skip_old else [("setHtml per token (old)", old)])
+    for name, fn in runs:
+        t0 = time.process_time()
+        fn()
+        ms = (time.process_time() - t0) * 1000
+        rows.append((name, f"{ms:10.0f} ms UI thread", f"{ms * 1000 / len(tokens):8.1f} us/token"))
+    print(f"Chat render, {len(tokens)} tokens at {args.rate} tok/s ({per_frame} tokens/frame)")
+    report(rows)
+
+# ------------------------------------------------------------------------------
+# 全文搜索：合成语料上的即时查询延迟
+# ------------------------------------------------------------------------------
+
+def synthetic_corpus(n, seed=0):
+    rnd = random.Random(seed)
+    en = "error file save open settings network player quest inventory connection failed retry update download level".split()
+    zh = "错误 文件 保存 打开 设置 网络 玩家 任务 背包 连接 失败 重试 更新 下载 等级".split()
+    for _ in range(n):
+        k = rnd.randint(4, 12)
+        yield " ".join(rnd.choice(en) for _ in range(k)), "".join(rnd.choice(zh) for _ in range(k))
+
+def percentile(values, p):
+    values = sorted(values)
+    return values[int(p * (len(values) - 1))]
+
+@bench
+def bench_search(args):
+    path = os.path.join(tempfile.mkdtemp(), "search_bench.db")
+    idx = app.SearchIndex(path)
+    t0 = time.perf_counter()
+    with idx.lock:
+        for i, (raw, trans) in enumerate(synthetic_corpus(args.entries)): idx._insert(raw, trans, 'history', str(i), "2026-01-01 00:00")
+        idx.db.commit()
+    print(f"Search index, {args.entries} entries, built in {time.perf_counter() - t0:.1f}s ({os.path.getsize(path) / 1e6:.0f} MB)")
+    # 模拟逐字输入：每个前缀都查一次
+    queries = {"incremental zh": ["连", "连接", "连接失", "连接失败"], "incremental en": ["net", "netw", "network", "network fail"],
+               "rare term": ["quest inventory retry"], "mixed long + short": ["network 失败"], "no match": ["zzzqqq"], "no match, short": ["zq"]}
+    rows = []
+    for name, qs in queries.items():
+        times, hits = [], 0
+        for _ in range(args.ticks // len(qs) + 1):
+            for q in qs:
+                t = time.perf_counter()
+                hits = len(idx.search(q))
+                times.append((time.perf_counter() - t) * 1000)
+        rows.append((name, f"p50 {percentile(times, 0.5):7.2f} ms", f"p95 {percentile(times, 0.95):7.2f} ms", f"last hits {hits}"))
+    report(rows)
+
+# ------------------------------------------------------------------------------
+# 翻译记忆：百万句段规模下的精确 / 近似查找延迟与召回
+# ------------------------------------------------------------------------------
+
+def synthetic_segments(n, seed=0):
+    """词表足够大的合成句段，避免随机句子之间本来就很像"""
+    rnd = random.Random(seed)
+    vocab = ["".join(rnd.choice("abcdefghijklmnopqrstuvwxyz") for _ in range(rnd.randint(3, 9))) for _ in range(5000)]
+    zh = [chr(c) for c in range(0x4e00, 0x4e00 + 3000)]
+    for _ in range(n):
+        k = rnd.randint(3, 10)
+        yield " ".join(rnd.choice(vocab) for _ in range(k)), "".join(rnd.choice(zh) for _ in range(k * 2))
+
+def perturb(text, rnd):
+    """模拟同一句话的小变化：改一个词或删掉一个字母"""
+    words = text.split()
+    i = rnd.randrange(len(words))
+    if rnd.random() < 0.5: words[i] = words[i][:-1] or words[i]
+    else: words[i] = rnd.choice(["item", "menu", "value", "line"])
+    return " ".join(words)
+
+@bench
+def bench_tm(args):
+    path = os.path.join(tempfile.mkdtemp(), "tm_bench.db")
+    tm = app.TranslationMemory(path, max_segments=args.segments)
+    corpus = synthetic_segments(args.segments, seed=1)
+    t0 = time.perf_counter()
+    kept = []
+    while True:
+        batch = [pair for _, pair in zip(range(10000), corpus)]
+        if not batch: break
+        tm.add_pairs(batch)
+        kept += batch[:max(1, args.ticks * 10000 // args.segments)]
+    build = time.perf_counter() - t0
+    print(f"Translation memory, {tm.count} segments, built in {build:.1f}s ({tm.count / build:.0f} seg/s, {os.path.getsize(path) / 1e6:.0f} MB)")
+    rnd = random.Random(2)
+    sample = rnd.sample(kept, min(len(kept), args.ticks))
+    queries = {"exact": [(raw, raw) for raw, _ in sample],
+               "near (1 word changed)": [(perturb(raw, rnd), raw) for raw, _ in sample],
+               "miss": [(raw, None) for raw, _ in synthetic_segments(len(sample), seed=99)]}
+    rows = []
+    for name, qs in queries.items():
+        times, found = [], 0
+        for q, src in qs:
+            t = time.perf_counter()
+            answer, hints = tm.lookup(q)
+            times.append((time.perf_counter() - t) * 1000)
+            if src and (answer or any(h[1] == src for h in hints)): found += 1
+        rate = f"recall {found * 100 / len(qs):5.1f}%" if name != "miss" else f"false hints {sum(1 for q, _ in qs if tm.lookup(q)[1]) * 100 / len(qs):5.1f}%"
+        rows.append((name, f"p50 {percentile(times, 0.5):7.2f} ms", f"p95 {percentile(times, 0.95):7.2f} ms", rate))
+    report(rows)
+    st = tm.summary()
+    print(f"  hit rate {st['hit_rate'] * 100:.0f}% (exact {st['exact']}, fuzzy {st['fuzzy']}, miss {st['miss']})")
+
+# ------------------------------------------------------------------------------
+# 端到端延迟：本地假 OpenAI / Ollama 服务，分阶段计时并与基线比较
+# ------------------------------------------------------------------------------
+
+class StubServer(ThreadingHTTPServer):
+    """假 OpenAI (/chat/completions) 与 Ollama (/api/chat) 服务：收到请求后等待 latency 秒，再按 rate tok/s 逐个吐出 token"""
+    daemon_threads = True
+
+    def __init__(self, latency, rate, tokens, parallel=None):
+        super().__init__(("127.0.0.1", 0), StubHandler)
+        self.latency, self.rate = latency, rate
+        self.reply = self.make_reply(tokens)
+        self.received = []  # 每个推理请求的请求体读完的时刻 (perf_counter)
+        self.disconnects = []  # 客户端中途断开流的时刻
+        # 模拟服务端并发上限：超出的请求排队等生成槽位
+        self.slots = threading.BoundedSemaphore(parallel) if parallel else contextlib.nullcontext()
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+
+    @property
+    def url(self): return f"http://127.0.0.1:{self.server_port}"
+
+    @staticmethod
+    def make_reply(tokens):
+        words = synthetic_tokens(tokens)
+        return ["【Original】\n"] + words[:tokens // 2] + ["\n【Translation】\n"] + words[tokens // 2:]
+
+    def reply_for(self, body): return self.reply
+    def prefill(self, body): return 0.0
+
+    @staticmethod
+    def request_image(body):
+        """取出请求里的第一张图 (OpenAI data URL 或 Ollama base64)"""
+        for m in body.get("messages", []):
+            if m.get("images"): return app.base64.b64decode(m["images"][0])
+            if isinstance(m.get("content"), list):
+                for part in m["content"]:
+                    if part.get("type") == "image_url": return app.base64.b64decode(part["image_url"]["url"].split(",", 1)[1])
+        return None
+
+class StubHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True  # 逐 token 小包写出，避免 Nagle + 延迟 ACK 叠加的 40 ms
+
+    def log_message(self, *args): pass
+
+    def do_GET(self):
+        self.send_body(json.dumps({"data": [], "models": []}).encode())
+
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+        if self.path.endswith("/api/generate"):  # 预热 / 卸载
+            return self.send_body(json.dumps({"model": body.get("model"), "response": "", "done": True}).encode())
+        self.server.received.append(time.perf_counter())
+        with self.server.slots: self.generate(body)
+
+    def generate(self, body):
+        reply = self.server.reply_for(body)
+        time.sleep(self.server.latency + self.server.prefill(body))
+        is_ollama = self.path.endswith("/api/chat")
+        if is_ollama: frame = lambda t, done: json.dumps({"model": body["model"], "created_at": "2026-01-01T00:00:00Z", "message": {"role": "assistant", "content": t}, "done": done}) + "\n"
+        else: frame = lambda t, done: "data: " + json.dumps({"choices": [{"delta": {"content": t}}]}) + "\n\n"
+        if not body.get("stream", is_ollama):
+            text = "".join(reply)
+            time.sleep(len(reply) / self.server.rate)
+            if is_ollama: return self.send_body(frame(text, True).encode())
+            return self.send_body(json.dumps({"choices": [{"message": {"role": "assistant", "content": text}}]}).encode())
+        self.send_response(200)
+        self.send_header("Content-Type", "application/x-ndjson" if is_ollama else "text/event-stream")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        try:
+            for t in reply:
+                self.send_chunk(frame(t, False))
+                time.sleep(1 / self.server.rate)
+        except (BrokenPipeError, ConnectionResetError):
+            self.server.disconnects.append(time.perf_counter())
+            self.close_connection = True
+            return
+        self.send_chunk(frame("", True) if is_ollama else "data: [DONE]\n\n")
+        self.wfile.write(b"0\r\n\r\n")
+
+    def send_chunk(self, text):
+        data = text.encode()
+        self.wfile.write(b"%x\r\n%s\r\n" % (len(data), data))
+        self.wfile.flush()
+
+    def send_body(self, data):
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+def fixture_screenshot(w, h, seed=0):
+    """白底深色“文字行”的合成截图，压缩特性接近真实界面截图"""
+    rnd = random.Random(seed)
+    img = Image.new("RGB", (w, h), (250, 250, 250))
+    d = ImageDraw.Draw(img)
+    for y in range(12, h - 20, 24):
+        x = 16
+        while x < w - 60:
+            n = rnd.randint(20, 90)
+            d.rectangle((x, y, x + n, y + 12), fill=(rnd.randint(0, 60),) * 3)
+            x += n + rnd.randint(6, 14)
+    buf = io.BytesIO()
+    img.save(buf, "PNG")
+    return buf.getvalue()
+
+class ProbeAIWorker(app.AIWorker):
+    """记录各阶段时刻的 AIWorker"""
+    def __init__(self, img_bytes, config):
+        super().__init__(img_bytes)
+        self.config = config
+        self.marks = {}
+
+    def prepared_image(self, model, image=None):
+        t = time.perf_counter()
+        data = super().prepared_image(model, image)
+        if model == self.config['online_model']: app.b64_image(data)  # 在线路径随后复用这份编码
+        self.marks['encode'] = time.perf_counter() - t
+        self.marks['sent'] = time.perf_counter()
+        return data
+
+    def on_stream_chunk(self, chunk):
+        if 'first' not in self.marks: self.marks['first'], self.marks['cpu_first'] = time.perf_counter(), time.thread_time()
+        super().on_stream_chunk(chunk)
+
+    def run(self):
+        super().run()
+        self.marks['cpu_end'] = time.thread_time()
+
+class ProbeChatWorker(app.ChatWorker):
+    def __init__(self, history, config):
+        super().__init__(history)
+        self.config = config
+        self.marks = {}
+        self.sig_chunk.connect(self.on_chunk, app.Qt.ConnectionType.DirectConnection)  # 在工作线程里记录
+
+    def on_chunk(self, _):
+        if 'first' not in self.marks: self.marks['first'], self.marks['cpu_first'] = time.perf_counter(), time.thread_time()
+
+    def run(self):
+        self.marks['sent'] = time.perf_counter()
+        super().run()
+        self.marks['cpu_end'] = time.thread_time()
+
+def run_in_loop(worker, done_signal, timeout=60):
+    """启动工作线程并转动事件循环直到完成，返回主线程（渲染）CPU 秒数"""
+    from PyQt6.QtCore import QEventLoop, QTimer
+    loop = QEventLoop()
+    done_signal.connect(loop.quit)
+    QTimer.singleShot(int(timeout * 1000), loop.quit)
+    cpu = time.thread_time()
+    worker.start()
+    loop.exec()
+    worker.wait()
+    return time.thread_time() - cpu
+
+def e2e_stages(m, received, t0, t_end, render):
+    ms = lambda s: s * 1000
+    return {"encode": ms(m.get('encode', 0)), "upload": ms(received - m['sent']), "ttfb": ms(m['first'] - received),
+            "parse": ms(m['cpu_end'] - m['cpu_first']), "render": ms(render), "total": ms(t_end - t0)}
+
+def e2e_online_plain(config, server, img):
+    t0 = time.perf_counter()
+    data, _ = app.ImagePreprocessor(config).process(img, config['online_model'])
+    app.b64_image(data)
+    sent = time.perf_counter()
+    resp = app.OnlineClient.chat(config, [{'role': 'user', 'content': app.AIWorker.PROMPT, 'images': [data]}])
+    first = sent + resp.timing["ttfb"] / 1000
+    p = time.perf_counter()
+    raw, trans = app.AIWorker.parse_content(resp.json()['choices'][0]['message']['content'])
+    parse = time.perf_counter() - p
+    r = time.perf_counter()
+    app.ResultView(None).set_content(raw, trans, img)
+    render = time.perf_counter() - r
+    m = {'encode': sent - t0, 'sent': sent, 'first': first, 'cpu_first': 0, 'cpu_end': parse}
+    return e2e_stages(m, server.received[-1], t0, time.perf_counter(), render)
+
+def e2e_translate(config, server, img):
+    view = app.ResultView(None)
+    w = ProbeAIWorker(img, config)
+    w.sig_partial.connect(view.set_partial)
+    w.sig_result.connect(lambda raw, trans: view.set_content(raw, trans, img))
+    t0 = time.perf_counter()
+    render = run_in_loop(w, w.sig_result)
+    return e2e_stages(w.marks, server.received[-1], t0, time.perf_counter(), render)
+
+def e2e_chat(config, server, img):
+    t0 = time.perf_counter()
+    app.b64_image(img)
+    encode = time.perf_counter() - t0
+    bubble = app.MessageBubble("...", False)
+    w = ProbeChatWorker([{'role': 'user', 'content': "What does the dialog say?", 'images': [img]}], config)
+    w.sig_chunk.connect(bubble.append_text)
+    w.sig_done.connect(bubble.text_view.flush)
+    render = run_in_loop(w, w.sig_done)
+    w.marks['encode'] = encode
+    return e2e_stages(w.marks, server.received[-1], t0, time.perf_counter(), render)
+
+E2E_SCENARIOS = {
+    "online plain":     (e2e_online_plain, True),
+    "online translate": (e2e_translate, True),
+    "local translate":  (e2e_translate, False),
+    "online chat":      (e2e_chat, True),
+    "local chat":       (e2e_chat, False),
+}
+E2E_STAGES = ("encode", "upload", "ttfb", "parse", "render", "total")
+
+@bench
+def bench_e2e(args):
+    from PyQt6.QtWidgets import QApplication
+    _ = QApplication.instance() or QApplication(sys.argv)  # 保持实例存活到函数结束
+    server = StubServer(args.latency, args.stub_rate, args.reply_tokens)
+    # 引擎统计写到临时文件，不污染真实的 engine_stats.json；OLLAMA_HOST 在每次创建 ollama.Client 时读取
+    app.ENGINE_STATS_FILE = os.path.join(tempfile.mkdtemp(), "engine_stats.json")
+    os.environ["OLLAMA_HOST"] = server.url
+    base = {**app.ConfigManager.DEFAULT, "api_key": "sk-bench", "base_url": server.url + "/v1", "online_model": "bench-online",
+            "local_model": "bench-vl", "cache_enabled": False, "tm_enabled": False, "tile_enabled": False, "warmup_enabled": False}
+    sizes = [tuple(map(int, s.split("x"))) for s in args.sizes.split(",")]
+    fixtures = {f"{w}x{h}": fixture_screenshot(w, h) for w, h in sizes}
+    print(f"End-to-end, stub latency {args.latency * 1000:.0f} ms, {args.reply_tokens} tokens at {args.stub_rate:.0f} tok/s, median of {args.repeat} runs (ms)")
+    results = {}
+    for name, (fn, online) in E2E_SCENARIOS.items():
+        config = {**base, "use_online": online}
+        for size, img in fixtures.items():
+            runs = []
+            for i in range(args.repeat + 1):
+                with contextlib.redirect_stdout(io.StringIO()):
+                    stages = fn(config, server, bytes(img))  # 每次都是新对象，base64 备忘不会跨轮命中
+                if i: runs.append(stages)  # 第一轮用于建立连接，不计入
+            results[f"{name} {size}"] = {s: statistics.median(r[s] for r in runs) for s in E2E_STAGES}
+    rows = [("", *(f"{s:>8}" for s in E2E_STAGES))]
+    rows += [(key, *(f"{v[s]:8.1f}" for s in E2E_STAGES)) for key, v in results.items()]
+    report(rows)
+    check_baseline(results, args)
+
+def check_baseline(results, args):
+    """各阶段中位数超过基线 (1 + tolerance) 倍且多出 slack 毫秒以上即视为回退，进程以 1 退出"""
+    if args.save_baseline or not os.path.exists(args.baseline):
+        with open(args.baseline, "w", encoding="utf-8") as f: json.dump(results, f, indent=2, ensure_ascii=False)
+        print(f"Baseline written to {args.baseline}")
+        return
+    with open(args.baseline, "r", encoding="utf-8") as f: baseline = json.load(f)
+    failures = []
+    for key, stages in results.items():
+        for stage, ms in stages.items():
+            ref = baseline.get(key, {}).get(stage)
+            if ref is not None and ms > ref * (1 + args.tolerance) and ms - ref > args.slack:
+                failures.append(f"  {key} / {stage}: {ms:.1f} ms vs baseline {ref:.1f} ms")
+    if failures:
+        print(f"REGRESSION ({len(failures)}) against {args.baseline}:")
+        print("\n".join(failures))
+        sys.exit(1)
+    print(f"OK, no stage slower than {args.baseline} by more than {args.tolerance:.0%} (+{args.slack:.0f} ms)")
+
+# ------------------------------------------------------------------------------
+# 实时区域：每帧的差分开销
+# ------------------------------------------------------------------------------
+
+@bench
+def bench_live(args):
+    config = {**app.ConfigManager.DEFAULT}
+    frames = [Image.open(io.BytesIO(fixture_screenshot(args.width, args.height, seed=i % 3))) for i in range(6)]
+    for f in frames: f.load()
+    rows = []
+    numpy = app.np
+    for name, np_mod in [("NumPy diff", numpy), ("PIL ImageChops diff (fallback)", None)]:
+        if name.startswith("NumPy") and not numpy: continue
+        app.np = np_mod
+        cap = app.LiveCapture((0, 0, args.width, args.height), config)
+        prev = [None]
+        def tick(i=[0]):
+            cur = cap.to_frame(frames[i[0] % len(frames)])
+            cap.changed(prev[0], cur)
+            prev[0] = cur
+            i[0] += 1
+        cpu, mem = measure(tick, args.ticks)
+        rows.append((name, f"{cpu:8.2f} ms/frame", f"{cpu * config['live_fps'] / 10:6.2f}% CPU at {config['live_fps']} fps", f"{mem:8.0f} KB/frame"))
+    app.np = numpy
+    print(f"Live region diff, {args.width}x{args.height}, {args.ticks} frames (grab cost excluded)")
+    report(rows)
+
+# ------------------------------------------------------------------------------
+# 朗读：从按下 🔊 到开始出声 (time-to-first-audio)
+# ------------------------------------------------------------------------------
+
+TTS_TEXT = ("The connection to the server was lost. Your progress has been saved locally. "
+            "Please check your network settings and try again. If the problem persists, contact support. ") * 3
+
+@bench
+def bench_tts(args):
+    import pyttsx3
+
+    def old():
+        # 原实现：每次朗读都重新 init，整段文本一次性交给引擎
+        t0 = time.perf_counter()
+        first = []
+        engine = pyttsx3.init(args.tts_driver)
+        engine.setProperty('rate', 160)
+        engine.connect('started-utterance', lambda name=None: first or first.append(time.perf_counter() - t0))
+        engine.connect('started-word', lambda name=None, location=None, length=None: engine.stop())  # 出声即停，只测首音
+        engine.say(TTS_TEXT)
+        engine.runAndWait()
+        del engine
+        return first[0] if first else float('nan')
+
+    def first_audio(tts):
+        tts.last_first_audio = None
+        tts.speak(TTS_TEXT)
+        t0 = time.perf_counter()
+        while tts.last_first_audio is None and time.perf_counter() - t0 < 10: time.sleep(0.001)
+        tts.interrupt()
+        return tts.last_first_audio if tts.last_first_audio is not None else float('nan')
+
+    tts = app.TTSManager(driver=args.tts_driver)
+    tts.ready.wait()
+    runs = [("persistent engine, per sentence (new)", lambda: first_audio(tts))]
+    cache = app.TTSCache(tempfile.mkdtemp(), 64 * 1024 * 1024) if os.name == 'nt' else None
+    if cache:
+        cached = app.TTSManager(driver=args.tts_driver, cache=cache)
+        cached.ready.wait()
+        cached.prefetch(TTS_TEXT)
+        sentences = {cached.cache_key(s) for s in app.TTSManager.split(TTS_TEXT)[0]}
+        while not all(k in cache for k in sentences): time.sleep(0.05)
+        runs.append(("cached WAV replay (new)", lambda: first_audio(cached)))
+    runs.append(("init per utterance, whole text (old)", old))
+
+    rows = []
+    for name, fn in runs:
+        with contextlib.redirect_stdout(io.StringIO()):
+            times = [fn() * 1000 for _ in range(args.repeat)]
+            time.sleep(0.5)
+        rows.append((name, f"p50 {percentile(times, 0.5):8.1f} ms", f"max {max(times):8.1f} ms"))
+    tts.stop()
+    if cache: cached.stop()
+    print(f"Time to first audio, {len(TTS_TEXT)} chars, driver={args.tts_driver or 'default'}, {args.repeat} runs")
+    report(rows)
+
+# ------------------------------------------------------------------------------
+# 大图分块：单次整图 vs 分块并发
+# ------------------------------------------------------------------------------
+
+class VisionStubServer(StubServer):
+    """输出长度与图中文字量成正比、预填充耗时与像素数成正比的假视觉模型。
+    整图会被预处理缩小，scale 告诉它缩小了多少倍，以便按原图的文字量输出"""
+    def __init__(self, latency, rate, parallel, px_per_token, prefill_per_mpx):
+        super().__init__(latency, rate, 0, parallel)
+        self.px_per_token, self.prefill_per_mpx = px_per_token, prefill_per_mpx
+        self.scale = 1.0
+        self.tokens_sent = 0
+        self.lock = threading.Lock()
+
+    def reply_for(self, body):
+        img = Image.open(io.BytesIO(self.request_image(body)))
+        mask, s = app.ImageTiler.ink_mask(img)
+        ink = mask.histogram()[255] * (s * self.scale) ** 2
+        tokens = max(4, int(ink / self.px_per_token))
+        with self.lock: self.tokens_sent += tokens
+        return self.make_reply(tokens)
+
+    def prefill(self, body):
+        w, h = Image.open(io.BytesIO(self.request_image(body))).size
+        return w * h / 1e6 * self.prefill_per_mpx
+
+@bench
+def bench_tiles(args):
+    from PyQt6.QtWidgets import QApplication
+    _ = QApplication.instance() or QApplication(sys.argv)  # 保持实例存活到函数结束
+    server = VisionStubServer(args.latency, args.stub_rate, args.stub_parallel, args.px_per_token, args.prefill_per_mpx)
+    app.ENGINE_STATS_FILE = os.path.join(tempfile.mkdtemp(), "engine_stats.json")
+    base = {**app.ConfigManager.DEFAULT, "use_online": True, "api_key": "sk-bench", "base_url": server.url + "/v1",
+            "online_model": "bench-online", "cache_enabled": False, "tm_enabled": False}
+    edge = app.ImagePreprocessor(base).max_edge_for("bench-online")
+    print(f"Tiled vs single-shot, stub {args.latency * 1000:.0f} ms + {args.prefill_per_mpx:.2f} s/MPx prefill, "
+          f"{args.stub_rate:.0f} tok/s, {args.stub_parallel} parallel slots")
+    rows = []
+    for size in args.tile_sizes.split(","):
+        w, h = map(int, size.split("x"))
+        img = fixture_screenshot(w, h)
+        n = len(app.ImageTiler(base).tiles(img))
+        times = {}
+        for mode, tiled in (("single", False), ("tiled", True)):
+            server.scale = max(w, h) / edge if not tiled and edge and max(w, h) > edge else 1.0
+            server.tokens_sent = 0
+            worker = app.AIWorker(img)
+            worker.config = {**base, "tile_enabled": tiled}
+            t0 = time.perf_counter()
+            with contextlib.redirect_stdout(io.StringIO()): run_in_loop(worker, worker.sig_result, timeout=300)
+            times[mode] = (time.perf_counter() - t0, server.tokens_sent)
+        (ts, ks), (tt, kt) = times["single"], times["tiled"]
+        rows.append((size, f"{n:3d} tiles", f"single {ts:6.2f}s ({ks} tok)", f"tiled {tt:6.2f}s ({kt} tok)", f"speedup {ts / tt:5.2f}x"))
+    report(rows)
+
+# ------------------------------------------------------------------------------
+# 启动：从进程开始到托盘/热键可用，以及后台服务就绪；附逐模块导入耗时
+# ------------------------------------------------------------------------------
+
+HEAVY_MODULES = ["requests", "ollama", "pyttsx3", "pyperclip", "numpy", "PIL.Image", "PIL.ImageGrab", "PIL.ImageChops"]
+
+STARTUP_PROBE = r"""
+import sys, os, time, json
+t0 = time.perf_counter()
+sys.path.insert(0, {root!r})
+for name in {eager!r}:
+    try: __import__(name)
+    except ImportError: pass
+import test as app
+from PyQt6.QtWidgets import QApplication
+t_import = time.perf_counter()
+qapp = QApplication(sys.argv)
+core = app.OCRApp()
+marks = {{"import": t_import - t0, "tray": time.perf_counter() - t0}}
+while core.pending_services and time.perf_counter() - t0 < 60:
+    qapp.processEvents()
+    for name in ("engine", "tts"):
+        if name not in core.pending_services: marks.setdefault(name, time.perf_counter() - t0)
+    time.sleep(0.002)
+for name in ("engine", "tts"): marks.setdefault(name, time.perf_counter() - t0)
+print(json.dumps(marks))
+sys.stdout.flush()
+os._exit(0)
+"""
+
+def import_breakdown(code, depth):
+    """python -X importtime 的输出里取某一层的模块，按累计耗时降序 [(模块, ms)]"""
+    out = subprocess.run([sys.executable, "-X", "importtime", "-c", code], capture_output=True, text=True).stderr
+    rows = []
+    for line in out.splitlines():
+        if not line.startswith("import time:") or "|" not in line: continue
+        _, cumulative, name = line.split("|", 2)
+        try: ms = int(cumulative) / 1000
+        except ValueError: continue
+        if len(name) - len(name.lstrip()) == depth * 2 + 1: rows.append((name.strip(), ms))
+    return sorted(rows, key=lambda r: -r[1])
+
+@bench
+def bench_startup(args):
+    root = os.path.dirname(os.path.abspath(__file__))
+    env = {**os.environ}
+    env.setdefault("QT_QPA_PLATFORM", "offscreen")
+    print(f"Startup, median of {args.repeat} runs (ms from process start)")
+    rows = []
+    for name, eager in (("eager imports (old)", HEAVY_MODULES), ("lazy imports", [])):
+        runs = []
+        for _ in range(args.repeat):
+            out = subprocess.run([sys.executable, "-c", STARTUP_PROBE.format(root=root, eager=eager)], capture_output=True, text=True, env=env, cwd=root)
+            runs.append(json.loads(out.stdout.strip().splitlines()[-1]))
+        med = {k: statistics.median(r[k] for r in runs) * 1000 for k in runs[0]}
+        rows.append((name, f"import {med['import']:7.0f}", f"tray+hotkey {med['tray']:7.0f}", f"engine ready {med['engine']:7.0f}", f"tts ready {med['tts']:7.0f}"))
+    report(rows)
+    print("Imports at startup (cumulative ms):")
+    report([(m, f"{ms:7.1f}") for m, ms in import_breakdown(f"import sys; sys.path.insert(0, {root!r}); import test", 1)[:10]])
+    print("Deferred to first use / background:")
+    installed = [m for m in HEAVY_MODULES if importlib.util.find_spec(m.split('.')[0])]
+    report([(m, f"{ms:7.1f}") for m, ms in import_breakdown("; ".join(f"import {m}" for m in installed), 0) if m in installed])
+
+# ------------------------------------------------------------------------------
+# Ollama 守护：用假的 ollama 可执行文件测就绪、崩溃重启和退出
+# ------------------------------------------------------------------------------
+
+FAKE_OLLAMA = r"""
+import os, sys, time
+from http.server import HTTPServer, BaseHTTPRequestHandler
+if sys.argv[1:] != ["serve"]: sys.exit(2)
+class H(BaseHTTPRequestHandler):
+    def do_GET(self):
+        self.send_response(200)
+        self.send_header("Content-Length", "17")
+        self.end_headers()
+        self.wfile.write(b"Ollama is running")
+    def log_message(self, *a): pass
+time.sleep(float(os.environ.get("FAKE_OLLAMA_DELAY", "0")))
+host, port = os.environ["OLLAMA_HOST"].rsplit(":", 1)
+srv = HTTPServer(("127.0.0.1", int(port)), H)
+srv.serve_forever()
+"""
+
+def fake_ollama():
+    """写一个假的 ollama 可执行文件（POSIX 为带 shebang 的脚本，Windows 为 .cmd 包装）"""
+    d = tempfile.mkdtemp()
+    script = os.path.join(d, "fake_ollama.py")
+    with open(script, "w") as f: f.write(FAKE_OLLAMA)
+    if os.name == 'nt':
+        exe = os.path.join(d, "ollama.cmd")
+        with open(exe, "w") as f: f.write(f'@"{sys.executable}" "{script}" %*\n')
+    else:
+        exe = os.path.join(d, "ollama")
+        with open(exe, "w") as f: f.write(f"#!{sys.executable}\n" + FAKE_OLLAMA)
+        os.chmod(exe, 0o755)
+    return exe
+
+@bench
+def bench_ollama(args):
+    import socket
+    exe = fake_ollama()
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        port = s.getsockname()[1]
+    os.environ.update(OLLAMA_HOST=f"127.0.0.1:{port}", FAKE_OLLAMA_DELAY=str(args.ollama_delay))
+    svc = app.OllamaService(exe, health_interval=args.ollama_health, max_backoff=5)
+    events = []
+    direct = app.Qt.ConnectionType.DirectConnection  # 没有事件循环，在守护线程里直接记录
+    svc.sig_ready.connect(lambda: events.append(("ready", time.perf_counter())), direct)
+    svc.sig_unhealthy.connect(lambda r: events.append(("unhealthy", time.perf_counter())), direct)
+    svc.sig_restarted.connect(lambda n: events.append(("restarted", time.perf_counter())), direct)
+    app.OllamaService._inst = svc
+    print(f"Ollama supervisor, fake server starts in {args.ollama_delay:.1f}s and is killed once ready, health check every {args.ollama_health:.1f}s")
+    t0 = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        svc.start()
+        waited = app.OllamaService.wait_ready(30)
+        t_wait = time.perf_counter()
+        time.sleep(args.ollama_health)
+        t_crash = time.perf_counter()
+        svc.process.kill()  # 模拟崩溃
+        deadline = time.time() + 30
+        while [e for e, _ in events].count("ready") < 2 and time.time() < deadline: time.sleep(0.01)
+        pid = svc.process.pid if svc.process else None
+        t_stop = time.perf_counter()
+        svc.stop()
+        t_stopped = time.perf_counter()
+    first = lambda name, after=0: next((t for e, t in events if e == name and t >= after), None)
+    ready1, down = first("ready"), first("unhealthy")
+    ready2 = first("ready", down) if down else None
+    ms = lambda a, b: f"{(b - a) * 1000:8.0f} ms" if a and b else "       -"
+    alive = pid is not None and os.name != 'nt' and os.path.exists(f"/proc/{pid}")
+    report([("request waited for readiness", ms(t0, t_wait), "ok" if waited else "timed out"),
+            ("start -> ready (poll overhead)", ms(t0, ready1), f"{(ready1 - t0 - args.ollama_delay) * 1000:6.0f} ms over startup delay" if ready1 else ""),
+            ("crash -> unhealthy signal", ms(t_crash, down), ""),
+            ("unhealthy -> ready after restart", ms(down, ready2), f"restarts {svc.restarts}"),
+            ("stop (terminate process group)", ms(t_stop, t_stopped), "process gone" if not alive else "process still alive")])
+
+# ------------------------------------------------------------------------------
+# 调度：优先级插队与取消后断流
+# ------------------------------------------------------------------------------
+
+@bench
+def bench_sched(args):
+    from PyQt6.QtWidgets import QApplication
+    _ = QApplication.instance() or QApplication(sys.argv)  # 保持实例存活到函数结束
+    server = StubServer(args.latency, args.stub_rate, args.reply_tokens)
+    app.ENGINE_STATS_FILE = os.path.join(tempfile.mkdtemp(), "engine_stats.json")
+    os.environ["OLLAMA_HOST"] = server.url
+    config = {**app.ConfigManager.DEFAULT, "local_model": "bench-vl", "cache_enabled": False, "tm_enabled": False,
+              "tile_enabled": False, "warmup_enabled": False, "sched_limits": {"local": 1}}
+    app.RequestScheduler.configure(config)
+    img = fixture_screenshot(400, 120)
+    def worker(priority):
+        w = app.AIWorker(img, None, priority)
+        w.config = config
+        return w
+    per_request = args.latency + args.reply_tokens / args.stub_rate
+    print(f"Scheduler, local limit 1, {args.batch_jobs} batch jobs queued before one interactive capture (~{per_request * 1000:.0f} ms per request)")
+    rows = []
+    for name, prio in (("FIFO (same priority)", app.RequestScheduler.BATCH), ("interactive priority", app.RequestScheduler.INTERACTIVE)):
+        threads = [threading.Thread(target=worker(app.RequestScheduler.BATCH).resolve) for _ in range(args.batch_jobs)]
+        with contextlib.redirect_stdout(io.StringIO()):
+            for t in threads: t.start()
+            # 等批量任务都进了调度器（运行中 + 排队中）再发交互请求
+            while sum(app.RequestScheduler.stats()[0].get('local', (0, 0))[:2]) < args.batch_jobs: time.sleep(0.001)
+            t0 = time.perf_counter()
+            worker(prio).resolve()
+            latency = time.perf_counter() - t0
+            for t in threads: t.join()
+        rows.append((name, f"interactive latency {latency * 1000:7.0f} ms"))
+    report(rows)
+    engines, waits = app.RequestScheduler.stats()
+    report([(f"wait {k}", f"n={n:3d}", f"p50 {p50 * 1000:7.0f} ms", f"p95 {p95 * 1000:7.0f} ms") for k, (n, p50, p95) in waits.items()])
+    print("  peak queue depth: " + ", ".join(f"{e} {pk}" for e, (_, _, _, pk) in engines.items()))
+
+    # 取消：首个 token 到达后中止，测从 abort() 到线程退出、到服务端发现断开的时间
+    server.reply = server.make_reply(args.reply_tokens * 20)
+    w = worker(app.RequestScheduler.INTERACTIVE)
+    first = threading.Event()
+    w.sig_partial.connect(lambda *_: first.set(), app.Qt.ConnectionType.DirectConnection)
+    n_disc = len(server.disconnects)
+    with contextlib.redirect_stdout(io.StringIO()):
+        w.start()
+        first.wait(30)
+        t0 = time.perf_counter()
+        w.abort()
+        w.wait(10000)
+        t_exit = time.perf_counter()
+        deadline = time.time() + 5
+        while len(server.disconnects) == n_disc and time.time() < deadline: time.sleep(0.005)
+    disc = server.disconnects[n_disc] - t0 if len(server.disconnects) > n_disc else None
+    print("Cancel during a local stream:")
+    report([("abort -> worker exited", f"{(t_exit - t0) * 1000:7.1f} ms"),
+            ("abort -> server saw disconnect", f"{disc * 1000:7.1f} ms" if disc is not None else "  not seen")])
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="ScreenTranslatorAI benchmarks")
+    ap.add_argument("name", choices=sorted(BENCHES))
+    ap.add_argument("--ticks", type=int, default=50)
+    ap.add_argument("--width", type=int, default=3840)
+    ap.add_argument("--height", type=int, default=2160)
+    ap.add_argument("--tokens", type=int, default=10000)
+    ap.add_argument("--rate", type=float, default=60.0, help="流式 token 速率 (tok/s)")
+    ap.add_argument("--skip-old", action="store_true")
+    ap.add_argument("--entries", type=int, default=100000)
+    ap.add_argument("--sizes", default="400x120,1280x720,2560x1440", help="e2e 截图尺寸，逗号分隔")
+    ap.add_argument("--latency", type=float, default=0.1, help="假服务首个 token 前的等待 (秒)")
+    ap.add_argument("--stub-rate", type=float, default=200.0, help="假服务的 token 速率 (tok/s)")
+    ap.add_argument("--reply-tokens", type=int, default=60)
+    ap.add_argument("--repeat", type=int, default=3)
+    ap.add_argument("--baseline", default=os.path.join(app.BASE_DIR, "bench_baseline.json"))
+    ap.add_argument("--save-baseline", action="store_true")
+    ap.add_argument("--tolerance", type=float, default=0.25)
+    ap.add_argument("--slack", type=float, default=5.0, help="允许的绝对波动 (ms)，避免极短阶段误报")
+    ap.add_argument("--tile-sizes", default="3840x2160,5120x1440,7680x2160")
+    ap.add_argument("--stub-parallel", type=int, default=4, help="假服务同时生成的请求数")
+    ap.add_argument("--px-per-token", type=float, default=2000.0, help="每个输出 token 对应的墨迹像素")
+    ap.add_argument("--prefill-per-mpx", type=float, default=0.5, help="预填充耗时 (秒/百万像素)")
+    ap.add_argument("--segments", type=int, default=1000000, help="翻译记忆基准的句段数")
+    ap.add_argument("--ollama-delay", type=float, default=1.0, help="假 ollama 启动到开始监听的秒数")
+    ap.add_argument("--ollama-health", type=float, default=0.5, help="健康检查间隔 (秒)")
+    ap.add_argument("--batch-jobs", type=int, default=4, help="调度基准中先排队的批量任务数")
+    ap.add_argument("--tts-driver", default=None, help="pyttsx3 驱动名 (sapi5 / nsss / espeak)，默认按平台")
+    args = ap.parse_args(argv)
+    BENCHES[args.name](args)
+
+if __name__ == "__main__":
+    main()
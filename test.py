@@ -6,18 +6,29 @@ import threading
 import json
 import queue
 import subprocess
-import requests
+import signal
 import keyboard
-import pyperclip
 import io
-import ollama
-import pyttsx3
 import glob
 import base64
 import atexit
+import hashlib
+import random
+import socket
+import re
+import sqlite3
+import shutil
+import tempfile
+import wave
+import zlib
+import struct
+import heapq
+import importlib
+import logging
+from collections import OrderedDict, deque
 
 from PyQt6.QtWidgets import (
-    QApplication, QLabel, QVBoxLayout, QWidget, QHBoxLayout, 
+    QApplication, QLabel, QVBoxLayout, QWidget, QHBoxLayout, QListWidget, QListWidgetItem,
     QPushButton, QSystemTrayIcon, QMenu, QFrame,
     QGraphicsDropShadowEffect, QTextBrowser, QTextEdit, QStackedWidget,
     QSizeGrip, QScrollArea, QFileDialog, QDialog, QInputDialog, 
@@ -31,7 +42,41 @@ from PyQt6.QtGui import (
     QFont, QIcon, QPixmap, QPainter, QColor, QAction, 
     QTextCursor, QWheelEvent, QMouseEvent
 )
-from PIL import Image, ImageGrab
+
+class _LazyModule:
+    """首次访问属性时才导入。这几个模块占了启动耗时的大头，托盘和热键出现前都用不到"""
+    def __init__(self, name, optional=False):
+        self._name, self._optional, self._mod = name, optional, None
+        self._lock = threading.Lock()
+
+    def _load(self):
+        if self._mod is None:
+            with self._lock:
+                if self._mod is None:
+                    try: self._mod = importlib.import_module(self._name)
+                    except ImportError:
+                        if not self._optional: raise
+                        self._mod = False
+        return self._mod
+
+    def __getattr__(self, attr):
+        mod = self._load()
+        if mod is False: raise AttributeError(f"optional module {self._name} is not installed")
+        return getattr(mod, attr)
+
+    def __bool__(self):
+        return self._load() is not False
+
+requests = _LazyModule("requests")
+ollama = _LazyModule("ollama")
+pyttsx3 = _LazyModule("pyttsx3")
+pyperclip = _LazyModule("pyperclip")
+Image = _LazyModule("PIL.Image")
+ImageGrab = _LazyModule("PIL.ImageGrab")
+ImageChops = _LazyModule("PIL.ImageChops")
+np = _LazyModule("numpy", optional=True)  # 没装时实时区域的帧差分退回 PIL 实现
+
+log = logging.getLogger("ScreenTranslatorAI")  # 各阶段的诊断输出，启动时加 --debug 才打印
 
 # ==============================================================================
 # 1. 全局配置 & 样式
@@ -44,6 +89,13 @@ else:
 
 CONFIG_FILE = os.path.join(BASE_DIR, "config.json")
 SAVE_DIR = os.path.join(BASE_DIR, "saved_translations")
+CACHE_DB = os.path.join(BASE_DIR, "translation_cache.db")
+ENGINE_STATS_FILE = os.path.join(BASE_DIR, "engine_stats.json")
+SEARCH_DB = os.path.join(BASE_DIR, "search_index.db")
+TRACE_FILE = os.path.join(BASE_DIR, "traces.jsonl")
+START_TIME = time.perf_counter()  # 启动耗时统计的起点（之前只有标准库和 PyQt 的导入）
+TM_DB = os.path.join(BASE_DIR, "translation_memory.db")
+TTS_CACHE_DIR = os.path.join(BASE_DIR, "tts_cache")
 
 class ConfigManager:
     DEFAULT = {
@@ -52,7 +104,74 @@ class ConfigManager:
         "api_key": "",
         "base_url": "https://api.openai.com/v1",
         "online_model": "gpt-4o",
-        "local_model": "qwen3-vl:8b"
+        "local_model": "qwen3-vl:8b",
+        "cache_enabled": True,
+        "cache_mem_items": 64,
+        "cache_max_mb": 32,
+        "cache_max_age_days": 30,
+        "preprocess_enabled": True,
+        "preprocess_trim": True,
+        "preprocess_grayscale": False,
+        "preprocess_max_edge": {"default": 1568},
+        "preprocess_formats": ["PNG", "JPEG", "WEBP"],
+        "preprocess_quality": 90,
+        "http_connect_timeout": 5,
+        "http_first_byte_timeout": 60,
+        "http_idle_timeout": 30,
+        "http_retries": 2,
+        "http_pool_size": 4,
+        "dispatch_mode": "serial",
+        "hedge_delay": 3.0,
+        "hedge_min_delay": 0.5,
+        "hedge_max_delay": 10.0,
+        "circuit_fail_threshold": 3,
+        "circuit_open_seconds": 30,
+        "warmup_enabled": True,
+        "ollama_keep_alive": 600,
+        "ollama_cmd": "ollama",
+        "ollama_ready_timeout": 30,
+        "ollama_health_interval": 5,
+        "ollama_max_backoff": 30,
+        "ollama_hang_timeout": 60,
+        "idle_unload_minutes": 15,
+        "chat_context_tokens": 6000,
+        "history_max_entries": 200,
+        "history_max_age_hours": 24,
+        "history_max_disk_mb": 500,
+        "history_mem_mb": 4,
+        "history_menu_items": 20,
+        "favorites_page_size": 20,
+        "tile_enabled": True,
+        "tile_threshold": 2400,
+        "tile_max_edge": 1568,
+        "tile_overlap": 48,
+        "tile_workers": 4,
+        "tile_max_count": 16,
+        "live_fps": 4,
+        "live_threshold": 0.003,
+        "live_pixel_delta": 24,
+        "live_debounce_ms": 300,
+        "live_region": None,
+        "tts_cache_enabled": True,
+        "tts_cache_max_mb": 64,
+        "tts_prefetch": True,
+        "trace_enabled": False,
+        "trace_max_mb": 5,
+        "ocr_enabled": False,
+        "ocr_tesseract": "",
+        "ocr_lang": "eng+chi_sim",
+        "ocr_psm": 6,
+        "ocr_min_conf": 85,
+        "ocr_min_word_conf": 50,
+        "ocr_max_pixels": 2000000,
+        "ocr_timeout": 5,
+        "ocr_online_model": "",
+        "ocr_local_model": "",
+        "tm_enabled": True,
+        "tm_max_segments": 1000000,
+        "tm_fuzzy_min": 0.6,
+        "tm_hints": 5,
+        "sched_limits": {"online": 4, "local": 2}
     }
 
     @classmethod
@@ -101,33 +220,281 @@ STYLESHEET = """
 # 2. 核心服务
 # ==============================================================================
 
-class OllamaService:
-    _process = None
-    _owned = False
+class OllamaService(QObject):
+    """Ollama 守护线程：本机没有服务时拉起 ollama serve，按指数退避轮询就绪；进程退出或长时间无响应时重启。
+    本地请求先 wait_ready() 再发；状态变化通过 Qt 信号通知界面"""
+    sig_ready = pyqtSignal()
+    sig_unhealthy = pyqtSignal(str)
+    sig_restarted = pyqtSignal(int)  # 累计重启次数
+    LOCAL_HOSTS = ('127.0.0.1', 'localhost', '::1', '[::1]')
+    _inst = None
+    _inst_lock = threading.Lock()
+
+    def __init__(self, cmd="ollama", host=None, ready_timeout=30, health_interval=5, max_backoff=30, hang_timeout=60):
+        super().__init__()
+        self.cmd = cmd
+        self.url = self.host_url(host if host is not None else os.environ.get("OLLAMA_HOST", ""))
+        self.ready_timeout = ready_timeout
+        self.health_interval = health_interval
+        self.max_backoff = max_backoff
+        self.hang_timeout = hang_timeout
+        self.ready = threading.Event()
+        self.stopping = threading.Event()
+        self.process = None
+        self.state = 'stopped'  # stopped / starting / ready / unhealthy / missing
+        self.restarts = 0
+        self.supervising = False
+        self.thread = None
+
+    @classmethod
+    def instance(cls):
+        with cls._inst_lock:
+            if cls._inst is None:
+                cfg = ConfigManager.load()
+                cls._inst = cls(cfg['ollama_cmd'], ready_timeout=cfg['ollama_ready_timeout'], health_interval=cfg['ollama_health_interval'],
+                                max_backoff=cfg['ollama_max_backoff'], hang_timeout=cfg['ollama_hang_timeout'])
+            return cls._inst
+
+    @staticmethod
+    def host_url(host):
+        """按 ollama 客户端 (_parse_host) 的规则解析 OLLAMA_HOST：没写协议时默认 http 和 11434 端口，
+        写了协议但没写端口时用 80 / 443；0.0.0.0 改为本机"""
+        scheme, sep, rest = (host or "").partition("://")
+        if not sep: scheme, rest = "http", host or ""
+        port = {'http': 80, 'https': 443}.get(scheme, 11434) if sep else 11434
+        hostport, _, path = rest.partition("/")
+        if hostport.startswith("["):
+            name, _, tail = hostport.partition("]")
+            name += "]"
+            if tail.startswith(":") and tail[1:]: port = int(tail[1:])
+        else:
+            name, _, p = hostport.partition(":")
+            if p: port = int(p)
+        name = name or "127.0.0.1"
+        if name == "0.0.0.0": name = "127.0.0.1"
+        path = f"/{path}".rstrip("/") if path else ""
+        return f"{scheme}://{name}:{port}{path}"
+
+    def is_local(self):
+        import urllib.parse
+        return urllib.parse.urlsplit(self.url).hostname in self.LOCAL_HOSTS
+
+    def hopeless(self):
+        """没有可执行文件，或远程服务无响应：等下去也不会就绪"""
+        return self.state == 'missing' or (self.state == 'unhealthy' and not self.is_local())
+
+    @classmethod
+    def wait_ready(cls, timeout=None, cancel=None):
+        """没有启用守护时直接放行；只在启动中或守护进程重启中时等待，超时、确定起不来或被取消时返回 False"""
+        inst = cls._inst
+        if inst is None or not inst.supervising: return True
+        deadline = time.monotonic() + (inst.ready_timeout if timeout is None else timeout)
+        while not inst.ready.wait(0.1):
+            if inst.hopeless() or (cancel and cancel.is_cancelled()) or time.monotonic() > deadline: return False
+        return True
 
     @classmethod
-    def check_and_start(cls):
-        if cls.is_running(): return
+    def shutdown(cls):
+        if cls._inst: cls._inst.stop()
+
+    def start(self):
+        if self.supervising: return
+        self.supervising = True
+        self.stopping.clear()
+        self.thread = threading.Thread(target=self._supervise, daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        """停止守护并结束自己拉起的服务（连同它的 runner 子进程）"""
+        self.stopping.set()
+        self.supervising = False
+        if self.thread and self.thread is not threading.current_thread(): self.thread.join(2)
+        self._kill()
+        self.ready.clear()
+        self.state = 'stopped'
+
+    def probe(self, timeout=0.5):
+        import urllib.request
         try:
+            with urllib.request.urlopen(self.url, timeout=timeout) as r: return r.status == 200
+        except Exception: return False
+
+    def _set_state(self, state, reason=""):
+        if state == self.state: return
+        self.state = state
+        if state == 'ready':
+            self.ready.set()
+            log.debug("[ollama] ready at %s (%s)", self.url, 'supervised' if self.process else 'external')
+            self.sig_ready.emit()
+        else:
+            self.ready.clear()
+            if state in ('unhealthy', 'missing'):
+                log.debug("[ollama] %s: %s", state, reason)
+                self.sig_unhealthy.emit(reason)
+
+    def _supervise(self):
+        delay, down_since, healthy_since, crashes = 0.1, None, None, 0
+        while not self.stopping.is_set():
+            now = time.monotonic()
+            if self.probe():
+                self._set_state('ready')
+                delay, down_since = 0.1, None
+                healthy_since = healthy_since or now
+                # 稳定运行一段时间后才清零崩溃计数，反复崩溃时重启间隔持续拉长
+                if now - healthy_since > 60: crashes = 0
+                self.stopping.wait(self.health_interval)
+                continue
+            healthy_since = None
+            down_since = down_since or now
+            if self.state == 'ready': self._set_state('unhealthy', "not responding")
+            exited = self.process is not None and self.process.poll() is not None
+            hung = self.process is not None and not exited and now - down_since > self.hang_timeout
+            if self.is_local() and (self.process is None or exited or hung):
+                if self.process is not None:
+                    reason = f"exited with code {self.process.returncode}" if exited else f"no response for {self.hang_timeout}s"
+                    self._set_state('unhealthy', reason)
+                    log.debug("[ollama] %s, restarting", reason)
+                    self._kill()
+                    crashes += 1
+                    if self.stopping.wait(min(self.max_backoff, 0.5 * 2 ** (crashes - 1))): break
+                    self.restarts += 1
+                    self.sig_restarted.emit(self.restarts)
+                if not self._spawn():
+                    self._set_state('missing', f"cannot run {self.cmd}")
+                    self.stopping.wait(self.max_backoff)
+                    continue
+                if self.state != 'unhealthy': self._set_state('starting')
+                down_since = time.monotonic()
+            elif not self.is_local():
+                self._set_state('unhealthy', f"{self.url} not responding")
+            self.stopping.wait(delay)
+            # 自己拉起的进程还活着时多半只是在启动，轮询间隔封顶 1 秒，尽快发现就绪
+            delay = min(delay * 1.5, 1.0 if self.process is not None else self.max_backoff)
+
+    def _spawn(self):
+        if os.name == 'nt':
             si = subprocess.STARTUPINFO()
             si.dwFlags |= subprocess.STARTF_USESHOWWINDOW
-            cls._process = subprocess.Popen(["ollama", "serve"], stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, startupinfo=si, creationflags=subprocess.CREATE_NO_WINDOW if os.name == 'nt' else 0)
-            cls._owned = True
-        except: pass
+            kw = {'startupinfo': si, 'creationflags': subprocess.CREATE_NO_WINDOW}
+        else:
+            kw = {'start_new_session': True}  # 独立进程组，结束时连同 runner 子进程一起发信号
+        try: self.process = subprocess.Popen([self.cmd, "serve"], stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, **kw)
+        except OSError:
+            self.process = None
+            return False
+        log.debug("[ollama] started %s serve (pid %d)", self.cmd, self.process.pid)
+        return True
+
+    def _kill(self):
+        proc, self.process = self.process, None
+        if proc is None or proc.poll() is not None: return
+        try:
+            if os.name == 'nt':
+                subprocess.run(["taskkill", "/F", "/T", "/PID", str(proc.pid)], stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+            else:
+                os.killpg(proc.pid, signal.SIGTERM)
+                try: proc.wait(5)
+                except subprocess.TimeoutExpired: os.killpg(proc.pid, signal.SIGKILL)
+            proc.wait(5)
+        except (OSError, subprocess.SubprocessError): pass
+
+atexit.register(OllamaService.shutdown)
+
+def ollama_closer(client):
+    """返回断开 ollama 客户端连接的回调，取消流式请求用；库内部结构变了拿不到底层连接时什么都不做"""
+    def close():
+        inner = getattr(client, '_client', None)
+        try:
+            if inner is not None: inner.close()
+        except Exception: pass
+    return close
 
-    @classmethod
-    def stop(cls):
-        if cls._owned and cls._process:
-            try:
-                subprocess.run(["taskkill", "/F", "/T", "/PID", str(cls._process.pid)], stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
-            except: pass
+class OllamaWarmup:
+    """本地模型预热：启动和按下热键时后台加载模型，活跃期间续期 keep_alive，空闲超时后卸载释放内存"""
+    lock = threading.Lock()
+    models = {}  # model -> {'status': cold/loading/ready, 'load_s', 'ready_s', 'refreshed'}
+    last_active = 0
+    _watcher = None
 
     @staticmethod
-    def is_running():
-        try: return requests.get("http://127.0.0.1:11434", timeout=0.2).status_code == 200
-        except: return False
+    def needed(config):
+        """在线引擎可用且串行调度时本地只是兜底，不占内存预热"""
+        if not config.get('warmup_enabled', True): return False
+        if not (config['use_online'] and config['api_key']): return True
+        if config.get('dispatch_mode', 'serial') != 'serial': return True
+        return EngineHealth.summary('online', config['online_model'])['state'] != 'closed'
 
-atexit.register(OllamaService.stop)
+    @classmethod
+    def touch(cls, config=None):
+        """标记用户活跃；模型未就绪则后台加载"""
+        config = config or ConfigManager.load()
+        cls.last_active = time.time()
+        if not cls.needed(config): return
+        model = config.get('local_model', 'qwen3-vl:8b')
+        with cls.lock:
+            st = cls.models.setdefault(model, {'status': 'cold', 'load_s': None, 'ready_s': None, 'refreshed': 0})
+            if st['status'] != 'cold': return
+            st['status'] = 'loading'
+            if cls._watcher is None:
+                cls._watcher = threading.Thread(target=cls._watch, daemon=True)
+                cls._watcher.start()
+        threading.Thread(target=cls._load, args=(model, config['ollama_keep_alive']), daemon=True).start()
+
+    @classmethod
+    def mark_used(cls, model):
+        """一次成功的本地请求同样会让模型常驻 keep_alive 时长"""
+        cls.last_active = time.time()
+        with cls.lock:
+            st = cls.models.setdefault(model, {'status': 'ready', 'load_s': None, 'ready_s': None, 'refreshed': 0})
+            st.update(status='ready', refreshed=time.time())
+
+    @classmethod
+    def reset(cls):
+        with cls.lock:
+            for st in cls.models.values():
+                if st['status'] == 'ready': st['status'] = 'cold'
+
+    @classmethod
+    def _load(cls, model, keep_alive):
+        t0 = time.perf_counter()
+        try:
+            if not OllamaService.wait_ready(): raise RuntimeError("ollama not ready")
+            # 空 prompt 的 generate 只加载模型，不做推理；加载同样占显卡，和批量翻译一样排队
+            with RequestScheduler.slot('local', RequestScheduler.BATCH):
+                resp = ollama.Client().generate(model=model, prompt="", keep_alive=keep_alive)
+            load_s = (resp.get('load_duration') or 0) / 1e9
+            ready_s = time.perf_counter() - t0
+            with cls.lock: cls.models[model].update(status='ready', load_s=load_s, ready_s=ready_s, refreshed=time.time())
+            log.debug("[warmup] %s ready in %.2fs (model load %.2fs)", model, ready_s, load_s)
+        except Exception as e:
+            with cls.lock: cls.models[model]['status'] = 'cold'
+            log.debug("[warmup] %s failed: %s", model, e)
+
+    @classmethod
+    def _watch(cls):
+        while True:
+            time.sleep(15)
+            config = ConfigManager.load()
+            keep_alive = config['ollama_keep_alive']
+            idle = time.time() - cls.last_active > config['idle_unload_minutes'] * 60
+            if not OllamaService.wait_ready(0): continue
+            with cls.lock: ready = [m for m, st in cls.models.items() if st['status'] == 'ready']
+            for model in ready:
+                try:
+                    if idle:
+                        with RequestScheduler.slot('local', RequestScheduler.BATCH):
+                            ollama.Client().generate(model=model, prompt="", keep_alive=0)
+                        with cls.lock: cls.models[model]['status'] = 'cold'
+                        log.debug("[warmup] %s unloaded after idle", model)
+                    elif time.time() - cls.models[model]['refreshed'] > keep_alive / 2:
+                        with RequestScheduler.slot('local', RequestScheduler.BATCH):
+                            ollama.Client().generate(model=model, prompt="", keep_alive=keep_alive)
+                        with cls.lock: cls.models[model]['refreshed'] = time.time()
+                except: pass
+
+    @classmethod
+    def status(cls):
+        with cls.lock: return {m: dict(st) for m, st in cls.models.items()}
 
 class ScreenshotCleaner:
     @staticmethod
@@ -143,45 +510,402 @@ class ScreenshotCleaner:
                     if time.time() - os.path.getmtime(latest) < 15: os.remove(latest)
         except: pass
 
+class TTSCache:
+    """合成语音缓存：按 规范化文本+音色+语速 的哈希存 WAV 文件，总字节数超限时淘汰最久未用的"""
+    def __init__(self, directory, max_bytes):
+        os.makedirs(directory, exist_ok=True)
+        self.dir = directory
+        self.max_bytes = max_bytes
+        self.lock = threading.Lock()
+        self.entries = OrderedDict()  # key -> 字节数，最近使用的在末尾
+        files = []
+        for n in os.listdir(directory):
+            p = os.path.join(directory, n)
+            if n.endswith(".wav"): files.append((os.path.getmtime(p), n[:-4], os.path.getsize(p)))
+            elif n.endswith(".tmp"): os.remove(p)  # 上次合成到一半退出留下的
+        for _, key, size in sorted(files): self.entries[key] = size
+        self.total = sum(self.entries.values())
+        self.hits = self.misses = 0
+
+    @classmethod
+    def from_config(cls, config):
+        # 回放缓存的 WAV 用的是 winsound，其他平台没有现成的播放器，直接朗读
+        if not config.get('tts_cache_enabled', True) or os.name != 'nt': return None
+        try: return cls(TTS_CACHE_DIR, config['tts_cache_max_mb'] * 1024 * 1024)
+        except OSError: return None
+
+    @staticmethod
+    def make_key(text, voice, rate):
+        return hashlib.sha1(f"{voice}|{rate}|{' '.join(text.split())}".encode('utf-8')).hexdigest()
+
+    def path(self, key): return os.path.join(self.dir, key + ".wav")
+
+    def __contains__(self, key):
+        with self.lock: return key in self.entries
+
+    def get(self, key):
+        with self.lock:
+            if key not in self.entries:
+                self.misses += 1
+                return None
+            self.entries.move_to_end(key)
+            self.hits += 1
+        try: os.utime(self.path(key))  # 重启后按 mtime 恢复 LRU 顺序
+        except OSError: pass
+        return self.path(key)
+
+    def put(self, key, tmp_path):
+        size = os.path.getsize(tmp_path)
+        os.replace(tmp_path, self.path(key))
+        with self.lock:
+            self.total += size - self.entries.pop(key, 0)
+            self.entries[key] = size
+            while self.total > self.max_bytes and len(self.entries) > 1:
+                old, n = self.entries.popitem(last=False)
+                self.total -= n
+                try: os.remove(self.path(old))
+                except OSError: pass
+
 class TTSManager(QObject):
-    def __init__(self):
+    """常驻 TTS 引擎：文本按句切分逐句朗读，新请求在下一个词边界打断当前朗读；译文仍在流式生成时可以边生成边读"""
+    SENTENCE = re.compile(r'.+?(?:[。！？!?；;…]+[”’」』"\')]*|\.(?=\s)|\n)', re.S)
+    MAX_CHUNK = 160  # 没有标点的长段落按逗号/空格先切出一块，不必等整段
+
+    def __init__(self, rate=160, driver=None, cache=None):
         super().__init__()
+        self.rate = rate
+        self.driver = driver
+        self.cache = cache
+        self.voice = None
+        self.pending = deque(maxlen=64)  # 空闲时预先合成进缓存的句子
+        self.synthesizing = False
         self.queue = queue.Queue()
+        self.lock = threading.Lock()
+        self.gen = 0             # 每次 speak() 加一，旧的句子出队时直接丢弃
+        self.speaking = 0        # 正在朗读的句子所属的 gen
+        self.consumed = 0        # 当前文本中已切出的字符数
+        self.tail = ""
+        self.streaming = False
+        self.t_request = None
+        self.last_first_audio = None  # 最近一次从 speak() 到开始出声的秒数
+        self.engine = None
+        self.ready = threading.Event()
         self.running = True
         threading.Thread(target=self._worker, daemon=True).start()
 
-    def speak(self, text):
-        if text:
+    def speak(self, text, final=True):
+        """打断当前朗读并开始读 text；final=False 表示文本还在增长，之后用 update() 追加。返回本次朗读的编号"""
+        with self.lock:
+            self.gen += 1
+            self.consumed, self.tail = 0, ""
+            self.streaming = not final
+            self.t_request = time.perf_counter()
+            with self.queue.mutex: self.queue.queue.clear()
+            self._enqueue(text or "", final)
+            return self.gen
+
+    def update(self, gen, text, final=False):
+        """流式朗读：text 为目前为止的完整文本，只切出新增的完整句子"""
+        with self.lock:
+            if gen != self.gen or not self.streaming: return
+            self.streaming = not final
+            self._enqueue(text or "", final)
+
+    def prefetch(self, text):
+        """译文到达时调用：空闲时把各句预先合成为 WAV，第一次按 🔊 就能直接播放"""
+        if not self.cache or not text: return
+        with self.lock:
+            for s in self.split(text)[0]:
+                if s not in self.pending and len(self.pending) < self.pending.maxlen: self.pending.append(s)
+
+    def interrupt(self):
+        with self.lock:
+            self.gen += 1
+            self.streaming = False
             with self.queue.mutex: self.queue.queue.clear()
-            self.queue.put(text)
+
+    def _enqueue(self, text, final):
+        if self.tail and text[self.consumed - len(self.tail):self.consumed] != self.tail:
+            # 前缀变了（如首尾空白被重新裁剪），按已读的最后一段重新定位
+            i = text.find(self.tail)
+            self.consumed = i + len(self.tail) if i >= 0 else len(text)
+        sentences, self.consumed = self.split(text, self.consumed, final)
+        self.tail = text[max(0, self.consumed - 20):self.consumed]
+        for s in sentences: self.queue.put((self.gen, s))
+
+    @classmethod
+    def split(cls, text, start=0, final=True):
+        """从 start 起切出完整句子，返回 (句子列表, 新的 start)；final 时剩余部分也算一句"""
+        out, pos = [], start
+        for m in cls.SENTENCE.finditer(text, start):
+            out.append(m.group())
+            pos = m.end()
+        rest = text[pos:]
+        if final:
+            out.append(rest)
+            pos = len(text)
+        elif len(rest) > cls.MAX_CHUNK:
+            cut = max(rest.rfind(c, 0, cls.MAX_CHUNK) for c in "，,、 ")
+            if cut > 0:
+                out.append(rest[:cut + 1])
+                pos += cut + 1
+        return [x.strip() for x in out if x.strip()], pos
+
+    def _engine(self):
+        if self.engine is None:
+            self.engine = pyttsx3.init(self.driver)
+            self.engine.setProperty('rate', self.rate)
+            self.engine.connect('started-utterance', self._on_start)
+            self.engine.connect('started-word', self._on_word)
+            try: self.voice = self.engine.getProperty('voice')
+            except Exception: self.voice = None
+        return self.engine
+
+    def cache_key(self, sentence):
+        return TTSCache.make_key(sentence, self.voice, self.rate)
+
+    def _on_start(self, name=None):
+        if self.t_request is not None and not self.synthesizing:
+            self.last_first_audio = time.perf_counter() - self.t_request
+            self.t_request = None
+            log.debug("[tts] first audio %.0fms", self.last_first_audio * 1000)
+            Tracer.record('tts.first_audio', None, time.time() - self.last_first_audio, self.last_first_audio)
+
+    def _on_word(self, name=None, location=None, length=None):
+        # 回调在工作线程里，这里 stop() 是驱动允许的打断方式
+        if self.speaking != self.gen: self.engine.stop()
 
     def _worker(self):
+        # 引擎只初始化一次，放在启动时做，第一次朗读不再承担初始化开销
+        try: self._engine()
+        except Exception as e: log.debug("[tts] init failed: %s", e)
+        self.ready.set()
         while self.running:
+            try: gen, sentence = self.queue.get(timeout=0.05 if self.pending else 0.5)
+            except queue.Empty:
+                # pending 也被 UI 线程的 prefetch 读写，只在锁内操作，合成放到锁外
+                with self.lock: sentence = self.pending.popleft() if self.pending else None
+                if sentence: self._synthesize(sentence)
+                continue
+            if gen != self.gen: continue
             try:
-                text = self.queue.get(timeout=0.5)
-                engine = pyttsx3.init()
-                engine.setProperty('rate', 160)
-                engine.say(text)
+                engine = self._engine()
+                self.speaking = gen
+                clip = self.cache.get(self.cache_key(sentence)) if self.cache else None
+                if clip: self._play(clip, gen)
+                else:
+                    engine.say(sentence)
+                    engine.runAndWait()
+                    # 先直接读出来，空闲时再补进缓存，不拖慢首音
+                    if self.cache:
+                        with self.lock:
+                            if sentence not in self.pending: self.pending.append(sentence)
+            except Exception as e:
+                log.debug("[tts] %s", e)
+                self.engine = None  # 驱动出错后下一句重建
+
+    def _play(self, path, gen):
+        import winsound
+        with wave.open(path, 'rb') as w: duration = w.getnframes() / w.getframerate()
+        self._on_start()
+        winsound.PlaySound(path, winsound.SND_FILENAME | winsound.SND_ASYNC | winsound.SND_NODEFAULT)
+        end = time.perf_counter() + duration
+        while time.perf_counter() < end:
+            if self.gen != gen:
+                winsound.PlaySound(None, 0)  # 停止当前播放
+                return
+            time.sleep(0.02)
+
+    def _synthesize(self, sentence):
+        try:
+            engine = self._engine()
+            key = self.cache_key(sentence)
+            if key in self.cache: return
+            tmp = self.cache.path(key) + ".tmp"
+            gen = self.speaking = self.gen
+            self.synthesizing = True
+            try:
+                engine.save_to_file(sentence, tmp)
                 engine.runAndWait()
-                del engine
-            except: continue
-    def stop(self): self.running = False
+            finally: self.synthesizing = False
+            if self.gen != gen:
+                # 合成途中来了朗读请求，被 started-word 回调打断，留到下次空闲
+                if os.path.exists(tmp): os.remove(tmp)
+                with self.lock: self.pending.appendleft(sentence)
+            elif os.path.exists(tmp) and os.path.getsize(tmp) > 44: self.cache.put(key, tmp)
+        except Exception as e:
+            log.debug("[tts] synth failed: %s", e)
+            self.engine = None
+
+    def stop(self):
+        self.interrupt()
+        self.running = False
+
+def image_mime(data):
+    """根据文件头判断图片 MIME 类型"""
+    if data[:8] == b"\x89PNG\r\n\x1a\n": return "image/png"
+    if data[:3] == b"\xff\xd8\xff": return "image/jpeg"
+    if data[:4] == b"RIFF" and data[8:12] == b"WEBP": return "image/webp"
+    if data[:2] == b"BM": return "image/bmp"
+    return "image/png"
+
+_image_memo = {'b64': OrderedDict(), 'digest': OrderedDict()}
+_image_memo_lock = threading.Lock()
+
+def _memo_by_identity(kind, data, fn, size=16):
+    """按 bytes 对象身份缓存派生值；对话历史里同一张图始终是同一个对象，所以只计算一次"""
+    memo = _image_memo[kind]
+    with _image_memo_lock:
+        hit = memo.get(id(data))
+        if hit and hit[0] is data:
+            memo.move_to_end(id(data))
+            return hit[1]
+    value = fn(data)
+    with _image_memo_lock:
+        memo[id(data)] = (data, value)
+        while len(memo) > size: memo.popitem(last=False)
+    return value
+
+def b64_image(data):
+    return _memo_by_identity('b64', data, lambda d: base64.b64encode(d).decode('ascii'))
+
+def image_digest(data):
+    return _memo_by_identity('digest', data, lambda d: hashlib.sha1(d).hexdigest())
+
+class _Span:
+    __slots__ = ('name', 'trace', 'attrs', 'ts', 't0')
+
+    def __init__(self, name, trace, attrs):
+        self.name, self.trace, self.attrs = name, trace, attrs
+
+    def set(self, **attrs): self.attrs.update(attrs)
+
+    def __enter__(self):
+        self.ts, self.t0 = time.time(), time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type: self.attrs['error'] = str(exc)
+        Tracer.record(self.name, self.trace, self.ts, time.perf_counter() - self.t0, **self.attrs)
+
+class _NoSpan:
+    def set(self, **attrs): pass
+    def __enter__(self): return self
+    def __exit__(self, *exc): pass
+
+_NO_SPAN = _NoSpan()
+
+class Tracer:
+    """分阶段追踪：每次截图一个 trace_id，各阶段写一行 span 到滚动 JSONL，并保留最近耗时用于分位数；关闭时 span() 返回共享的空对象"""
+    WINDOW = 200
+    BACKUPS = 3
+    enabled = False
+    max_bytes = 5 * 1024 * 1024
+    lock = threading.Lock()
+    recent = {}
+    fh = None
+
+    @classmethod
+    def configure(cls, config):
+        with cls.lock:
+            cls.enabled = bool(config.get('trace_enabled'))
+            cls.max_bytes = config.get('trace_max_mb', 5) * 1024 * 1024
+            if not cls.enabled and cls.fh:
+                cls.fh.close()
+                cls.fh = None
+
+    @classmethod
+    def new_trace(cls):
+        return os.urandom(6).hex() if cls.enabled else None
+
+    @classmethod
+    def span(cls, name, trace=None, **attrs):
+        return _Span(name, trace, attrs) if cls.enabled else _NO_SPAN
+
+    @classmethod
+    def record(cls, name, trace, ts, duration, **attrs):
+        if not cls.enabled: return
+        ms = duration * 1000
+        line = json.dumps({'trace': trace, 'span': name, 'ts': round(ts, 3), 'ms': round(ms, 2), **attrs}, ensure_ascii=False)
+        with cls.lock:
+            cls.recent.setdefault(name, deque(maxlen=cls.WINDOW)).append(ms)
+            try: cls._write(line)
+            except OSError: pass
+
+    @classmethod
+    def _write(cls, line):
+        if cls.fh is None: cls.fh = open(TRACE_FILE, "a", encoding='utf-8', buffering=1)
+        if cls.fh.tell() > cls.max_bytes:
+            # traces.jsonl -> traces.jsonl.1 -> ... -> traces.jsonl.N，最旧的丢弃
+            cls.fh.close()
+            for i in range(cls.BACKUPS - 1, 0, -1):
+                if os.path.exists(f"{TRACE_FILE}.{i}"): os.replace(f"{TRACE_FILE}.{i}", f"{TRACE_FILE}.{i + 1}")
+            os.replace(TRACE_FILE, f"{TRACE_FILE}.1")
+            cls.fh = open(TRACE_FILE, "a", encoding='utf-8', buffering=1)
+        cls.fh.write(line + "\n")
+
+    @classmethod
+    def percentiles(cls):
+        """{span: (次数, p50, p90, p99)}，单位 ms，基于最近 WINDOW 次"""
+        with cls.lock: snap = {k: sorted(v) for k, v in cls.recent.items() if v}
+        pct = lambda v, p: v[int(p * (len(v) - 1))]
+        return {k: (len(v), pct(v, 0.5), pct(v, 0.9), pct(v, 0.99)) for k, v in sorted(snap.items())}
 
 class ClipboardPoller(QObject):
     sig_image_found = pyqtSignal(bytes)
+    CF_DIB = 8
+    IMAGE_FORMATS = ("PNG", "JPEG", "BMP", "WEBP")
+
     def __init__(self):
         super().__init__()
         self.old_hash = 0
+        self.last_seq = None
         self.running = False
+        self.trace_id = None
+        self.t_start = 0
+        # 变化检测来源：win32 剪贴板序列号 > Qt dataChanged > 抽样指纹兜底
+        self.seq_source = None
+        self.qt_seq = 0
+        self.qt_png = None
+        if os.name == 'nt':
+            try:
+                import ctypes
+                ctypes.windll.user32.GetClipboardSequenceNumber()
+                self.seq_source = 'win32'
+            except: pass
+        elif sys.platform != 'darwin' and QApplication.instance():
+            QApplication.clipboard().dataChanged.connect(self._on_qt_changed)
+            self.seq_source = 'qt'
 
     def start(self):
         try:
             # 初始快照，避免误触发
-            self._get_current_hash()
+            if self.seq_source: self.last_seq = self._seq()
+            else: self.old_hash = self._get_current_hash()
         except: pass
+        self.trace_id, self.t_start = Tracer.new_trace(), time.time()
         self.running = True
         threading.Thread(target=self._loop, daemon=True).start()
 
+    def _seq(self):
+        if self.seq_source == 'win32':
+            import ctypes
+            return ctypes.windll.user32.GetClipboardSequenceNumber()
+        return self.qt_seq
+
+    def _on_qt_changed(self):
+        # 主线程回调：顺便取出已编码的 PNG，避免轮询线程再解码/编码一次
+        try:
+            md = QApplication.clipboard().mimeData()
+            self.qt_png = bytes(md.data("image/png")) if md and md.hasFormat("image/png") else None
+        except: self.qt_png = None
+        self.qt_seq += 1
+
+    @staticmethod
+    def _fingerprint(img):
+        """抽样指纹：最近邻缩到 32x32 取样，不复制整块像素缓冲"""
+        return hash((img.size, img.mode, img.resize((32, 32), Image.NEAREST).tobytes()))
+
     def _get_current_hash(self):
         """获取当前剪贴板内容的哈希（兼容图片和文件列表）"""
         try:
@@ -191,82 +915,1370 @@ class ClipboardPoller(QObject):
             if isinstance(content, list): # 文件列表
                 return hash(tuple(content)) # 对文件名列表做哈希
             if isinstance(content, Image.Image): # 图片对象
-                return hash(content.tobytes())
+                return self._fingerprint(content)
             return 0
         except: return 0
 
+    def _read_encoded(self):
+        """直接读取剪贴板中的图片数据：有 PNG 原样返回，只有 DIB 时转成 PNG；读不到返回 None"""
+        if self.seq_source == 'qt':
+            data, self.qt_png = self.qt_png, None
+            return data
+        if self.seq_source != 'win32': return None
+        import ctypes
+        from ctypes import wintypes
+        u32, k32 = ctypes.windll.user32, ctypes.windll.kernel32
+        u32.GetClipboardData.restype = wintypes.HANDLE
+        k32.GlobalLock.argtypes = k32.GlobalUnlock.argtypes = k32.GlobalSize.argtypes = [wintypes.HGLOBAL]
+        k32.GlobalLock.restype = ctypes.c_void_p
+        k32.GlobalSize.restype = ctypes.c_size_t
+        if not u32.OpenClipboard(None): return None
+        try:
+            for fmt in (u32.RegisterClipboardFormatW("PNG"), self.CF_DIB):
+                if not u32.IsClipboardFormatAvailable(fmt): continue
+                h = u32.GetClipboardData(fmt)
+                p = k32.GlobalLock(h) if h else None
+                if not p: continue
+                try: data = ctypes.string_at(p, k32.GlobalSize(h))
+                finally: k32.GlobalUnlock(h)
+                if fmt != self.CF_DIB: return data
+                break
+            else: return None
+        finally: u32.CloseClipboard()
+        # DIB 是未压缩位图，模型接口也不收 BMP：关闭剪贴板后编码成 PNG 再发
+        with Tracer.span('clipboard.encode', self.trace_id, source='dib'), Image.open(io.BytesIO(self._dib_to_bmp(data))) as img:
+            b = io.BytesIO()
+            img.save(b, "PNG")
+            return b.getvalue()
+
+    @staticmethod
+    def _dib_to_bmp(dib):
+        """CF_DIB 只缺一个 14 字节的 BITMAPFILEHEADER，补上即为合法 BMP 文件"""
+        hsize = int.from_bytes(dib[0:4], 'little')
+        bits = int.from_bytes(dib[14:16], 'little')
+        compression = int.from_bytes(dib[16:20], 'little')
+        colors = int.from_bytes(dib[32:36], 'little') or (1 << bits if bits <= 8 else 0)
+        offset = 14 + hsize + (12 if hsize == 40 and compression == 3 else 0) + colors * 4
+        return b"BM" + (14 + len(dib)).to_bytes(4, 'little') + b"\0\0\0\0" + offset.to_bytes(4, 'little') + dib
+
+    def _emit(self, data):
+        Tracer.record('clipboard.wait', self.trace_id, self.t_start, time.time() - self.t_start, source=self.seq_source or 'hash', bytes=len(data))
+        self.sig_image_found.emit(data)
+        ScreenshotCleaner.clean()
+        self.running = False
+
+    def _handle_content(self, content, curr_hash=None):
+        # 情况1：剪贴板里是图片对象
+        if isinstance(content, Image.Image):
+            b = io.BytesIO()
+            with Tracer.span('clipboard.encode', self.trace_id, size=f"{content.width}x{content.height}"): content.save(b, "PNG")
+            self._emit(b.getvalue())
+            return True
+
+        # 情况2：剪贴板里是文件路径（Windows 截图自动保存模式）
+        if isinstance(content, list) and content and os.path.isfile(content[0]):
+            # 尝试读取第一个文件是否为图片
+            try:
+                with Image.open(content[0]) as img:
+                    if curr_hash is not None: self.old_hash = curr_hash
+                    if img.format in self.IMAGE_FORMATS:
+                        # 已经是常见编码，直接发原始文件字节
+                        with open(content[0], 'rb') as f: data = f.read()
+                    else:
+                        b = io.BytesIO()
+                        img.save(b, "PNG")
+                        data = b.getvalue()
+                # 注意：这里不自动清理文件，因为它是用户可能手动复制的文件
+                # 但如果是截图工具生成的，ScreenshotCleaner 会根据时间戳在后台处理
+                self._emit(data)
+                return True
+            except: pass # 不是图片文件，忽略
+        return False
+
     def _loop(self):
         t0 = time.time()
         # 轮询 60秒，足够用户操作截图
         while self.running and (time.time() - t0 < 60):
             try:
-                content = ImageGrab.grabclipboard()
-                
-                # 情况1：剪贴板里是图片对象
-                if isinstance(content, Image.Image):
-                    curr_hash = hash(content.tobytes())
-                    if curr_hash != self.old_hash:
-                        self.old_hash = curr_hash
-                        b = io.BytesIO()
-                        content.save(b, "PNG")
-                        self.sig_image_found.emit(b.getvalue())
-                        ScreenshotCleaner.clean()
-                        self.running = False
-                        return
-
-                # 情况2：剪贴板里是文件路径（Windows 截图自动保存模式）
-                elif isinstance(content, list) and content:
-                    curr_hash = hash(tuple(content))
-                    if curr_hash != self.old_hash:
-                        # 尝试读取第一个文件是否为图片
-                        if os.path.isfile(content[0]):
-                            try:
-                                with Image.open(content[0]) as img:
-                                    self.old_hash = curr_hash
-                                    b = io.BytesIO()
-                                    img.save(b, "PNG")
-                                    self.sig_image_found.emit(b.getvalue())
-                                    # 注意：这里不自动清理文件，因为它是用户可能手动复制的文件
-                                    # 但如果是截图工具生成的，ScreenshotCleaner 会根据时间戳在后台处理
-                                    ScreenshotCleaner.clean() 
-                                    self.running = False
-                                    return
-                            except: pass # 不是图片文件，忽略
+                if self.seq_source:
+                    # 序列号未变化时什么都不读，每次 tick 只是一次系统调用
+                    seq = self._seq()
+                    if seq != self.last_seq:
+                        self.last_seq = seq
+                        with Tracer.span('clipboard.read', self.trace_id, source=self.seq_source): data = self._read_encoded()
+                        if data:
+                            self._emit(data)
+                            return
+                        if self._handle_content(ImageGrab.grabclipboard()): return
+                else:
+                    content = ImageGrab.grabclipboard()
+                    if isinstance(content, Image.Image):
+                        curr_hash = self._fingerprint(content)
+                        if curr_hash != self.old_hash:
+                            self.old_hash = curr_hash
+                            if self._handle_content(content): return
+                    elif isinstance(content, list) and content:
+                        curr_hash = hash(tuple(content))
+                        if curr_hash != self.old_hash and self._handle_content(content, curr_hash): return
             except: pass
             time.sleep(0.2)
 
+class ImagePreprocessor:
+    """发送给模型前的图片预处理：裁掉纯色边距 -> 按模型限制长边 -> 可选灰度 -> 选体积最小的编码"""
+    def __init__(self, config):
+        self.enabled = config.get('preprocess_enabled', True)
+        self.trim = config.get('preprocess_trim', True)
+        self.grayscale = config.get('preprocess_grayscale', False)
+        self.max_edge = config.get('preprocess_max_edge') or {}
+        self.formats = config.get('preprocess_formats') or ["PNG"]
+        self.quality = config.get('preprocess_quality', 90)
+
+    def max_edge_for(self, model):
+        return self.max_edge.get(model, self.max_edge.get('default', 0))
+
+    def process(self, data, model):
+        """返回 (处理后的字节, 报告)，报告含各阶段耗时 (ms) 与前后字节数"""
+        report = {'model': model, 'bytes_in': len(data), 'bytes_out': len(data), 'stages': []}
+        if not self.enabled: return data, report
+        t = time.perf_counter()
+        def stage(name):
+            nonlocal t
+            now = time.perf_counter()
+            report['stages'].append((name, (now - t) * 1000))
+            t = now
+        try:
+            img = Image.open(io.BytesIO(data))
+            img.load()
+            size0 = img.size
+            stage('decode')
+            if self.trim:
+                img = self.trim_margins(img)
+                stage('trim')
+            cap = self.max_edge_for(model)
+            if cap and max(img.size) > cap:
+                img.thumbnail((cap, cap), Image.LANCZOS)
+                stage('resize')
+            if self.grayscale:
+                img = img.convert('L')
+                stage('gray')
+            out = self.encode(img)
+            stage('encode')
+        except: return data, report
+        # 尺寸没变且重新编码反而更大时，保留原始字节
+        if img.size == size0 and not self.grayscale and len(out) >= len(data): out = data
+        report['bytes_out'] = len(out)
+        return out, report
+
+    @staticmethod
+    def trim_margins(img, tolerance=12, pad=4):
+        rgb = img.convert('RGB')
+        bg = Image.new('RGB', rgb.size, rgb.getpixel((0, 0)))
+        mask = ImageChops.difference(rgb, bg).convert('L').point(lambda v: 255 if v > tolerance else 0)
+        box = mask.getbbox()
+        if not box: return img
+        l, t, r, b = box
+        box = (max(0, l - pad), max(0, t - pad), min(img.width, r + pad), min(img.height, b + pad))
+        return img.crop(box) if box != (0, 0, img.width, img.height) else img
+
+    def encode(self, img):
+        best = None
+        for fmt in self.formats:
+            try:
+                b = io.BytesIO()
+                if fmt == "PNG":
+                    img.save(b, "PNG")
+                else:
+                    # JPEG 不支持透明通道，WebP 统一按有损处理
+                    im = img if img.mode in ('RGB', 'L') else img.convert('RGB')
+                    im.save(b, fmt, quality=self.quality)
+                if best is None or b.tell() < len(best): best = b.getvalue()
+            except: pass
+        if best is None:
+            b = io.BytesIO()
+            img.save(b, "PNG")
+            best = b.getvalue()
+        return best
+
+    @staticmethod
+    def format_report(report):
+        saved = report['bytes_in'] - report['bytes_out']
+        pct = saved * 100 / report['bytes_in'] if report['bytes_in'] else 0
+        stages = " ".join(f"{n}={ms:.1f}ms" for n, ms in report['stages'])
+        return f"[preprocess] {report['model']}: {report['bytes_in']} -> {report['bytes_out']} bytes (saved {saved}, {pct:.0f}%) {stages}"
+
+class LocalOCR:
+    """可选的本地 OCR 前置：调用 tesseract 可执行文件取逐词置信度 (TSV)，置信度足够高时只把文字交给文本模型，省掉视觉推理"""
+    WIN_DEFAULT = r"C:\Program Files\Tesseract-OCR\tesseract.exe"
+    lock = threading.Lock()
+    paths = {'ocr': deque(maxlen=200), 'vision': deque(maxlen=200), 'tm': deque(maxlen=200)}
+
+    def __init__(self, config, cmd):
+        self.cmd = cmd
+        self.lang = config.get('ocr_lang', 'eng')
+        self.psm = config.get('ocr_psm', 6)
+        self.min_conf = config.get('ocr_min_conf', 85)
+        self.min_word_conf = config.get('ocr_min_word_conf', 50)
+        self.max_pixels = config.get('ocr_max_pixels', 2000000)
+        self.timeout = config.get('ocr_timeout', 5)
+
+    @classmethod
+    def from_config(cls, config):
+        """未启用或找不到 tesseract 时返回 None"""
+        if not config.get('ocr_enabled'): return None
+        cmd = config.get('ocr_tesseract') or shutil.which('tesseract')
+        if not cmd and os.name == 'nt' and os.path.exists(cls.WIN_DEFAULT): cmd = cls.WIN_DEFAULT
+        return cls(config, cmd) if cmd else None
+
+    def read(self, data):
+        """返回 (文本, 按字符加权的平均置信度, 最低单词置信度)；大图、无文字或出错时返回 None"""
+        img = Image.open(io.BytesIO(data))
+        if img.width * img.height > self.max_pixels: return None
+        img = img.convert('L')
+        # tesseract 对字高 20px 以下的文字识别很差，小截图先放大
+        if img.height < 64: img = img.resize((img.width * 2, img.height * 2), Image.LANCZOS)
+        buf = io.BytesIO()
+        img.save(buf, "PNG", compress_level=1)
+        # 小图上多线程的调度开销比识别本身还大
+        env = {**os.environ, 'OMP_THREAD_LIMIT': '1'}
+        out = subprocess.run([self.cmd, "stdin", "stdout", "-l", self.lang, "--psm", str(self.psm), "tsv"], input=buf.getvalue(), capture_output=True,
+                             timeout=self.timeout, env=env, creationflags=subprocess.CREATE_NO_WINDOW if os.name == 'nt' else 0)
+        if out.returncode != 0: return None
+        lines, total, weight, worst = {}, 0.0, 0, 100.0
+        for row in out.stdout.decode('utf-8', 'replace').splitlines()[1:]:
+            f = row.split('\t')
+            if len(f) < 12 or f[0] != '5': continue
+            word, conf = f[11].strip(), float(f[10])
+            if not word or conf < 0: continue
+            lines.setdefault((f[2], f[3], f[4]), []).append(word)
+            total += conf * len(word)
+            weight += len(word)
+            worst = min(worst, conf)
+        if not weight: return None
+        return "\n".join(self.join_words(w) for w in lines.values()), total / weight, worst
+
+    def confident(self, conf, worst):
+        return conf >= self.min_conf and worst >= self.min_word_conf
+
+    @staticmethod
+    def join_words(words):
+        # tesseract 把中日韩文字逐字切成“单词”，相邻的 CJK 字符之间不加空格
+        out = words[0]
+        for w in words[1:]:
+            out += w if ord(out[-1]) >= 0x2E80 and ord(w[0]) >= 0x2E80 else " " + w
+        return out
+
+    @classmethod
+    def record(cls, path, seconds):
+        with cls.lock: cls.paths[path].append(seconds)
+
+    @classmethod
+    def summary(cls):
+        """{'ocr'/'vision'/'tm': (次数, p50 秒)}"""
+        with cls.lock: snap = {k: sorted(v) for k, v in cls.paths.items()}
+        return {k: (len(v), v[len(v) // 2] if v else None) for k, v in snap.items()}
+
+class ImageTiler:
+    """大图分块：在缩小的墨迹掩码上按空白行/列投影递归切分 (XY-cut)；没有空白可切时在墨迹最少处硬切并留重叠。块按阅读顺序返回"""
+    def __init__(self, config):
+        self.enabled = config.get('tile_enabled', True)
+        self.threshold = config.get('tile_threshold', 2400)
+        self.max_edge = config.get('tile_max_edge', 1568)
+        self.overlap = config.get('tile_overlap', 48)
+        self.max_count = config.get('tile_max_count', 16)
+        self.min_gap = 12  # 原图像素，小于此的空白视为字间距/行距
+
+    def tiles(self, data):
+        """返回按阅读顺序的 [(box, 裁出的 Image)]；不需要或不适合分块时返回 []。编码留给各块的工作线程并行做"""
+        if not self.enabled: return []
+        try:
+            img = Image.open(io.BytesIO(data))
+            if max(img.size) <= self.threshold: return []
+            img.load()
+        except: return []
+        boxes = self.boxes(img)
+        if len(boxes) < 2 or len(boxes) > self.max_count: return []
+        return [(box, img.crop(box)) for box in boxes]
+
+    @staticmethod
+    def to_png(tile):
+        b = io.BytesIO()
+        tile.save(b, "PNG", compress_level=1)  # 预处理阶段还会按配置重新编码
+        return b.getvalue()
+
+    @staticmethod
+    def ink_mask(img, long_edge=1024):
+        """返回 (缩小后的墨迹掩码, 缩放倍数)；背景色取左上角像素"""
+        scale = max(1, max(img.size) // long_edge)
+        gray = img.convert('L')
+        if scale > 1: gray = gray.reduce(scale)
+        bg = gray.getpixel((0, 0))
+        return gray.point(lambda v: 255 if abs(v - bg) > 24 else 0), scale
+
+    def boxes(self, img):
+        mask, scale = self.ink_mask(img)
+        limit, gap, ov = self.max_edge / scale, max(1, self.min_gap // scale), self.overlap // scale
+        out = []
+        self._cut(mask, (0, 0) + mask.size, limit, gap, ov, out)
+        return [(max(0, l * scale), max(0, t * scale), min(img.width, r * scale), min(img.height, b * scale)) for l, t, r, b in out]
+
+    @staticmethod
+    def _profile(region, axis):
+        """axis=1: 每行平均墨迹；axis=0: 每列平均墨迹"""
+        w, h = region.size
+        return list(region.resize((1, h) if axis else (w, 1), Image.BOX).getdata())
+
+    @staticmethod
+    def _gaps(profile, min_len):
+        """空白段 [(起, 止)]，不含两端（两端已被墨迹包围盒裁掉）"""
+        gaps, start = [], None
+        for i, v in enumerate(profile):
+            if v <= 1:
+                if start is None: start = i
+            elif start is not None:
+                if i - start >= min_len and start > 0: gaps.append((start, i))
+                start = None
+        return gaps
+
+    def _cut(self, mask, box, limit, gap, ov, out):
+        ink = mask.crop(box).getbbox()
+        if not ink: return
+        l, t = box[0] + ink[0], box[1] + ink[1]
+        r, b = box[0] + ink[2], box[1] + ink[3]
+        w, h = r - l, b - t
+        if w <= limit and h <= limit:
+            out.append((l, t, r, b))
+            return
+        region = mask.crop((l, t, r, b))
+        # 在超限的方向上找空白，选切完后较大一块最小的位置，避免切出很多碎块
+        best = None
+        for axis, size in ((1, h), (0, w)):
+            if size <= limit: continue
+            for g0, g1 in self._gaps(self._profile(region, axis), gap):
+                c = (g0 + g1) // 2
+                score = max(c, size - c)
+                if best is None or score < best[0]: best = (score, axis, c)
+        if best:
+            _, axis, c = best
+            first, second = ((l, t, r, t + c), (l, t + c, r, b)) if axis else ((l, t, l + c, b), (l + c, t, r, b))
+            self._cut(mask, first, limit, gap, ov, out)
+            self._cut(mask, second, limit, gap, ov, out)
+            return
+        # 没有空白：在允许范围后 40% 里找墨迹最少的行/列硬切，两侧各留 ov 的重叠
+        axis = 1 if h > limit else 0
+        prof = self._profile(region, axis)
+        lo, hi = int(limit * 0.6), int(limit) - ov
+        c = min(range(lo, max(lo + 1, hi)), key=lambda i: prof[i])
+        if axis:
+            self._cut(mask, (l, t, r, t + c + ov), limit, gap, ov, out)
+            self._cut(mask, (l, t + c - ov, r, b), limit, gap, ov, out)
+        else:
+            self._cut(mask, (l, t, l + c + ov, b), limit, gap, ov, out)
+            self._cut(mask, (l + c - ov, t, r, b), limit, gap, ov, out)
+
+    @staticmethod
+    def merge(parts):
+        """parts 为按阅读顺序的 (raw, trans)；相邻块重叠处重复的行只保留一次"""
+        raws, transs = [], []
+        for raw, trans in parts:
+            if raw != "...": ImageTiler._append_lines(raws, raw)
+            ImageTiler._append_lines(transs, trans)
+        return "\n".join(raws), "\n".join(transs)
+
+    @staticmethod
+    def _append_lines(acc, text):
+        norm = lambda s: re.sub(r'\W+', '', s).lower()
+        lines = [x for x in text.splitlines() if x.strip()]
+        drop = 0
+        for n in range(min(len(acc), len(lines), 3), 0, -1):
+            if [norm(x) for x in acc[-n:]] == [norm(x) for x in lines[:n]]:
+                drop = n
+                break
+        acc.extend(lines[drop:])
+
+_conn_timing = threading.local()
+
+class CancelToken:
+    """取消令牌：cancel() 时依次调用注册的回调（关闭连接等）"""
+    def __init__(self):
+        self.event = threading.Event()
+        self.callbacks = []
+        self.lock = threading.Lock()
+
+    def on_cancel(self, fn):
+        with self.lock:
+            if not self.event.is_set():
+                self.callbacks.append(fn)
+                return
+        try: fn()
+        except: pass
+
+    def cancel(self):
+        with self.lock:
+            if self.event.is_set(): return
+            self.event.set()
+            callbacks, self.callbacks = self.callbacks, []
+        for fn in callbacks:
+            try: fn()
+            except: pass
+
+    def off_cancel(self, fn):
+        with self.lock:
+            if fn in self.callbacks: self.callbacks.remove(fn)
+
+    def is_cancelled(self): return self.event.is_set()
+    def wait(self, timeout=None): return self.event.wait(timeout)
+
+    def child(self):
+        """父令牌取消时一并取消；子令牌单独取消不影响父令牌"""
+        token = CancelToken()
+        self.on_cancel(token.cancel)
+        return token
+
+class _TimedConnMixin:
+    def connect(self):
+        t0 = time.perf_counter()
+        try: super().connect()  # HTTPS 时含 TLS 握手
+        finally: _conn_timing.connect = time.perf_counter() - t0
+
+    def request(self, *args, **kwargs):
+        token = getattr(_conn_timing, 'cancel', None)
+        if token:
+            token.on_cancel(self.abort)
+            _conn_timing.hooks.append(self.abort)
+        return super().request(*args, **kwargs)
+
+    def abort(self):
+        # 从其他线程打断阻塞中的 recv，连接随后被连接池丢弃
+        try: self.sock.shutdown(socket.SHUT_RDWR)
+        except: pass
+
+def _timed_adapter(pool_size):
+    """requests/urllib3 导入较慢，第一次建 HttpClient 时才组装带计时的连接池"""
+    from requests.adapters import HTTPAdapter
+    from urllib3.connection import HTTPConnection, HTTPSConnection
+    from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+
+    class _TimedHTTPConnection(_TimedConnMixin, HTTPConnection): pass
+    class _TimedHTTPSConnection(_TimedConnMixin, HTTPSConnection): pass
+
+    class _TimedHTTPPool(HTTPConnectionPool): ConnectionCls = _TimedHTTPConnection
+    class _TimedHTTPSPool(HTTPSConnectionPool): ConnectionCls = _TimedHTTPSConnection
+
+    class _TimedAdapter(HTTPAdapter):
+        def init_poolmanager(self, *args, **kwargs):
+            super().init_poolmanager(*args, **kwargs)
+            self.poolmanager.pool_classes_by_scheme = {'http': _TimedHTTPPool, 'https': _TimedHTTPSPool}
+
+    return _TimedAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+
+class HttpClient:
+    """长连接 HTTP 客户端：连接池 + keep-alive，分阶段超时，429/5xx 有界重试（带抖动）"""
+    RETRY_STATUS = (429, 500, 502, 503, 504)
+    IDEMPOTENT = ("GET", "HEAD", "OPTIONS", "PUT", "DELETE")
+    _inst = None
+    _inst_lock = threading.Lock()
+
+    def __init__(self, connect_timeout=5, first_byte_timeout=60, idle_timeout=30, retries=2, pool_size=4, backoff=0.5):
+        self.connect_timeout = connect_timeout
+        self.first_byte_timeout = first_byte_timeout
+        self.idle_timeout = idle_timeout
+        self.retries = retries
+        self.backoff = backoff
+        self.session = requests.Session()
+        adapter = _timed_adapter(pool_size)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+    @classmethod
+    def shared(cls):
+        with cls._inst_lock:
+            if cls._inst is None:
+                cfg = ConfigManager.load()
+                cls._inst = cls(cfg['http_connect_timeout'], cfg['http_first_byte_timeout'], cfg['http_idle_timeout'],
+                                cfg['http_retries'], cfg['http_pool_size'])
+            return cls._inst
+
+    def post(self, url, stream=False, **kwargs):
+        return self.request("POST", url, stream=stream, **kwargs)
+
+    def request(self, method, url, stream=False, cancel=None, **kwargs):
+        """响应对象上附带 resp.timing = {connect, ttfb, total (ms), attempts}；cancel 为 CancelToken 时可被中途打断"""
+        _conn_timing.cancel, _conn_timing.hooks = cancel, []
+        hooks = _conn_timing.hooks
+        try: resp = self._request(method, url, stream, cancel, **kwargs)
+        except:
+            self._unhook(cancel, hooks)
+            raise
+        finally: _conn_timing.cancel = _conn_timing.hooks = None
+        # 连接归还连接池后不能再被这个令牌打断
+        if stream: resp.cancel_hooks = (cancel, hooks)
+        else: self._unhook(cancel, hooks)
+        return resp
+
+    @staticmethod
+    def _unhook(cancel, hooks):
+        if cancel:
+            for fn in hooks: cancel.off_cancel(fn)
+
+    def _request(self, method, url, stream, cancel, **kwargs):
+        t_start = time.perf_counter()
+        for attempt in range(self.retries + 1):
+            if cancel and cancel.is_cancelled(): raise requests.ConnectionError("cancelled")
+            _conn_timing.connect = 0.0  # 复用连接时保持为 0
+            t0 = time.perf_counter()
+            try:
+                resp = self.session.request(method, url, stream=True, timeout=(self.connect_timeout, self.first_byte_timeout), **kwargs)
+            except requests.ConnectionError as e:
+                if attempt >= self.retries or (cancel and cancel.is_cancelled()): raise
+                # 非幂等请求（付费的 chat 补全）只在请求确实没发出去时重试，避免重复计费
+                if method.upper() not in self.IDEMPOTENT and not self._not_sent(e): raise
+                time.sleep(self._delay(attempt))
+                continue
+            if resp.status_code in self.RETRY_STATUS and attempt < self.retries:
+                delay = self._delay(attempt, resp.headers.get("Retry-After"))
+                resp.close()
+                time.sleep(delay)
+                continue
+            break
+        resp.timing = {'connect': _conn_timing.connect * 1000, 'ttfb': (time.perf_counter() - t0) * 1000, 'total': None, 'attempts': attempt + 1}
+        # 首字节已到，之后按流式空闲超时计算
+        try: resp.raw.connection.sock.settimeout(self.idle_timeout)
+        except: pass
+        if not stream:
+            resp.content
+            resp.timing['total'] = (time.perf_counter() - t_start) * 1000
+        else:
+            resp.timing['start'] = t_start
+        return resp
+
+    @staticmethod
+    def _not_sent(error):
+        """连接超时或没连上：服务器不可能收到请求体"""
+        if isinstance(error, requests.ConnectTimeout): return True
+        import urllib3
+        reason = error.args[0] if error.args else None
+        reason = getattr(reason, 'reason', reason)  # MaxRetryError 包着真正的原因
+        return isinstance(reason, (urllib3.exceptions.NewConnectionError, urllib3.exceptions.ConnectTimeoutError))
+
+    def _delay(self, attempt, retry_after=None):
+        try: return min(float(retry_after), 30.0)
+        except (TypeError, ValueError): return random.uniform(0, self.backoff * (2 ** attempt))
+
+    @staticmethod
+    def iter_lines(resp):
+        """流式读取，读完后补上 total 耗时"""
+        try:
+            for line in resp.iter_lines(): yield line
+        finally:
+            HttpClient._unhook(*getattr(resp, 'cancel_hooks', (None, ())))
+            if getattr(resp, 'timing', None) and 'start' in resp.timing:
+                resp.timing['total'] = (time.perf_counter() - resp.timing['start']) * 1000
+
+    @staticmethod
+    def format_timing(timing):
+        total = f"{timing['total']:.0f}ms" if timing.get('total') is not None else "-"
+        return f"[http] connect={timing['connect']:.0f}ms ttfb={timing['ttfb']:.0f}ms total={total} attempts={timing['attempts']}"
+
 class OnlineClient:
     @staticmethod
-    def chat(config, messages, stream=False):
+    def chat(config, messages, stream=False, cancel=None, trace=None):
         headers = {"Authorization": f"Bearer {config['api_key']}", "Content-Type": "application/json"}
         processed = []
-        for msg in messages:
-            content = msg['content']
-            if 'images' in msg and msg['images']:
-                b64 = base64.b64encode(msg['images'][0]).decode('utf-8')
-                processed.append({"role": msg['role'], "content": [{"type": "text", "text": content}, {"type": "image_url", "image_url": {"url": f"data:image/png;base64,{b64}"}}]})
-            else:
-                processed.append({"role": msg['role'], "content": content})
+        with Tracer.span("online.encode", trace, messages=len(messages)):
+            for msg in messages:
+                content = msg['content']
+                if 'images' in msg and msg['images']:
+                    b64 = b64_image(msg['images'][0])
+                    processed.append({"role": msg['role'], "content": [{"type": "text", "text": content}, {"type": "image_url", "image_url": {"url": f"data:{image_mime(msg['images'][0])};base64,{b64}"}}]})
+                else:
+                    processed.append({"role": msg['role'], "content": content})
         
         data = {"model": config['online_model'], "messages": processed, "stream": stream}
         url = f"{config['base_url'].rstrip('/')}/chat/completions"
-        return requests.post(url, headers=headers, json=data, stream=stream, timeout=30)
+        ts = time.time()
+        resp = HttpClient.shared().post(url, headers=headers, json=data, stream=stream, cancel=cancel)
+        t = resp.timing
+        Tracer.record("online.ttfb", trace, ts, t['ttfb'] / 1000, connect_ms=round(t['connect'], 1), attempts=t['attempts'], status=resp.status_code)
+        return resp
+
+    @staticmethod
+    def iter_content(resp):
+        """逐个产出 SSE 流中的增量文本"""
+        for line in HttpClient.iter_lines(resp):
+            if line:
+                decoded = line.decode('utf-8').replace('data: ', '')
+                if decoded != '[DONE]':
+                    try:
+                        chunk = json.loads(decoded)['choices'][0]['delta'].get('content', '')
+                        if chunk: yield chunk
+                    except: pass
+
+class EngineHealth:
+    """引擎健康度：按 引擎:模型 统计滚动成功率与延迟分位数；连续失败后熔断，到期后在后台半开探测"""
+    WINDOW = 50
+    MAX_OPEN = 600
+    lock = threading.RLock()
+    stats = {}
+    dirty = 0
+    _loaded = False
+
+    @classmethod
+    def _entry(cls, engine, model):
+        if not cls._loaded: cls.load()
+        return cls.stats.setdefault(f"{engine}:{model}", {'results': deque(maxlen=cls.WINDOW), 'fails': 0, 'state': 'closed', 'opened_at': 0, 'open_for': 0})
+
+    @classmethod
+    def allow(cls, engine, model, config):
+        """熔断打开时直接返回 False；冷却期已过则转为半开并在后台探测"""
+        with cls.lock:
+            e = cls._entry(engine, model)
+            if e['state'] == 'closed': return True
+            if e['state'] == 'open' and time.time() - e['opened_at'] >= e['open_for']:
+                e['state'] = 'half_open'
+                threading.Thread(target=cls._probe, args=(engine, model, dict(config)), daemon=True).start()
+            return False
+
+    @classmethod
+    def record(cls, engine, model, ok, latency, config=None):
+        cfg = config or ConfigManager.DEFAULT
+        with cls.lock:
+            e = cls._entry(engine, model)
+            e['results'].append((1 if ok else 0, round(latency, 3)))
+            if ok:
+                e.update(fails=0, state='closed', open_for=0)
+            else:
+                e['fails'] += 1
+                if e['state'] == 'half_open' or e['fails'] >= cfg['circuit_fail_threshold']:
+                    # 再次熔断时冷却时间翻倍
+                    e.update(state='open', opened_at=time.time(), open_for=min(cls.MAX_OPEN, max(cfg['circuit_open_seconds'], e['open_for'] * 2)))
+            cls.dirty += 1
+            flush = cls.dirty >= 10 or not ok
+        if flush: cls.save()
+
+    @classmethod
+    def call(cls, engine, model, fn, cancel=None, config=None):
+        """执行 fn 并记录结果；被主动取消的请求不计为失败"""
+        t0 = time.perf_counter()
+        try: result = fn()
+        except Exception as e:
+            if not (cancel and cancel.is_cancelled()):
+                cls.record(engine, model, False, time.perf_counter() - t0, config)
+                log.debug("[%s] %s failed: %s", engine, model, e)
+            raise
+        cls.record(engine, model, True, time.perf_counter() - t0, config)
+        return result
+
+    @classmethod
+    def _probe(cls, engine, model, config):
+        t0 = time.perf_counter()
+        try:
+            # 探测也经调度器排队，不和正在进行的翻译抢并发
+            with RequestScheduler.slot(engine, RequestScheduler.BATCH):
+                if engine == 'online':
+                    resp = HttpClient.shared().request("GET", f"{config['base_url'].rstrip('/')}/models", headers={"Authorization": f"Bearer {config['api_key']}"})
+                    ok = resp.status_code == 200
+                else:
+                    ok = OllamaService.instance().probe()
+        except: ok = False
+        cls.record(engine, model, ok, time.perf_counter() - t0, config)
+
+    @classmethod
+    def summary(cls, engine, model):
+        """只读，不为没用过的引擎建条目"""
+        with cls.lock:
+            if not cls._loaded: cls.load()
+            e = cls.stats.get(f"{engine}:{model}")
+            results = list(e['results']) if e else []
+            state = e['state'] if e else 'closed'
+        lat = sorted(l for ok, l in results if ok)
+        pct = lambda p: lat[int(p * (len(lat) - 1))] if lat else None
+        rate = sum(ok for ok, _ in results) / len(results) if results else None
+        return {'state': state, 'n': len(results), 'success_rate': rate, 'p50': pct(0.5), 'p90': pct(0.9), 'p99': pct(0.99)}
+
+    @classmethod
+    def entries(cls):
+        with cls.lock:
+            if not cls._loaded: cls.load()
+            return [tuple(k.split(":", 1)) for k in cls.stats]
+
+    @classmethod
+    def load(cls):
+        with cls.lock:
+            cls._loaded = True
+            try:
+                with open(ENGINE_STATS_FILE, "r", encoding='utf-8') as f: data = json.load(f)
+                for k, e in data.items():
+                    e['results'] = deque((tuple(r) for r in e['results']), maxlen=cls.WINDOW)
+                    if e['state'] == 'half_open': e['state'] = 'open'
+                    cls.stats[k] = e
+            except: pass
+
+    @classmethod
+    def save(cls):
+        with cls.lock:
+            if not cls._loaded: return
+            data = {k: {**e, 'results': list(e['results'])} for k, e in cls.stats.items()}
+            cls.dirty = 0
+        try:
+            with open(ENGINE_STATS_FILE, "w", encoding='utf-8') as f: json.dump(data, f)
+        except: pass
+
+atexit.register(EngineHealth.save)
+
+class DispatchStats:
+    """记录各引擎的胜出次数与耗时，对冲延迟按在线引擎的 p90 耗时自适应"""
+    lock = threading.Lock()
+    wins = {}
+    latencies = {}
+    censored = {}  # 输掉后被取消的请求只知道耗时下界，单独存放，不参与 p90
+
+    @classmethod
+    def record(cls, engine, latency, won=False, censored=False):
+        with cls.lock:
+            (cls.censored if censored else cls.latencies).setdefault(engine, deque(maxlen=50)).append(latency)
+            if won: cls.wins[engine] = cls.wins.get(engine, 0) + 1
+
+    @classmethod
+    def hedge_delay(cls, config):
+        with cls.lock: lat = sorted(cls.latencies.get('online', ()))
+        if len(lat) < 5: return config.get('hedge_delay', 3.0)
+        p90 = lat[int(0.9 * (len(lat) - 1))]
+        return max(config.get('hedge_min_delay', 0.5), min(config.get('hedge_max_delay', 10.0), p90 * 1.1))
+
+class _Slot:
+    def __init__(self, engine, priority, cancel, trace):
+        self.engine, self.priority, self.cancel, self.trace = engine, priority, cancel, trace
+
+    def __enter__(self):
+        RequestScheduler.acquire(self.engine, self.priority, self.cancel, self.trace)
+        return self
+
+    def __exit__(self, *exc):
+        RequestScheduler.release(self.engine)
+
+class RequestScheduler:
+    """所有引擎请求的统一入口：按引擎限制并发；排队时 交互翻译 > 追问 > 批量，同级先到先得。
+    排队中的请求取消后立即出队；记录各引擎的运行/排队数和各优先级的等待时间"""
+    INTERACTIVE, CHAT, BATCH = 0, 1, 2
+    NAMES = {INTERACTIVE: 'interactive', CHAT: 'chat', BATCH: 'batch'}
+    WINDOW = 200
+    cond = threading.Condition()
+    limits = {'online': 4, 'local': 2}
+    running = {}
+    waiting = {}  # engine -> 堆 [(优先级, 序号)]
+    seq = 0
+    waits = {}    # 优先级 -> 最近的等待秒数
+    peak = {}     # engine -> 最大排队数
+
+    @classmethod
+    def configure(cls, config):
+        with cls.cond:
+            cls.limits = {**cls.limits, **(config.get('sched_limits') or {})}
+            cls.cond.notify_all()
+
+    @classmethod
+    def slot(cls, engine, priority=INTERACTIVE, cancel=None, trace=None):
+        return _Slot(engine, priority, cancel, trace)
+
+    @classmethod
+    def _wake(cls):
+        with cls.cond: cls.cond.notify_all()
+
+    @classmethod
+    def acquire(cls, engine, priority, cancel=None, trace=None):
+        ts, t0 = time.time(), time.perf_counter()
+        with cls.cond:
+            ticket = (priority, cls.seq)
+            cls.seq += 1
+            q = cls.waiting.setdefault(engine, [])
+            heapq.heappush(q, ticket)
+            cls.peak[engine] = max(cls.peak.get(engine, 0), len(q))
+            if cancel: cancel.on_cancel(cls._wake)
+            try:
+                while True:
+                    if cancel and cancel.is_cancelled(): raise RuntimeError("cancelled")
+                    if q[0] == ticket and cls.running.get(engine, 0) < cls.limits.get(engine, 1): break
+                    cls.cond.wait()
+                heapq.heappop(q)
+                cls.running[engine] = cls.running.get(engine, 0) + 1
+            except BaseException:
+                q.remove(ticket)
+                heapq.heapify(q)
+                raise
+            finally:
+                if cancel: cancel.off_cancel(cls._wake)
+                cls.cond.notify_all()
+            wait = time.perf_counter() - t0
+            cls.waits.setdefault(priority, deque(maxlen=cls.WINDOW)).append(wait)
+        Tracer.record(f"sched.wait.{cls.NAMES[priority]}", trace, ts, wait, engine=engine)
+
+    @classmethod
+    def release(cls, engine):
+        with cls.cond:
+            cls.running[engine] -= 1
+            cls.cond.notify_all()
+
+    @classmethod
+    def stats(cls):
+        """({engine: (运行中, 排队中, 上限, 最大排队)}, {优先级名: (次数, p50 秒, p95 秒)})"""
+        with cls.cond:
+            engines = {e: (cls.running.get(e, 0), len(cls.waiting.get(e, ())), cls.limits.get(e, 1), cls.peak.get(e, 0))
+                       for e in sorted(set(cls.limits) | set(cls.running))}
+            snap = {cls.NAMES[p]: sorted(v) for p, v in sorted(cls.waits.items())}
+        pct = lambda v, p: v[int(p * (len(v) - 1))]
+        return engines, {k: (len(v), pct(v, 0.5), pct(v, 0.95)) for k, v in snap.items() if v}
+
+class TranslationCache:
+    """翻译结果缓存：内存 LRU + 磁盘 SQLite，键为 (图片, 提示词, 模型) 的哈希"""
+    _inst = None
+    _inst_lock = threading.Lock()
+
+    def __init__(self, path=CACHE_DB, mem_items=64, max_bytes=32 << 20, max_age=30 * 86400):
+        self.mem = OrderedDict()
+        self.mem_items = mem_items
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self.lock = threading.Lock()
+        self.inflight = {}
+        self.puts = 0
+        self.db = sqlite3.connect(path, check_same_thread=False)
+        self.db.execute("CREATE TABLE IF NOT EXISTS cache (key TEXT PRIMARY KEY, label TEXT, content TEXT, size INTEGER, created REAL, accessed REAL)")
+        self.db.execute("CREATE INDEX IF NOT EXISTS idx_cache_accessed ON cache(accessed)")
+        self.db.commit()
+        self.evict()
+
+    @classmethod
+    def instance(cls):
+        with cls._inst_lock:
+            if cls._inst is None:
+                cfg = ConfigManager.load()
+                cls._inst = cls(mem_items=cfg['cache_mem_items'], max_bytes=int(cfg['cache_max_mb'] * (1 << 20)),
+                                max_age=cfg['cache_max_age_days'] * 86400)
+            return cls._inst
+
+    @staticmethod
+    def make_key(img_bytes, prompt, model):
+        h = hashlib.sha256(img_bytes)
+        h.update(b"\0" + prompt.encode('utf-8') + b"\0" + model.encode('utf-8'))
+        return h.hexdigest()
+
+    def get(self, key):
+        with self.lock:
+            if key in self.mem:
+                self.mem.move_to_end(key)
+                return self.mem[key]
+            row = self.db.execute("SELECT label, content, created FROM cache WHERE key=?", (key,)).fetchone()
+            if not row: return None
+            if time.time() - row[2] > self.max_age:
+                self.db.execute("DELETE FROM cache WHERE key=?", (key,))
+                self.db.commit()
+                return None
+            self.db.execute("UPDATE cache SET accessed=? WHERE key=?", (time.time(), key))
+            self.db.commit()
+            self._remember(key, (row[0], row[1]))
+            return (row[0], row[1])
+
+    def put(self, key, label, content):
+        now = time.time()
+        with self.lock:
+            self._remember(key, (label, content))
+            self.db.execute("INSERT OR REPLACE INTO cache VALUES (?,?,?,?,?,?)",
+                            (key, label, content, len(content.encode('utf-8')) + len(label), now, now))
+            self.db.commit()
+            self.puts += 1
+            due = self.puts % 32 == 0
+        if due: self.evict()
+
+    def _remember(self, key, value):
+        self.mem[key] = value
+        self.mem.move_to_end(key)
+        while len(self.mem) > self.mem_items: self.mem.popitem(last=False)
+
+    def evict(self):
+        """先按年龄淘汰，再按总大小从最久未访问的开始淘汰"""
+        with self.lock:
+            self.db.execute("DELETE FROM cache WHERE created < ?", (time.time() - self.max_age,))
+            total = self.db.execute("SELECT COALESCE(SUM(size), 0) FROM cache").fetchone()[0]
+            if total > self.max_bytes:
+                for key, size in self.db.execute("SELECT key, size FROM cache ORDER BY accessed").fetchall():
+                    if total <= self.max_bytes: break
+                    self.db.execute("DELETE FROM cache WHERE key=?", (key,))
+                    self.mem.pop(key, None)
+                    total -= size
+            self.db.commit()
+
+    def shared(self, key, fn, cancel=None):
+        """同一个键同时只发一个请求，其余调用方等待并共享结果。返回 (结果, 是否为发起者)。
+        发起者被自己的 cancel 取消时，等待者不继承这个错误，而是重新竞争、由其中一个接着发请求"""
+        while True:
+            with self.lock:
+                slot = self.inflight.get(key)
+                leader = slot is None
+                if leader:
+                    slot = {'event': threading.Event(), 'result': None, 'error': None, 'cancelled': False}
+                    self.inflight[key] = slot
+            if leader: break
+            while not slot['event'].wait(0.1):
+                if cancel and cancel.is_cancelled(): raise RuntimeError("cancelled")
+            if slot['cancelled']: continue
+            if slot['error']: raise slot['error']
+            return slot['result'], False
+        try:
+            slot['result'] = fn()
+            return slot['result'], True
+        except Exception as e:
+            slot['error'] = e
+            slot['cancelled'] = bool(cancel and cancel.is_cancelled())
+            raise
+        finally:
+            with self.lock: self.inflight.pop(key, None)
+            slot['event'].set()
+
+class HistoryStore:
+    """截图历史：内存里只留缩略图和文字，原图写到临时目录，打开时再读取；退出时整个目录删除"""
+    THUMB = 64
+
+    def __init__(self, max_entries=200, max_age=24 * 3600, max_disk=500 << 20, mem_budget=4 << 20):
+        self.max_entries = max_entries
+        self.max_age = max_age
+        self.max_disk = max_disk
+        self.mem_budget = mem_budget
+        self.entries = []  # 新的在前
+        self.dir = tempfile.mkdtemp(prefix="screen_translator_history_")
+        atexit.register(self.close)
+
+    @classmethod
+    def from_config(cls, config):
+        return cls(config['history_max_entries'], config['history_max_age_hours'] * 3600,
+                   config['history_max_disk_mb'] << 20, config['history_mem_mb'] << 20)
+
+    def __len__(self): return len(self.entries)
+    def __iter__(self): return iter(list(self.entries))
+
+    def find(self, path):
+        return next((e for e in self.entries if e['path'] == path), None)
+
+    def add(self, raw, trans, img_bytes):
+        ts = time.time()
+        path = os.path.join(self.dir, f"{time.time_ns()}.img")
+        with open(path, "wb") as f: f.write(img_bytes)
+        entry = {"time": datetime.datetime.fromtimestamp(ts).strftime("%H:%M"), "ts": ts, "raw": raw, "trans": trans,
+                 "thumb": self.make_thumb(img_bytes), "path": path, "size": len(img_bytes)}
+        self.entries.insert(0, entry)
+        self.enforce()
+        return entry
+
+    @classmethod
+    def make_thumb(cls, img_bytes):
+        try:
+            with Image.open(io.BytesIO(img_bytes)) as img:
+                img.draft('RGB', (cls.THUMB * 2, cls.THUMB * 2))  # JPEG 可直接按缩小尺寸解码
+                img.thumbnail((cls.THUMB, cls.THUMB))
+                b = io.BytesIO()
+                img.save(b, "PNG")
+                return b.getvalue()
+        except: return None
+
+    def load_image(self, entry):
+        with open(entry['path'], "rb") as f: return f.read()
+
+    def enforce(self):
+        now = time.time()
+        keep, disk = [], 0
+        for e in self.entries:
+            if len(keep) >= self.max_entries or now - e['ts'] > self.max_age or disk + e['size'] > self.max_disk:
+                try: os.remove(e['path'])
+                except: pass
+                continue
+            disk += e['size']
+            keep.append(e)
+        self.entries = keep
+        # 超出内存预算时，从最旧的开始丢掉缩略图（文字保留）
+        mem = self.memory_footprint()
+        for e in reversed(self.entries):
+            if mem <= self.mem_budget: break
+            if e['thumb']:
+                mem -= len(e['thumb'])
+                e['thumb'] = None
+
+    def memory_footprint(self):
+        return sum(len(e['thumb'] or b"") + len(e['raw'].encode('utf-8')) + len(e['trans'].encode('utf-8')) + 200 for e in self.entries)
+
+    def disk_usage(self):
+        return sum(e['size'] for e in self.entries)
+
+    def close(self):
+        shutil.rmtree(self.dir, ignore_errors=True)
+
+class FavoritesIndex:
+    """收藏索引（SAVE_DIR/index.db）：托盘菜单只分页查询索引，图片在打开时才读取"""
+    _inst = None
+    _inst_lock = threading.Lock()
+
+    def __init__(self, save_dir=SAVE_DIR):
+        os.makedirs(save_dir, exist_ok=True)
+        self.dir = save_dir
+        self.lock = threading.Lock()
+        self.db = sqlite3.connect(os.path.join(save_dir, "index.db"), check_same_thread=False)
+        self.db.execute("CREATE TABLE IF NOT EXISTS favorites (id TEXT PRIMARY KEY, time TEXT, raw TEXT, trans TEXT)")
+        # 首次建索引时导入已有的收藏目录
+        if self.db.execute("PRAGMA user_version").fetchone()[0] == 0:
+            self.rebuild()
+            self.db.execute("PRAGMA user_version = 1")
+        self.db.commit()
+
+    @classmethod
+    def instance(cls):
+        with cls._inst_lock:
+            if cls._inst is None: cls._inst = cls()
+            return cls._inst
+
+    def rebuild(self):
+        with self.lock:
+            self.db.execute("DELETE FROM favorites")
+            for fd in os.listdir(self.dir): self._import(fd)
+            self.db.commit()
+
+    def reconcile(self):
+        """与收藏目录对账：导入在程序外新增的目录，删掉已不存在的；已索引的目录不读文件"""
+        dirs = {fd for fd in os.listdir(self.dir) if os.path.isdir(os.path.join(self.dir, fd))}
+        with self.lock:
+            known = {r[0] for r in self.db.execute("SELECT id FROM favorites")}
+            if dirs == known: return
+            for fd in dirs - known: self._import(fd)
+            self.db.executemany("DELETE FROM favorites WHERE id=?", [(fd,) for fd in known - dirs])
+            self.db.commit()
+
+    def _import(self, fd):
+        try:
+            with open(os.path.join(self.dir, fd, "content.json"), 'r', encoding='utf-8') as f: d = json.load(f)
+            self.db.execute("INSERT OR REPLACE INTO favorites VALUES (?,?,?,?)", (fd, d.get('time', fd), d['raw'], d['trans']))
+        except: pass
+
+    def add(self, fid, raw, trans):
+        with self.lock:
+            self.db.execute("INSERT OR REPLACE INTO favorites VALUES (?,?,?,?)", (fid, fid, raw, trans))
+            self.db.commit()
+
+    def remove(self, fid):
+        with self.lock:
+            self.db.execute("DELETE FROM favorites WHERE id=?", (fid,))
+            self.db.commit()
+
+    def count(self):
+        with self.lock: return self.db.execute("SELECT COUNT(*) FROM favorites").fetchone()[0]
+
+    def page(self, offset, limit):
+        """只取菜单需要的字段：id 和译文前 10 个字"""
+        with self.lock:
+            rows = self.db.execute("SELECT id, substr(trans, 1, 10) FROM favorites ORDER BY id DESC LIMIT ? OFFSET ?", (limit, offset)).fetchall()
+        return [{'id': r[0], 'label': r[1]} for r in rows]
+
+    def load(self, fid):
+        """返回 {'img', 'raw', 'trans'}；目录已被手动删除时同步清掉索引并返回 None"""
+        with self.lock: row = self.db.execute("SELECT raw, trans FROM favorites WHERE id=?", (fid,)).fetchone()
+        try:
+            with open(os.path.join(self.dir, fid, "capture.png"), 'rb') as f: img = f.read()
+        except OSError: row = None
+        if row is None:
+            self.remove(fid)
+            return None
+        return {'img': img, 'raw': row[0], 'trans': row[1]}
+
+class SearchIndex:
+    """历史与收藏的全文索引（SQLite FTS5）。docs 用 trigram 做子串匹配；
+    trigram 查不了 1~2 个字的词，另建 docs_short：CJK 逐字切开、英文按词，供短词走索引"""
+    _inst = None
+    _inst_lock = threading.Lock()
+    CJK = re.compile(r'([\u2e80-\u9fff\u3040-\u30ff\uac00-\ud7af])')
+
+    def __init__(self, path=SEARCH_DB):
+        self.lock = threading.Lock()
+        self.db = sqlite3.connect(path, check_same_thread=False)
+        self.db.execute("CREATE VIRTUAL TABLE IF NOT EXISTS docs USING fts5(raw, trans, kind UNINDEXED, ref UNINDEXED, time UNINDEXED, tokenize='trigram')")
+        self.db.execute("CREATE VIRTUAL TABLE IF NOT EXISTS docs_short USING fts5(chars, tokenize='unicode61')")
+        if self.db.execute("PRAGMA user_version").fetchone()[0] == 0:
+            # 首次建库时导入已有收藏
+            if os.path.exists(SAVE_DIR):
+                fav = FavoritesIndex.instance()
+                for d in fav.page(0, fav.count()):
+                    row = fav.db.execute("SELECT raw, trans FROM favorites WHERE id=?", (d['id'],)).fetchone()
+                    self._insert(row[0], row[1], 'fav', d['id'], d['id'])
+            self.db.execute("PRAGMA user_version = 1")
+        self.db.commit()
+
+    @classmethod
+    def instance(cls):
+        with cls._inst_lock:
+            if cls._inst is None: cls._inst = cls()
+            return cls._inst
+
+    def add(self, kind, ref, raw, trans, when=None):
+        when = when or datetime.datetime.now().strftime("%Y-%m-%d %H:%M")
+        with self.lock:
+            self._insert(raw or "", trans or "", kind, ref, when)
+            self.db.commit()
+
+    def _insert(self, raw, trans, kind, ref, when):
+        rowid = self.db.execute("INSERT INTO docs VALUES (?,?,?,?,?)", (raw, trans, kind, ref, when)).lastrowid
+        self.db.execute("INSERT INTO docs_short(rowid, chars) VALUES (?,?)", (rowid, self.CJK.sub(r' \1 ', f"{raw}\n{trans}")))
+
+    @classmethod
+    def short_query(cls, term):
+        """短词：CJK 按相邻字组成短语，英文按词前缀"""
+        if cls.CJK.search(term):
+            return '"' + " ".join(cls.CJK.sub(r' \1 ', term).replace('"', '').split()) + '"'
+        return '"' + term.replace('"', '""') + '"*'
+
+    def search(self, text, limit=50):
+        """空格分隔的词取交集；>=3 个字走 trigram 子串匹配，更短的词查 docs_short。结果按时间倒序"""
+        terms = text.split()
+        if not terms: return []
+        where, params = [], []
+        long_terms = [t for t in terms if len(t) >= 3]
+        if long_terms:
+            where.append("docs MATCH ?")
+            params.append(" AND ".join('"' + t.replace('"', '""') + '"' for t in long_terms))
+        short_terms = [t for t in terms if len(t) < 3]
+        if short_terms:
+            short = " AND ".join(self.short_query(t) for t in short_terms)
+            if long_terms:
+                # 混合查询由 trigram 命中驱动，逐行按 rowid 校验短词
+                where.append("EXISTS (SELECT 1 FROM docs_short WHERE docs_short.rowid = docs.rowid AND docs_short MATCH ?)")
+                params.append(short)
+            else:
+                # 只有短词时在子查询里就按时间截断，避免把高频字的全部命中物化出来
+                where.append("rowid IN (SELECT rowid FROM docs_short WHERE docs_short MATCH ? ORDER BY rowid DESC LIMIT ?)")
+                params += [short, limit]
+        sql = f"SELECT kind, ref, time, raw, trans FROM docs WHERE {' AND '.join(where)} ORDER BY rowid DESC LIMIT ?"
+        with self.lock:
+            try: rows = self.db.execute(sql, params + [limit]).fetchall()
+            except sqlite3.OperationalError: return []
+        return [dict(zip(('kind', 'ref', 'time', 'raw', 'trans'), r)) for r in rows]
+
+    def count(self):
+        with self.lock: return self.db.execute("SELECT COUNT(*) FROM docs").fetchone()[0]
+
+class TranslationMemory:
+    """句段级翻译记忆：把原文/译文按行（行数不等时按句）对齐存入 SQLite。精确查找走 norm 唯一索引；
+    近似查找用字符 3-gram 的 MinHash 签名分 6 段做 LSH，每段一列带索引，取回候选后按真实 Jaccard 打分"""
+    _inst = None
+    _inst_lock = threading.Lock()
+    BANDS, ROWS = 6, 4
+    PRIME = 4294967311  # > 2^32 的素数，a*x+b 在 uint64 内不溢出
+    MAX_SEG = 300
+    WINDOW = 200
+    _rng = random.Random(0x7E57)
+    A = _rng.sample(range(1, 1 << 32), BANDS * ROWS)
+    B = _rng.sample(range(1 << 32), BANDS * ROWS)
+
+    def __init__(self, path=TM_DB, max_segments=1000000, fuzzy_min=0.6):
+        self.lock = threading.Lock()
+        self.max_segments = max_segments
+        self.fuzzy_min = fuzzy_min
+        self.stats = {'lookups': 0, 'exact': 0, 'fuzzy': 0, 'miss': 0}
+        self.latency = deque(maxlen=self.WINDOW)
+        self.db = sqlite3.connect(path, check_same_thread=False)
+        bands = ", ".join(f"b{i} INTEGER" for i in range(self.BANDS))
+        self.db.execute(f"CREATE TABLE IF NOT EXISTS segments (id INTEGER PRIMARY KEY, norm TEXT UNIQUE, src TEXT, tgt TEXT, {bands}, updated REAL)")
+        for i in range(self.BANDS): self.db.execute(f"CREATE INDEX IF NOT EXISTS idx_seg_b{i} ON segments(b{i})")
+        self.db.commit()
+        self.count = self.db.execute("SELECT COUNT(*) FROM segments").fetchone()[0]
+        # 命中段数越多的候选越可能相似，先取这些
+        self.fuzzy_sql = ("SELECT norm, src, tgt FROM segments JOIN (SELECT id, COUNT(*) AS n FROM (" + " UNION ALL ".join(f"SELECT id FROM segments WHERE b{i}=?" for i in range(self.BANDS))
+                          + ") GROUP BY id ORDER BY n DESC LIMIT 64) USING (id)")
+
+    @classmethod
+    def instance(cls):
+        with cls._inst_lock:
+            if cls._inst is None:
+                cfg = ConfigManager.load()
+                cls._inst = cls(max_segments=cfg['tm_max_segments'], fuzzy_min=cfg['tm_fuzzy_min'])
+            return cls._inst
+
+    @staticmethod
+    def norm(text):
+        return " ".join(text.casefold().split())
+
+    @staticmethod
+    def grams(norm):
+        padded = f" {norm} "
+        return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+    @classmethod
+    def bands(cls, grams):
+        """MinHash 签名每 ROWS 个值压成一个 32 位段哈希"""
+        hs = [zlib.crc32(g.encode('utf-8')) for g in grams]
+        if np:
+            sig = ((np.array(hs, np.uint64)[:, None] * np.array(cls.A, np.uint64) + np.array(cls.B, np.uint64)) % np.uint64(cls.PRIME)).min(axis=0)
+            raw = sig.astype('<u8').tobytes()
+        else:
+            raw = struct.pack(f"<{len(cls.A)}Q", *(min((a * h + b) % cls.PRIME for h in hs) for a, b in zip(cls.A, cls.B)))
+        step = cls.ROWS * 8
+        return [zlib.crc32(raw[i:i + step]) for i in range(0, len(raw), step)]
+
+    @staticmethod
+    def lines(text):
+        return [l.strip() for l in text.splitlines() if l.strip()]
+
+    @staticmethod
+    def sentences(text):
+        return [x.strip() for x in TTSManager.SENTENCE.findall(text + "\n") if x.strip()]
+
+    @classmethod
+    def align(cls, raw, trans):
+        """行数一致按行配对，否则按句；都对不上时整段作为一个句段"""
+        for split in (cls.lines, cls.sentences):
+            a, b = split(raw), split(trans)
+            if a and len(a) == len(b): return [(x, y) for x, y in zip(a, b) if len(x) <= cls.MAX_SEG]
+        whole = " ".join(cls.lines(raw)), " ".join(cls.lines(trans))
+        return [whole] if all(whole) and len(whole[0]) <= cls.MAX_SEG else []
+
+    def add(self, raw, trans):
+        if not raw or raw == "..." or not trans: return 0
+        return self.add_pairs(self.align(raw, trans))
+
+    def add_pairs(self, pairs):
+        """新译文覆盖同一原文的旧译文；超出上限时按写入顺序淘汰最早的句段"""
+        now = time.time()
+        rows = []
+        for src, tgt in pairs:
+            n = self.norm(src)
+            if n: rows.append((n, src, tgt, *self.bands(self.grams(n)), now))
+        if not rows: return 0
+        cols = ", ".join(f"b{i}" for i in range(self.BANDS))
+        with self.lock:
+            # 先只插入新句段，total_changes 的增量就是新增条数；已有的原文再单独更新译文
+            before = self.db.total_changes
+            self.db.executemany(f"INSERT OR IGNORE INTO segments (norm, src, tgt, {cols}, updated) VALUES ({', '.join('?' * (len(rows[0])))})", rows)
+            added = self.db.total_changes - before
+            if added < len(rows):
+                self.db.executemany("UPDATE segments SET tgt=?, updated=? WHERE norm=?", [(r[2], now, r[0]) for r in rows])
+            self.count += added
+            if self.count > self.max_segments * 1.05:
+                self.db.execute("DELETE FROM segments WHERE id IN (SELECT id FROM segments ORDER BY id LIMIT ?)", (self.count - self.max_segments,))
+                self.count = self.max_segments
+            self.db.commit()
+        return len(rows)
+
+    def exact(self, segment):
+        with self.lock:
+            row = self.db.execute("SELECT tgt FROM segments WHERE norm=?", (self.norm(segment),)).fetchone()
+        return row[0] if row else None
+
+    def fuzzy(self, segment, limit=3):
+        """[(相似度, 原文, 译文)]，按相似度降序，只保留不低于 fuzzy_min 的"""
+        n = self.norm(segment)
+        if not n: return []
+        grams = self.grams(n)
+        with self.lock: rows = self.db.execute(self.fuzzy_sql, self.bands(grams)).fetchall()
+        scored = []
+        for cand, src, tgt in rows:
+            other = self.grams(cand)
+            score = len(grams & other) / len(grams | other)
+            if score >= self.fuzzy_min: scored.append((score, src, tgt))
+        return sorted(scored, reverse=True)[:limit]
+
+    def lookup(self, text, fuzzy=True, max_hints=5):
+        """返回 (译文, 提示)：整段、逐行或逐句全部精确命中时直接给出译文；否则为各行的近似匹配提示"""
+        t0 = time.perf_counter()
+        answer, hints = None, []
+        splits = [[" ".join(self.lines(text))], self.lines(text), self.sentences(text)]
+        for segs in splits:
+            if not segs or not segs[0]: continue
+            found = [self.exact(x) for x in segs]
+            if all(found):
+                answer = LocalOCR.join_words(found) if segs is not splits[1] else "\n".join(found)
+                break
+        if answer is None and fuzzy:
+            seen = set()
+            for line in self.lines(text)[:16]:
+                for score, src, tgt in self.fuzzy(line, 2):
+                    if src not in seen:
+                        seen.add(src)
+                        hints.append((score, src, tgt))
+            hints = sorted(hints, reverse=True)[:max_hints]
+        with self.lock:
+            self.stats['lookups'] += 1
+            self.stats['exact' if answer else 'fuzzy' if hints else 'miss'] += 1
+            self.latency.append(time.perf_counter() - t0)
+        return answer, hints
+
+    @staticmethod
+    def hint_block(hints):
+        if not hints: return ""
+        return "\n        [MEMORY]\n        Earlier translations of similar text, reuse them where they fit:\n" + "".join(f"        {s} => {t}\n" for _, s, t in hints)
+
+    def summary(self):
+        with self.lock:
+            st, lat = dict(self.stats), sorted(self.latency)
+            st['segments'] = self.count
+        st['hit_rate'] = (st['exact'] + st['fuzzy']) / st['lookups'] if st['lookups'] else None
+        st['p50_ms'] = lat[int(0.5 * (len(lat) - 1))] * 1000 if lat else None
+        st['p99_ms'] = lat[int(0.99 * (len(lat) - 1))] * 1000 if lat else None
+        return st
 
 # ==============================================================================
 # 3. AI 线程 (Hybrid)
 # ==============================================================================
 
+class TranslationStreamParser:
+    """增量解析流式输出中的 【Original】/【Translation】 标记，标记可能被切在两个 chunk 之间"""
+    MARKERS = (("【Original】", 'raw'), ("【Translation】", 'trans'))
+
+    def __init__(self):
+        self.section = None  # None: 还没遇到任何标记
+        self.text = {None: "", 'raw': "", 'trans': ""}
+        self.pending = ""
+        self.full = ""
+
+    def feed(self, chunk):
+        self.full += chunk
+        text = self.pending + chunk
+        self.pending = ""
+        # 进入译文段后不再识别标记，与 parse_emit 的切分方式一致
+        while self.section != 'trans':
+            hits = [(text.find(m), m, sec) for m, sec in self.MARKERS if m in text]
+            if not hits: break
+            i, m, sec = min(hits)
+            self.text[self.section] += text[:i]
+            self.section = sec
+            text = text[i + len(m):]
+        if self.section != 'trans':
+            # 末尾可能是半个标记，先扣住等下一个 chunk
+            keep = max((k for m, _ in self.MARKERS for k in range(1, len(m)) if text.endswith(m[:k])), default=0)
+            if keep: text, self.pending = text[:-keep], text[-keep:]
+        self.text[self.section] += text
+
+    def result(self, final=False):
+        """扣住的半个标记也算正文（流可能就停在那里）。没出现译文标记时整段当译文；
+        流式过程中原文段先按原文显示，final=True 时与 parse_content 的结果一致"""
+        if self.section is None or (final and self.section != 'trans'): return "...", self.full.strip()
+        if self.section == 'raw': return (self.text['raw'] + self.pending).strip() or "...", ""
+        return self.text['raw'].strip() or "...", self.text['trans'].strip()
+
 class AIWorker(QThread):
     sig_result = pyqtSignal(str, str)
+    sig_partial = pyqtSignal(str, str)
     sig_model_used = pyqtSignal(str)
+    sig_timing = pyqtSignal(float, float)  # 首字可见耗时, 总耗时 (秒)
 
-    def __init__(self, img_bytes):
+    def __init__(self, img_bytes, trace_id=None, priority=RequestScheduler.INTERACTIVE):
         super().__init__()
         self.img_bytes = img_bytes
+        self.trace_id = trace_id
+        self.priority = priority
+        self.token = CancelToken()  # abort() 时中止排队和正在进行的流
         self.config = ConfigManager.load()
-
-    def run(self):
-        prompt = """
+        self.parser = TranslationStreamParser()
+        self.t0 = self.t_first = None
+        self.last_partial = 0
+        self.path = None
+        self.memory = None
+        self.early = self.early_hit = None
+        self.tile_failed = False
+
+    PROMPT = """
         [INSTRUCTION]
         Mode: FAST / NO THINKING.
         Format Strict:
@@ -275,73 +2287,633 @@ class AIWorker(QThread):
         【Translation】
         <text>
         """
-        
-        # 1. Try Online
-        if self.config['use_online'] and self.config['api_key']:
+
+    TEXT_PROMPT = """
+        [INSTRUCTION]
+        Mode: FAST / NO THINKING.
+        Translate the text below. Output the translation only.
+        [TEXT]
+        {text}
+        """
+
+    def engine_models(self):
+        models = []
+        if self.config['use_online'] and self.config['api_key']: models.append(self.config['online_model'])
+        models.append(self.config.get('local_model', 'qwen3-vl:8b'))
+        return models
+
+    @staticmethod
+    def ocr_key(model):
+        """OCR 文本通道的缓存和健康统计记在这个名下，不与同名视觉模型混在一起"""
+        return f"ocr:{model}"
+
+    def ocr_models(self):
+        if not self.config.get('ocr_enabled'): return []
+        models = []
+        if self.config['use_online'] and self.config['api_key']: models.append(self.ocr_key(self.config.get('ocr_online_model') or self.config['online_model']))
+        models.append(self.ocr_key(self.config.get('ocr_local_model') or self.config.get('local_model', 'qwen3-vl:8b')))
+        return models
+
+    def run(self):
+        with Tracer.span("translate", self.trace_id) as sp:
+            try:
+                label, content = self.resolve()
+                sp.set(engine=label, path=self.path)
+                if self.token.is_cancelled(): return
+                self.parse_emit(content)
+                self.emit_timing()
+                if self.t_first is not None: sp.set(first_ms=round(self.t_first * 1000))
+            except Exception as e:
+                sp.set(error=str(e))
+                if self.token.is_cancelled(): return
+                self.sig_result.emit(f"Error: {e}", "All engines failed.")
+
+    def abort(self):
+        self.token.cancel()
+
+    def resolve(self):
+        """查缓存 -> 合并同键请求 -> 调用引擎，返回 (标签, 模型原始输出)；不依赖事件循环，批量模式直接调用"""
+        prompt = self.PROMPT
+        self.t0 = time.perf_counter()
+        cache = TranslationCache.instance() if self.config.get('cache_enabled', True) else None
+        if not cache: return self.translate(prompt)
+        models = self.engine_models()
+
+        # 0. 命中缓存则直接返回，视觉结果优先于 OCR 文本通道的结果
+        for m in models + self.ocr_models():
+            hit = cache.get(TranslationCache.make_key(self.img_bytes, prompt, m))
+            if hit:
+                label = f"⚡ Cache • {hit[0]}"
+                self.sig_model_used.emit(label)
+                return label, hit[1]
+
+        (label, content), leader = cache.shared(TranslationCache.make_key(self.img_bytes, prompt, models[0]), lambda: self.translate(prompt, cache), self.token)
+        if not leader:
+            label = f"⚡ Cache • {label}"
+            self.sig_model_used.emit(label)
+        return label, content
+
+    def translate(self, prompt, cache=None):
+        """返回 (标签, 内容)，结果按实际应答的模型写入缓存"""
+        online = self.config['use_online'] and self.config['api_key'] and EngineHealth.allow('online', self.config['online_model'], self.config)
+        mode = self.config.get('dispatch_mode', 'serial')
+        ts, t0 = time.time(), time.perf_counter()
+        self.memory = TranslationMemory.instance() if self.config.get('tm_enabled', True) else None
+        self.path, result, prompt_used = 'vision', None, prompt
+        tiles = ImageTiler(self.config).tiles(self.img_bytes)
+        if tiles:
+            result = self.translate_tiled(prompt, [t for _, t in tiles], online)
+        else:
+            ocr, hints = self.run_ocr(), []
+            if ocr and self.memory:
+                with Tracer.span("tm.lookup", self.trace_id) as sp:
+                    answer, hints = self.memory.lookup(ocr[0], max_hints=self.config.get('tm_hints', 5))
+                    sp.set(exact=bool(answer), hints=len(hints))
+                if answer:
+                    self.sig_model_used.emit("⚡ TM")
+                    # 模型记为 None：翻译记忆本身就是缓存，不再写入截图缓存
+                    result = "⚡ TM", None, f"【Original】\n{ocr[0]}\n【Translation】\n{answer}"
+                    self.path = 'tm'
+            if result is None and ocr and ocr[1]:
+                try:
+                    result = self.translate_text(ocr[0], hints)
+                    self.path = 'ocr'
+                except Exception as e: log.debug("[ocr] text path failed (%s), falling back to vision", e)
+            prompt_used = prompt + TranslationMemory.hint_block(hints)
+        if result is None:
+            if online and mode in ('hedge', 'race'):
+                result = self.translate_hedged(prompt_used, 0 if mode == 'race' else DispatchStats.hedge_delay(self.config))
+            else:
+                result = self.translate_serial(prompt_used, online)
+        label, model, content = result
+        if result is self.early_hit: self.path = 'tm'
+        LocalOCR.record(self.path, time.perf_counter() - t0)
+        Tracer.record(f"path.{self.path}", self.trace_id, ts, time.perf_counter() - t0, engine=label)
+        # 有分块失败时结果里带着占位文字，不写入翻译记忆和缓存，下次截图重新翻译
+        if self.tile_failed: return label, content
+        if self.memory and self.path != 'tm': self.memory.add(*self.parse_content(content))
+        if cache and model: cache.put(TranslationCache.make_key(self.img_bytes, prompt, model), label, content)
+        return label, content
+
+    def run_ocr(self):
+        """返回 (识别文本, 置信度是否够走文本路径)；未启用或没识别出文字时返回 None"""
+        ocr = LocalOCR.from_config(self.config)
+        if not ocr: return None
+        t0 = time.perf_counter()
+        res, ok = None, False
+        with Tracer.span("ocr", self.trace_id) as sp:
+            try: res = ocr.read(self.img_bytes)
+            except Exception as e: sp.set(error=str(e))
+            ok = bool(res) and ocr.confident(res[1], res[2])
+            if res: sp.set(conf=round(res[1], 1), min_word=round(res[2], 1), chars=len(res[0]), accepted=ok)
+        if log.isEnabledFor(logging.DEBUG):
+            found = f"conf {res[1]:.0f} (min word {res[2]:.0f}), {len(res[0])} chars" if res else "no text"
+            log.debug(f"[ocr] {found} in {(time.perf_counter() - t0) * 1000:.0f}ms -> {'text' if ok else 'vision'} path")
+        return (res[0], ok) if res else None
+
+    def translate_text(self, text, hints=()):
+        """OCR 快速通道：原文直接用识别结果，只让文本模型翻译；结果按 ocr_key 缓存，不会顶替视觉模型的结果"""
+        prompt = self.TEXT_PROMPT.format(text=text) + TranslationMemory.hint_block(hints)
+        head = f"【Original】\n{text}\n【Translation】\n"
+        model = self.config.get('ocr_online_model') or self.config['online_model']
+        if self.config['use_online'] and self.config['api_key'] and EngineHealth.allow('online', self.ocr_key(model), self.config):
             try:
-                self.sig_model_used.emit(f"Online: {self.config['online_model']}")
-                resp = OnlineClient.chat(self.config, [{'role':'user', 'content':prompt, 'images':[self.img_bytes]}], False)
-                if resp.status_code == 200:
-                    self.parse_emit(resp.json()['choices'][0]['message']['content'])
-                    return
+                self.sig_model_used.emit(f"OCR+Online: {model}")
+                self.stream_reset()
+                self.on_stream_chunk(head)
+                return f"OCR+Online: {model}", self.ocr_key(model), head + self.call_online(prompt, on_chunk=self.on_stream_chunk, text_model=model)
             except: pass
+        local = self.config.get('ocr_local_model') or self.config.get('local_model', 'qwen3-vl:8b')
+        self.sig_model_used.emit(f"OCR+Local: {local}")
+        self.stream_reset()
+        self.on_stream_chunk(head)
+        return f"OCR+Local: {local}", self.ocr_key(local), head + self.call_local(prompt, on_chunk=self.on_stream_chunk, text_model=local)
+
+    def translate_serial(self, prompt, online):
+        # 1. Try Online
+        if online:
+            try:
+                model = self.config['online_model']
+                self.sig_model_used.emit(f"Online: {model}")
+                t0 = time.perf_counter()
+                self.stream_reset(f"Online: {model}", model)
+                content = self.call_online(prompt, self.early, on_chunk=self.on_stream_chunk)
+                DispatchStats.record('online', time.perf_counter() - t0)
+                return f"Online: {model}", model, content
+            except:
+                if self.early_hit: return self.early_hit
 
         # 2. Try Local
-        try:
+        local = self.config.get('local_model', 'qwen3-vl:8b')
+        self.sig_model_used.emit(f"Local: {local}")
+        self.stream_reset(f"Local: {local}", local)
+        try: return f"Local: {local}", local, self.call_local(prompt, self.early, on_chunk=self.on_stream_chunk)
+        except:
+            if self.early_hit: return self.early_hit
+            raise
+
+    def translate_hedged(self, prompt, delay):
+        """在线先发，delay 秒后（或在线失败时立即）再发本地；先吐出首个 token 的引擎胜出，另一个被取消"""
+        results = queue.Queue()
+        start_local = threading.Event()
+        engines = [
+            ('online', self.config['online_model'], self.call_online, 0),
+            ('local', self.config.get('local_model', 'qwen3-vl:8b'), self.call_local, delay),
+        ]
+        tokens = {name: self.token.child() for name, *_ in engines}
+        winner = []
+        lock = threading.Lock()
+
+        def claim(name):
+            with lock:
+                if not winner:
+                    winner.append(name)
+                    for other, tok in tokens.items():
+                        if other != name: tok.cancel()
+                    start_local.set()
+                return winner[0] == name
+
+        def sink(name):
+            def on_chunk(chunk):
+                if claim(name): self.on_stream_chunk(chunk)
+            return on_chunk
+
+        def attempt(name, model, fn, wait):
+            if wait: start_local.wait(wait)
+            t0 = time.perf_counter()
+            try:
+                if tokens[name].is_cancelled(): raise RuntimeError("cancelled")
+                content = fn(prompt, tokens[name], sink(name))
+                if not content or not content.strip(): raise ValueError("empty response")
+                results.put((name, model, content, time.perf_counter() - t0))
+            except Exception as e:
+                results.put((name, model, e, time.perf_counter() - t0))
+
+        self.sig_model_used.emit(f"Online: {engines[0][1]} ⇄ Local: {engines[1][1]}")
+        for e in engines: threading.Thread(target=attempt, args=e, daemon=True).start()
+        error = None
+        for _ in engines:
+            name, model, res, latency = results.get()
+            if isinstance(res, Exception):
+                # 胜出的引擎中途出错时另一个已被取消，像串行模式一样换它从头再来
+                if winner and winner[0] == name: return self.hedge_fallback(prompt, engines, name, res)
+                if not winner: error = res
+                start_local.set()
+                continue
+            if not claim(name): continue
+            DispatchStats.record(name, latency, won=True)
+            # 本地胜出时在线被取消，只知道耗时至少为 delay + latency，不混进真实耗时
+            if name == 'local': DispatchStats.record('online', delay + latency, censored=True)
+            label = f"{'Online' if name == 'online' else 'Local'}: {model}"
+            log.debug("[dispatch] winner=%s %.2fs (hedge delay %.2fs)", name, latency, delay)
+            self.sig_model_used.emit(label)
+            return label, model, res
+        raise error
+
+    def hedge_fallback(self, prompt, engines, failed, error):
+        if self.token.is_cancelled(): raise error
+        name, model, fn, _ = next(e for e in engines if e[0] != failed)
+        label = f"{'Online' if name == 'online' else 'Local'}: {model}"
+        log.debug("[dispatch] %s failed mid-stream (%s), retrying with %s", failed, error, name)
+        self.sig_model_used.emit(label)
+        self.stream_reset()
+        content = fn(prompt, None, self.on_stream_chunk)
+        if not content or not content.strip(): raise ValueError("empty response")
+        return label, model, content
+
+    def translate_tiled(self, prompt, tiles, online):
+        """分块并发翻译，按阅读顺序合并；每块各自 在线 -> 本地 兜底，不参与 hedge 调度"""
+        t0 = time.perf_counter()
+        n = len(tiles)
+        done = [None] * n
+        models = []
+        def one(i, tile):
+            data = ImageTiler.to_png(tile)
+            if online:
+                try: return i, self.config['online_model'], self.call_online(prompt, image=data)
+                except: pass
             local = self.config.get('local_model', 'qwen3-vl:8b')
-            self.sig_model_used.emit(f"Local: {local}")
-            resp = ollama.chat(model=local, messages=[{'role':'user', 'content':prompt, 'images':[self.img_bytes]}])
-            self.parse_emit(resp['message']['content'])
-        except Exception as e:
-            self.sig_result.emit(f"Error: {e}", "All engines failed.")
+            return i, local, self.call_local(prompt, image=data)
+        self.sig_model_used.emit(f"{'Online' if online else 'Local'} • {n} tiles")
+        from concurrent.futures import ThreadPoolExecutor, as_completed
+        with Tracer.span("tiles", self.trace_id, tiles=n), ThreadPoolExecutor(min(n, self.config.get('tile_workers', 4))) as pool:
+            futures = [pool.submit(one, i, tile) for i, tile in enumerate(tiles)]
+            for fut in as_completed(futures):
+                try:
+                    i, model, content = fut.result()
+                    done[i] = self.parse_content(content)
+                    models.append(model)
+                except Exception as e:
+                    i = futures.index(fut)
+                    self.tile_failed = True
+                    done[i] = ("...", f"[第 {i + 1}/{n} 块失败: {e}]")
+                # 从第一块起连续完成的部分先显示
+                ready = []
+                for p in done:
+                    if p is None: break
+                    ready.append(p)
+                if ready:
+                    if self.t_first is None: self.t_first = time.perf_counter() - self.t0
+                    raw, trans = ImageTiler.merge(ready)
+                    self.sig_partial.emit(raw or "...", trans)
+        if not models: raise RuntimeError(f"all {n} tiles failed")
+        raw, trans = ImageTiler.merge(done)
+        model = max(set(models), key=models.count)
+        label = f"{'Online' if online and model == self.config['online_model'] else 'Local'}: {model} ×{n}"
+        log.debug("[tiles] %d tiles in %.2fs", n, time.perf_counter() - t0)
+        return label, model, f"【Original】\n{raw}\n【Translation】\n{trans}"
+
+    def call_online(self, prompt, cancel=None, on_chunk=None, image=None, text_model=None):
+        """给定 text_model 时发纯文本请求，不附图片"""
+        cancel = cancel or self.token
+        model = text_model or self.config['online_model']
+        msg = {'role':'user', 'content':prompt}
+        if not text_model: msg['images'] = [self.prepared_image(model, image)]
+        config = {**self.config, 'online_model': model}
+        def send():
+            with Tracer.span("engine.online", self.trace_id, model=model):
+                resp = OnlineClient.chat(config, [msg], True, cancel, self.trace_id)
+                if resp.status_code != 200: raise RuntimeError(f"HTTP {resp.status_code}")
+                parts = []
+                for chunk in OnlineClient.iter_content(resp):
+                    parts.append(chunk)
+                    if on_chunk: on_chunk(chunk)
+                if log.isEnabledFor(logging.DEBUG): log.debug(HttpClient.format_timing(resp.timing))
+                if cancel and cancel.is_cancelled(): raise RuntimeError("cancelled")
+                return "".join(parts)
+        health = self.ocr_key(model) if text_model else model
+        with RequestScheduler.slot('online', self.priority, cancel, self.trace_id):
+            return EngineHealth.call('online', health, send, cancel, self.config)
+
+    def call_local(self, prompt, cancel=None, on_chunk=None, image=None, text_model=None):
+        cancel = cancel or self.token
+        local = text_model or self.config.get('local_model', 'qwen3-vl:8b')
+        health = self.ocr_key(local) if text_model else local
+        # 熔断打开时直接失败；冷却期过后由 allow() 在后台半开探测
+        if not EngineHealth.allow('local', health, self.config): raise RuntimeError(f"{health} circuit open")
+        msg = {'role':'user', 'content':prompt}
+        if not text_model: msg['images'] = [self.prepared_image(local, image)]
+        # 刚启动或重启中时先等服务就绪，不直接失败；等待中被取消则立即退出
+        if cancel.is_cancelled() or not OllamaService.wait_ready(cancel=cancel):
+            raise RuntimeError("cancelled" if cancel.is_cancelled() else "ollama not ready")
+        client = ollama.Client()
+        def send():
+            with Tracer.span("engine.local", self.trace_id, model=local):
+                parts = []
+                for chunk in client.chat(model=local, messages=[msg], stream=True, keep_alive=self.config['ollama_keep_alive']):
+                    if cancel and cancel.is_cancelled(): raise RuntimeError("cancelled")
+                    c = chunk['message']['content']
+                    if c:
+                        parts.append(c)
+                        if on_chunk: on_chunk(c)
+                OllamaWarmup.mark_used(local)
+                return "".join(parts)
+        with RequestScheduler.slot('local', self.priority, cancel, self.trace_id):
+            # 拿到槽位后才挂上关闭回调：取消时断开 ollama 的流式连接
+            close = ollama_closer(client)
+            cancel.on_cancel(close)
+            try: return EngineHealth.call('local', health, send, cancel, self.config)
+            finally: cancel.off_cancel(close)
+
+    def stream_reset(self, label=None, model=None):
+        # 换引擎重来时清掉上一个引擎的半截输出
+        if self.parser.text != TranslationStreamParser().text: self.sig_partial.emit("...", "")
+        self.parser = TranslationStreamParser()
+        # 给定引擎时，原文段一结束就查翻译记忆，全部命中则取消请求、省掉译文段的生成
+        self.early = self.token.child() if label and self.memory else None
+        self.early_from = (label, model)
+
+    def on_stream_chunk(self, chunk):
+        if self.early_hit: return
+        self.parser.feed(chunk)
+        raw, trans = self.parser.result()
+        if self.early and not self.early.is_cancelled() and self.parser.section == 'trans' and raw != "...":
+            answer, _ = self.memory.lookup(raw, fuzzy=False)
+            if answer:
+                label = f"⚡ TM • {self.early_from[0]}"
+                self.early_hit = label, self.early_from[1], f"【Original】\n{raw}\n【Translation】\n{answer}"
+                self.sig_model_used.emit(label)
+                log.debug("[tm] all segments matched after the original text, request cancelled")
+                self.early.cancel()
+                return
+            self.early = None
+        now = time.perf_counter()
+        if self.t_first is None and (trans or raw != "..."): self.t_first = now - self.t0
+        # 限制刷新频率，最终结果由 sig_result 补齐
+        if now - self.last_partial >= 0.03:
+            self.last_partial = now
+            self.sig_partial.emit(raw, trans)
+
+    def emit_timing(self):
+        total = time.perf_counter() - self.t0
+        first = self.t_first if self.t_first is not None else total
+        log.debug("[stream] first text %.2fs, total %.2fs", first, total)
+        self.sig_timing.emit(first, total)
+
+    def prepared_image(self, model, image=None):
+        with Tracer.span("preprocess", self.trace_id, model=model) as sp:
+            data, report = ImagePreprocessor(self.config).process(image or self.img_bytes, model)
+            sp.set(bytes_in=report['bytes_in'], bytes_out=report['bytes_out'])
+        if log.isEnabledFor(logging.DEBUG): log.debug(ImagePreprocessor.format_report(report))
+        return data
+
+    @staticmethod
+    def parse_content(content):
+        """整段输出按流式解析器的规则切分，流式显示和最终结果不会对不上"""
+        parser = TranslationStreamParser()
+        parser.feed(content)
+        return parser.result(final=True)
 
     def parse_emit(self, content):
-        raw, trans = "...", content
-        if "【Translation】" in content:
-            parts = content.split("【Translation】")
-            trans = parts[1].strip()
-            if "【Original】" in parts[0]: raw = parts[0].replace("【Original】", "").strip()
-        self.sig_result.emit(raw, trans)
+        self.sig_result.emit(*self.parse_content(content))
+
+class ChatContext:
+    """按 token 预算裁剪对话上下文：保留稳定前缀（便于 Ollama 复用 KV cache），丢弃最早的轮次并附一段摘要，重复图片只发一次"""
+    def __init__(self, budget=6000):
+        self.budget = budget
+        self.cut = 0  # 只前移不后退，避免每轮都改变已发送的消息序列
+        self.image_tokens = {}
+
+    @staticmethod
+    def text_tokens(text):
+        cjk = sum(1 for ch in text if '\u2e80' <= ch <= '\u9fff' or '\u3040' <= ch <= '\u30ff' or '\uac00' <= ch <= '\ud7af')
+        return cjk + (len(text) - cjk + 3) // 4 + 4
+
+    def estimate_image(self, data):
+        # 与常见视觉模型的切块计费方式一致：先缩到 2048 内、短边 768，再按 512 块计
+        digest = image_digest(data)
+        if digest not in self.image_tokens:
+            try:
+                with Image.open(io.BytesIO(data)) as img: w, h = img.size
+                scale = min(1.0, 2048 / max(w, h))
+                w, h = w * scale, h * scale
+                scale = min(1.0, 768 / min(w, h))
+                w, h = w * scale, h * scale
+                self.image_tokens[digest] = 85 + 170 * (-(-int(w) // 512)) * (-(-int(h) // 512))
+            except: self.image_tokens[digest] = 765
+        return self.image_tokens[digest]
+
+    def estimate(self, msg):
+        return self.text_tokens(msg.get('content') or "") + sum(self.estimate_image(i) for i in msg.get('images') or [])
+
+    def build(self, history):
+        """返回发送用的消息列表，不修改 history 本身"""
+        first_user = next((i for i, m in enumerate(history) if m['role'] == 'user'), len(history) - 1)
+        prefix, rest = history[:first_user + 1], history[first_user + 1:]
+        self.cut = min(self.cut, len(rest))
+        fixed = sum(self.estimate(m) for m in prefix) + 96  # 预留摘要消息的开销
+        costs = [self.estimate(m) for m in rest]
+        if fixed + sum(costs[self.cut:]) > self.budget:
+            # 一次裁到预算的 75%，按整轮（从 user 消息开始）前移，最后一条用户消息始终保留
+            last_user = max((i for i, m in enumerate(rest) if m['role'] == 'user'), default=len(rest))
+            while self.cut < last_user and fixed + sum(costs[self.cut:]) > self.budget * 0.75:
+                self.cut += 1
+                while self.cut < last_user and rest[self.cut]['role'] != 'user': self.cut += 1
+        out = list(prefix)
+        if self.cut:
+            questions = [m['content'][:40] for m in rest[:self.cut] if m['role'] == 'user' and m.get('content')][-6:]
+            out.append({"role": "system", "content": f"[Earlier {self.cut} messages omitted. User asked about: " + " | ".join(questions) + "]"})
+        out.extend(rest[self.cut:])
+        return self.dedupe_images(out)
+
+    @staticmethod
+    def dedupe_images(messages):
+        seen = set()
+        out = []
+        for m in messages:
+            if m.get('images'):
+                imgs = [i for i in m['images'] if image_digest(i) not in seen]
+                seen.update(image_digest(i) for i in imgs)
+                if len(imgs) != len(m['images']):
+                    m = {k: v for k, v in m.items() if k != 'images'}
+                    if imgs: m['images'] = imgs
+            out.append(m)
+        return out
 
 class ChatWorker(QThread):
     sig_chunk = pyqtSignal(str)
     sig_done = pyqtSignal()
     
-    def __init__(self, history):
+    def __init__(self, history, trace_id=None):
         super().__init__()
         self.history = history
+        self.trace_id = trace_id or Tracer.new_trace()
+        self.token = CancelToken()
         self.config = ConfigManager.load()
 
     def run(self):
-        if self.config['use_online'] and self.config['api_key']:
+        model = self.config['online_model']
+        if self.config['use_online'] and self.config['api_key'] and EngineHealth.allow('online', model, self.config):
             try:
-                resp = OnlineClient.chat(self.config, self.history, True)
-                if resp.status_code == 200:
-                    for line in resp.iter_lines():
-                        if line:
-                            decoded = line.decode('utf-8').replace('data: ', '')
-                            if decoded != '[DONE]':
-                                try:
-                                    chunk = json.loads(decoded)['choices'][0]['delta'].get('content', '')
-                                    if chunk: self.sig_chunk.emit(chunk)
-                                except: pass
-                    self.sig_done.emit()
-                    return
+                with RequestScheduler.slot('online', RequestScheduler.CHAT, self.token, self.trace_id):
+                    EngineHealth.call('online', model, self.stream_online, self.token, self.config)
+                self.sig_done.emit()
+                return
             except: pass
 
         try:
             local = self.config.get('local_model', 'qwen3-vl:8b')
-            stream = ollama.chat(model=local, messages=self.history, stream=True)
-            for chunk in stream:
-                c = chunk['message']['content']
-                if c: self.sig_chunk.emit(c)
-            self.sig_done.emit()
-        except: self.sig_done.emit()
+            if not EngineHealth.allow('local', local, self.config): raise RuntimeError(f"{local} circuit open")
+            with RequestScheduler.slot('local', RequestScheduler.CHAT, self.token, self.trace_id):
+                EngineHealth.call('local', local, lambda: self.stream_local(local), self.token, self.config)
+        except: pass
+        if not self.token.is_cancelled(): self.sig_done.emit()
+
+    def abort(self):
+        self.token.cancel()
+
+    def stream_online(self):
+        with Tracer.span("chat.online", self.trace_id, messages=len(self.history)):
+            resp = OnlineClient.chat(self.config, self.history, True, self.token, self.trace_id)
+            if resp.status_code != 200: raise RuntimeError(f"HTTP {resp.status_code}")
+            for chunk in OnlineClient.iter_content(resp): self.sig_chunk.emit(chunk)
+            if log.isEnabledFor(logging.DEBUG): log.debug(HttpClient.format_timing(resp.timing))
+            if self.token.is_cancelled(): raise RuntimeError("cancelled")
+
+    def stream_local(self, local):
+        # 传入已编码的 base64 字符串，ollama 不会再编码一次
+        if self.token.is_cancelled() or not OllamaService.wait_ready(cancel=self.token):
+            raise RuntimeError("cancelled" if self.token.is_cancelled() else "ollama not ready")
+        with Tracer.span("chat.local", self.trace_id, messages=len(self.history)):
+            messages = [{**m, 'images': [b64_image(i) for i in m['images']]} if m.get('images') else m for m in self.history]
+            client = ollama.Client()
+            close = ollama_closer(client)
+            self.token.on_cancel(close)
+            try:
+                for chunk in client.chat(model=local, messages=messages, stream=True, keep_alive=self.config['ollama_keep_alive']):
+                    if self.token.is_cancelled(): raise RuntimeError("cancelled")
+                    c = chunk['message']['content']
+                    if c: self.sig_chunk.emit(c)
+            finally: self.token.off_cancel(close)
+            OllamaWarmup.mark_used(local)
+
+class LiveCapture(QThread):
+    """实时区域：按固定帧率截取屏幕矩形，帧差分判断内容是否变化，画面稳定 debounce 毫秒后才发出一帧"""
+    sig_frame = pyqtSignal(bytes, object)  # PNG, trace_id
+
+    def __init__(self, bbox, config):
+        super().__init__()
+        self.bbox = tuple(bbox)
+        self.interval = 1 / max(0.5, config['live_fps'])
+        self.threshold = config['live_threshold']
+        self.pixel_delta = config['live_pixel_delta']
+        self.debounce = config['live_debounce_ms'] / 1000
+        self.running = True
+        self.stats = {'frames': 0, 'sent': 0, 'skipped': 0, 'grab_s': 0.0, 'diff_s': 0.0, 'cpu_s': 0.0, 'wall_s': 0.0}
+
+    @staticmethod
+    def to_frame(img):
+        """最近邻抽样到长边 640 以内再转灰度（与剪贴板指纹同样的取样方式，不做整幅像素运算）；有 NumPy 时转成数组"""
+        k = max(img.size) / 640
+        if k > 1: img = img.resize((max(1, int(img.width / k)), max(1, int(img.height / k))), Image.NEAREST)
+        g = img.convert('L')
+        return np.asarray(g, dtype=np.int16) if np else g
+
+    def changed(self, a, b):
+        """两帧之间变化像素的比例"""
+        if a is None or b is None: return 1.0
+        if np:
+            if a.shape != b.shape: return 1.0
+            return np.count_nonzero(np.abs(a - b) > self.pixel_delta) / a.size
+        if a.size != b.size: return 1.0
+        return ImageChops.difference(a, b).point(lambda v: 255 if v > self.pixel_delta else 0).histogram()[255] / (a.width * a.height)
+
+    def run(self):
+        ref = prev = None  # ref: 上次发出的帧；prev: 上一帧
+        last_motion = 0
+        t_start, cpu0 = time.perf_counter(), time.thread_time()
+        next_t = t_start
+        while self.running:
+            t0 = time.perf_counter()
+            try: img = ImageGrab.grab(bbox=self.bbox, all_screens=True)
+            except Exception as e:
+                log.debug("[live] grab failed: %s", e)
+                break
+            t1 = time.perf_counter()
+            cur = self.to_frame(img)
+            if self.changed(prev, cur) > self.threshold: last_motion = t1  # 还在变（淡入、滚动），等它停下
+            dirty = self.changed(ref, cur) > self.threshold
+            t2 = time.perf_counter()
+            prev = cur
+            st = self.stats
+            st['frames'] += 1
+            st['grab_s'] += t1 - t0
+            st['diff_s'] += t2 - t1
+            if dirty and t2 - last_motion >= self.debounce:
+                b = io.BytesIO()
+                img.save(b, "PNG")
+                ref = cur
+                st['sent'] += 1
+                self.sig_frame.emit(b.getvalue(), Tracer.new_trace())
+            else: st['skipped'] += 1
+            st['cpu_s'], st['wall_s'] = time.thread_time() - cpu0, time.perf_counter() - t_start
+            next_t += self.interval
+            delay = next_t - time.perf_counter()
+            if delay > 0: time.sleep(delay)
+            else: next_t = time.perf_counter()  # 跟不上帧率时不补帧
+
+    def stop(self):
+        self.running = False
+        self.wait(2000)
+
+    def format_stats(self):
+        st = self.stats
+        n, wall = max(1, st['frames']), st['wall_s'] or 1
+        return (f"{st['frames'] / wall:.1f} fps • 发送 {st['sent']} / 跳过 {st['skipped']} • CPU {st['cpu_s'] * 100 / wall:.0f}% "
+                f"• grab {st['grab_s'] * 1000 / n:.1f}ms diff {st['diff_s'] * 1000 / n:.2f}ms")
 
 # ==============================================================================
 # 4. UI 组件
 # ==============================================================================
 
+class RegionSelector(QWidget):
+    """覆盖整个虚拟桌面的半透明遮罩，拖拽框选实时翻译区域，Esc 取消"""
+    sig_selected = pyqtSignal(tuple)  # 物理像素 (left, top, right, bottom)
+
+    def __init__(self):
+        super().__init__()
+        self.setWindowFlags(Qt.WindowType.FramelessWindowHint | Qt.WindowType.WindowStaysOnTopHint | Qt.WindowType.Tool)
+        self.setAttribute(Qt.WidgetAttribute.WA_TranslucentBackground)
+        self.setCursor(Qt.CursorShape.CrossCursor)
+        self.setGeometry(QApplication.primaryScreen().virtualGeometry())
+        self.origin = self.current = None
+        self.show()
+        self.activateWindow()
+
+    def paintEvent(self, e):
+        p = QPainter(self)
+        p.fillRect(self.rect(), QColor(0, 0, 0, 90))
+        if self.origin and self.current:
+            r = QRect(self.origin, self.current).normalized()
+            p.setCompositionMode(QPainter.CompositionMode.CompositionMode_Clear)
+            p.fillRect(r, Qt.GlobalColor.transparent)
+            p.setCompositionMode(QPainter.CompositionMode.CompositionMode_SourceOver)
+            p.setPen(QColor(0, 120, 212))
+            p.drawRect(r)
+
+    def mousePressEvent(self, e):
+        self.origin = self.current = e.position().toPoint()
+        self.update()
+
+    def mouseMoveEvent(self, e):
+        if self.origin:
+            self.current = e.position().toPoint()
+            self.update()
+
+    def mouseReleaseEvent(self, e):
+        if not self.origin: return
+        r = QRect(self.origin, e.position().toPoint()).normalized().translated(self.geometry().topLeft())
+        self.close()
+        if r.width() < 8 or r.height() < 8: return
+        # Qt 逻辑坐标 -> 屏幕物理像素：屏幕左上角不缩放，屏内偏移按该屏的缩放比换算
+        screen = QApplication.screenAt(r.center()) or QApplication.primaryScreen()
+        origin, dpr = screen.geometry().topLeft(), screen.devicePixelRatio()
+        px = lambda x, o: int(o + (x - o) * dpr)
+        self.sig_selected.emit((px(r.left(), origin.x()), px(r.top(), origin.y()), px(r.right() + 1, origin.x()), px(r.bottom() + 1, origin.y())))
+
+    def keyPressEvent(self, e):
+        if e.key() == Qt.Key.Key_Escape: self.close()
+
 class SettingsDialog(QDialog):
     def __init__(self, parent=None):
         super().__init__(parent)
@@ -384,6 +2956,83 @@ class SettingsDialog(QDialog):
         ConfigManager.save(self.config)
         self.accept()
 
+class SearchDialog(QDialog):
+    def __init__(self, app_ref, parent=None):
+        super().__init__(parent)
+        self.app_ref = app_ref
+        self.setWindowTitle("🔍 搜索历史与收藏")
+        self.resize(520, 420)
+        layout = QVBoxLayout(self)
+        self.inp = QLineEdit()
+        self.inp.setPlaceholderText("输入关键词，空格分隔...")
+        self.lbl_stat = QLabel("")
+        self.list = QListWidget()
+        self.list.setStyleSheet("QListWidget { background:#1e1e1e; color:#ddd; border:1px solid #444; } QListWidget::item { padding:4px; }")
+        layout.addWidget(self.inp)
+        layout.addWidget(self.lbl_stat)
+        layout.addWidget(self.list)
+        # 输入停顿 60ms 后再查询，连续输入只查最后一次
+        self.timer = QTimer(self)
+        self.timer.setSingleShot(True)
+        self.timer.setInterval(60)
+        self.timer.timeout.connect(self.run_query)
+        self.inp.textChanged.connect(lambda _: self.timer.start())
+        self.inp.returnPressed.connect(lambda: self.list.count() and self.open_item(self.list.item(0)))
+        self.list.itemActivated.connect(self.open_item)
+
+    def run_query(self):
+        t0 = time.perf_counter()
+        results = SearchIndex.instance().search(self.inp.text())
+        ms = (time.perf_counter() - t0) * 1000
+        self.list.clear()
+        for d in results:
+            tag = "⭐" if d['kind'] == 'fav' else "🕒"
+            item = QListWidgetItem(f"{tag} {d['time']}  {d['trans'][:40]}\n      {d['raw'][:50]}")
+            item.setData(Qt.ItemDataRole.UserRole, d)
+            self.list.addItem(item)
+        self.lbl_stat.setText(f"{len(results)} 条结果 • {ms:.1f} ms" if self.inp.text().strip() else "")
+
+    def open_item(self, item):
+        self.app_ref.open_search_result(item.data(Qt.ItemDataRole.UserRole))
+
+class DiagnosticsDialog(QDialog):
+    """各阶段耗时的滚动分位数（最近 200 次），每秒刷新"""
+    def __init__(self, app_ref, parent=None):
+        super().__init__(parent)
+        self.app_ref = app_ref
+        self.setWindowTitle("📊 诊断")
+        self.resize(560, 380)
+        layout = QVBoxLayout(self)
+        self.chk = QCheckBox(f"启用追踪 (写入 {os.path.basename(TRACE_FILE)})")
+        self.chk.setChecked(Tracer.enabled)
+        self.chk.toggled.connect(self.toggle)
+        self.view = QTextBrowser()
+        self.view.setStyleSheet("background:#1e1e1e; color:#ddd; border:1px solid #444;")
+        layout.addWidget(self.chk)
+        layout.addWidget(self.view)
+        self.timer = QTimer(self)
+        self.timer.setInterval(1000)
+        self.timer.timeout.connect(self.refresh)
+        self.timer.start()
+        self.refresh()
+
+    def toggle(self, on):
+        # 重新读取再保存，不覆盖启动后在设置面板里改过的项
+        cfg = ConfigManager.load()
+        cfg['trace_enabled'] = self.app_ref.config['trace_enabled'] = on
+        ConfigManager.save(cfg)
+        Tracer.configure(cfg)
+        self.refresh()
+
+    def refresh(self):
+        stats = Tracer.percentiles()
+        if not stats:
+            self.view.setHtml("<p style='color:#888'>" + ("等待下一次截图..." if Tracer.enabled else "追踪未启用") + "</p>")
+            return
+        rows = "".join(f"<tr><td>{name}</td><td align='right'>{n}</td><td align='right'>{p50:.1f}</td><td align='right'>{p90:.1f}</td><td align='right'>{p99:.1f}</td></tr>"
+                       for name, (n, p50, p90, p99) in stats.items())
+        self.view.setHtml("<table width='100%' cellspacing='0' cellpadding='3'><tr style='color:#0078d4'><th align='left'>阶段</th><th>次数</th><th>p50 ms</th><th>p90 ms</th><th>p99 ms</th></tr>" + rows + "</table>")
+
 class ClickableLabel(QLabel):
     clicked = pyqtSignal()
     def mousePressEvent(self, e):
@@ -437,6 +3086,8 @@ class ImageLightbox(QDialog):
     def mouseDoubleClickEvent(self, e): self.close()
 
 class AutoResizingTextEdit(QTextBrowser):
+    FRAME_MS = 16
+
     def __init__(self, text="", parent=None):
         super().__init__(parent)
         self.setFrameStyle(QFrame.Shape.NoFrame)
@@ -444,10 +3095,30 @@ class AutoResizingTextEdit(QTextBrowser):
         self.setStyleSheet("background: transparent; border: none; color: white; font-size: 13px;")
         self.setHtml(text.replace("\n", "<br>"))
         self.document().contentsChanged.connect(self.adjust_height)
+        # 流式片段先攒起来，每帧最多写入一次文档
+        self.pending = []
+        self.flush_timer = QTimer(self)
+        self.flush_timer.setSingleShot(True)
+        self.flush_timer.setInterval(self.FRAME_MS)
+        self.flush_timer.timeout.connect(self.flush)
+
     def adjust_height(self):
         doc_h = self.document().size().height()
         self.setFixedHeight(int(doc_h + 10))
 
+    def append_fragment(self, text):
+        self.pending.append(text)
+        if not self.flush_timer.isActive(): self.flush_timer.start()
+
+    def flush(self):
+        if not self.pending: return
+        text = "".join(self.pending)
+        self.pending.clear()
+        # 只在文档末尾追加新片段，已排版的部分不会重新布局
+        cur = QTextCursor(self.document())
+        cur.movePosition(QTextCursor.MoveOperation.End)
+        cur.insertText(text)
+
 class MessageBubble(QWidget):
     def __init__(self, text, is_user=True, img_bytes=None):
         super().__init__()
@@ -479,10 +3150,18 @@ class MessageBubble(QWidget):
             layout.addWidget(self.bubble)
             layout.addStretch()
         self.bubble.setMaximumWidth(320)
+        self.streaming = False
 
     def update_text(self, text):
         self.text_view.setHtml(text.replace("\n", "<br>"))
 
+    def append_text(self, fragment):
+        if not self.streaming:
+            # 第一个片段到达时清掉 "..." 占位
+            self.streaming = True
+            self.text_view.clear()
+        self.text_view.append_fragment(fragment)
+
 class ChatView(QWidget):
     sig_back = pyqtSignal()
     def __init__(self):
@@ -509,6 +3188,10 @@ class ChatView(QWidget):
         self.chat_layout = QVBoxLayout(self.content)
         self.chat_layout.addStretch()
         self.scroll.setWidget(self.content)
+        self.scroll_timer = QTimer(self)
+        self.scroll_timer.setSingleShot(True)
+        self.scroll_timer.setInterval(50)
+        self.scroll_timer.timeout.connect(lambda: self.scroll.verticalScrollBar().setValue(self.scroll.verticalScrollBar().maximum()))
         
         bot = QWidget()
         bh = QHBoxLayout(bot)
@@ -565,7 +3248,8 @@ class ChatView(QWidget):
         return bubble
 
     def scroll_down(self):
-        QTimer.singleShot(50, lambda: self.scroll.verticalScrollBar().setValue(self.scroll.verticalScrollBar().maximum()))
+        # 已有待执行的滚动就不再重复排队
+        if not self.scroll_timer.isActive(): self.scroll_timer.start()
         
     def on_send(self): pass
 
@@ -576,6 +3260,7 @@ class ResultView(QWidget):
         super().__init__()
         self.tts = tts_manager
         self.current_pixmap = None
+        self.trace_id = None
         
         layout = QVBoxLayout(self)
         layout.setContentsMargins(0,0,0,0)
@@ -648,6 +3333,9 @@ class ResultView(QWidget):
         return b
 
     def set_content(self, raw, trans, img_bytes):
+        with Tracer.span("render", self.trace_id, chars=len(raw) + len(trans)): self.show_content(raw, trans, img_bytes)
+
+    def show_content(self, raw, trans, img_bytes):
         self.raw_browser.setPlainText(raw)
         self.trans_browser.setHtml(trans.replace("\n", "<br>"))
         pix = QPixmap()
@@ -656,8 +3344,15 @@ class ResultView(QWidget):
         if not pix.isNull():
             self.lbl_image.setPixmap(pix.scaled(QSize(400, 120), Qt.AspectRatioMode.KeepAspectRatio, Qt.TransformationMode.SmoothTransformation))
 
+    def set_partial(self, raw, trans):
+        """流式输出时只刷新文字，不重新加载图片"""
+        if raw != self.raw_browser.toPlainText(): self.raw_browser.setPlainText(raw)
+        self.trans_browser.setHtml(trans.replace("\n", "<br>"))
+        sb = self.trans_browser.verticalScrollBar()
+        sb.setValue(sb.maximum())
+
     def set_loading(self, img_bytes):
-        self.set_content("...", "<div style='color:#aaa'>⚡ 正在分析...</div>", img_bytes)
+        self.show_content("...", "<div style='color:#aaa'>⚡ 正在分析...</div>", img_bytes)
         self.btn_chat.setEnabled(False)
 
 # ==============================================================================
@@ -665,7 +3360,9 @@ class ResultView(QWidget):
 # ==============================================================================
 
 class FancyBubble(QWidget):
-    def __init__(self, img_bytes, tts_manager, raw=None, trans=None, app_ref=None):
+    sig_closed = pyqtSignal()
+
+    def __init__(self, img_bytes, tts_manager, raw=None, trans=None, app_ref=None, trace_id=None, live=False):
         super().__init__()
         self.setWindowFlags(Qt.WindowType.FramelessWindowHint | Qt.WindowType.WindowStaysOnTopHint | Qt.WindowType.Tool)
         self.setAttribute(Qt.WidgetAttribute.WA_TranslucentBackground)
@@ -675,24 +3372,53 @@ class FancyBubble(QWidget):
         self.raw_txt = raw
         self.trans_txt = trans
         self.app_ref = app_ref
+        self.partial_trans = ""
+        self.tts_gen = None
         self.history = []
+        self.chat_ctx = ChatContext(ConfigManager.load()['chat_context_tokens'])
         self.drag_pos = QPoint()
         self.ai_bubble = None
+        self.live = live  # 实时区域：窗口常驻，画面变化时重新翻译，不记入历史
+        self.worker = None
+        self.cw = None
+        self.pending = None
 
         self.init_ui()
         self.show_animated()
 
-        if raw is None:
-            self.res_view.set_loading(img_bytes)
-            self.worker = AIWorker(img_bytes)
-            self.worker.sig_result.connect(self.on_ai_done)
-            self.worker.sig_model_used.connect(lambda m: self.lbl_title.setText(f"AI VISION • {m}"))
-            self.worker.start()
+        if raw is None: self.start_translation(img_bytes, trace_id)
         else:
             self.res_view.set_content(raw, trans, img_bytes)
             self.res_view.btn_chat.setEnabled(True)
             self.adjust_size()
 
+    def start_translation(self, img_bytes, trace_id=None):
+        # 上一次翻译还没结束时只保留最新一帧，结束后再开始
+        if self.worker and self.worker.isRunning():
+            self.pending = (img_bytes, trace_id)
+            return
+        self.img_bytes = img_bytes
+        self.raw_txt = self.trans_txt = None
+        self.partial_trans = ""
+        self.tts_gen = None
+        self.res_view.trace_id = trace_id
+        self.res_view.set_loading(img_bytes)
+        self.worker = AIWorker(img_bytes, trace_id)
+        self.worker.sig_result.connect(self.on_ai_done)
+        self.worker.sig_partial.connect(self.res_view.set_partial)
+        self.worker.sig_partial.connect(self.on_partial)
+        self.worker.sig_model_used.connect(lambda m: self.lbl_title.setText(f"{'LIVE' if self.live else 'AI VISION'} • {m}"))
+        self.worker.sig_timing.connect(lambda f, t: self.lbl_title.setText(f"{self.lbl_title.text()} • {f:.1f}s / {t:.1f}s"))
+        self.worker.start()
+
+    def closeEvent(self, e):
+        # 关掉气泡即中止还在排队或流式输出的翻译/追问，让出引擎
+        self.pending = None
+        for w in (self.worker, self.cw):
+            if w and w.isRunning(): w.abort()
+        self.sig_closed.emit()
+        super().closeEvent(e)
+
     def init_ui(self):
         self.main = QVBoxLayout(self)
         self.main.setContentsMargins(10,10,10,10)
@@ -735,11 +3461,15 @@ class FancyBubble(QWidget):
         self.grip = QSizeGrip(self)
         self.grip.setStyleSheet("background:transparent;")
 
-        self.res_view.btn_play_t.clicked.connect(lambda: self.tts.speak(self.trans_txt))
+        self.res_view.btn_play_t.clicked.connect(self.speak_trans)
         self.res_view.btn_copy_t.clicked.connect(lambda: pyperclip.copy(self.trans_txt))
         self.res_view.btn_play_r.clicked.connect(lambda: self.tts.speak(self.raw_txt))
         self.res_view.btn_copy_r.clicked.connect(lambda: pyperclip.copy(self.raw_txt))
         self.res_view.btn_fav.clicked.connect(self.do_fav)
+        if not self.img_bytes:
+            # 原图已被淘汰的往期历史没有截图可存，不能收藏
+            self.res_view.btn_fav.setEnabled(False)
+            self.res_view.btn_fav.setToolTip("原图已不可用，无法收藏")
         self.res_view.btn_chat.clicked.connect(self.go_chat)
         self.res_view.sig_open_lightbox.connect(lambda p: ImageLightbox(p, self).exec())
         
@@ -760,13 +3490,26 @@ class FancyBubble(QWidget):
         self.ani.setEndValue(1)
         self.ani.start()
 
+    def speak_trans(self):
+        if self.trans_txt is not None: self.tts.speak(self.trans_txt)
+        else: self.tts_gen = self.tts.speak(self.partial_trans, final=False)  # 译文还在生成，边生成边读
+
+    def on_partial(self, raw, trans):
+        self.partial_trans = trans
+        if self.tts_gen: self.tts.update(self.tts_gen, trans)
+
     def on_ai_done(self, r, t):
+        if self.tts_gen: self.tts.update(self.tts_gen, t, final=True)
+        if ConfigManager.load()['tts_prefetch'] and not r.startswith("Error:"): self.tts.prefetch(t)
         self.raw_txt = r
         self.trans_txt = t
         self.res_view.set_content(r, t, self.img_bytes)
         self.res_view.btn_chat.setEnabled(True)
         self.adjust_size()
-        if self.app_ref: self.app_ref.record_history(r, t, self.img_bytes)
+        if self.app_ref and not self.live: self.app_ref.record_history(r, t, self.img_bytes)
+        if self.pending:
+            pending, self.pending = self.pending, None
+            self.start_translation(*pending)
 
     def adjust_size(self):
         txt_len = len(self.trans_txt or "") + len(self.raw_txt or "")
@@ -774,6 +3517,7 @@ class FancyBubble(QWidget):
         self.resize(self.width(), h)
 
     def do_fav(self):
+        if not self.img_bytes: return
         if not os.path.exists(SAVE_DIR): os.makedirs(SAVE_DIR)
         ts = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
         path = os.path.join(SAVE_DIR, ts)
@@ -781,6 +3525,8 @@ class FancyBubble(QWidget):
         with open(os.path.join(path,"capture.png"),"wb") as f: f.write(self.img_bytes)
         with open(os.path.join(path,"content.json"),"w",encoding='utf-8') as f:
             json.dump({"time":ts,"raw":self.raw_txt,"trans":self.trans_txt}, f)
+        FavoritesIndex.instance().add(ts, self.raw_txt, self.trans_txt)
+        SearchIndex.instance().add('fav', ts, self.raw_txt, self.trans_txt)
         self.res_view.btn_fav.setText("✔ 已保存")
         self.res_view.btn_fav.setEnabled(False)
 
@@ -791,6 +3537,8 @@ class FancyBubble(QWidget):
                 {"role":"system","content":"[ENABLE_THINKING] You are a deep visual analysis expert."},
                 {"role":"user","content":f"Context: {self.raw_txt}","images":[self.img_bytes]}
             ]
+            # 搜索结果里的往期历史可能已没有原图
+            if not self.img_bytes: del self.history[1]['images']
             self.chat_view.add_msg("深度模式已开启。", False)
 
     def send_chat(self):
@@ -809,14 +3557,14 @@ class FancyBubble(QWidget):
         
         self.ai_bubble = self.chat_view.add_msg("...", False)
         self.ai_accum = ""
-        self.cw = ChatWorker(self.history)
+        self.cw = ChatWorker(self.chat_ctx.build(self.history))
         self.cw.sig_chunk.connect(self.on_chunk)
         self.cw.sig_done.connect(lambda: self.history.append({"role":"assistant","content":self.ai_accum}))
         self.cw.start()
 
     def on_chunk(self, c):
         self.ai_accum += c
-        if self.ai_bubble: self.ai_bubble.update_text(self.ai_accum)
+        if self.ai_bubble: self.ai_bubble.append_text(c)
         self.chat_view.scroll_down()
 
     def mousePressEvent(self, e):
@@ -832,17 +3580,55 @@ class FancyBubble(QWidget):
 # ==============================================================================
 
 class OCRApp(QWidget):
+    sig_service_ready = pyqtSignal(str)
+
     def __init__(self):
         super().__init__()
         self.config = ConfigManager.load()
-        OllamaService.check_and_start()
-        self.tts_manager = TTSManager()
-        self.history = []
+        Tracer.configure(self.config)
+        RequestScheduler.configure(self.config)
+        self.tts_manager = TTSManager(cache=TTSCache.from_config(self.config))
+        self.history = HistoryStore.from_config(self.config)
         self.poller = ClipboardPoller()
         self.poller.sig_image_found.connect(self.on_snip_done)
+        self.live = None
+        self.live_bubble = None
+        self.pending_services = {'engine', 'tts'}
+        self.sig_service_ready.connect(self.on_service_ready)
         self.setup_tray()
         self.register_hotkey()
-        print(f"Ready. Hotkey: {self.config['hotkey']}")
+        print(f"Ready. Hotkey: {self.config['hotkey']} ({(time.perf_counter() - START_TIME) * 1000:.0f}ms)")
+        self.start_services()
+
+    def start_services(self):
+        """托盘和热键可用之后再在后台启动 Ollama 守护、预先导入重模块、等 TTS 初始化"""
+        svc = OllamaService.instance()
+        svc.sig_ready.connect(self.on_ollama_ready)
+        svc.sig_unhealthy.connect(self.on_ollama_unhealthy)
+        svc.sig_restarted.connect(lambda n: self.tray.showMessage("AI 翻译", f"Ollama 已自动重启 (第 {n} 次)"))
+        svc.start()
+        def preload():
+            for mod in (ollama, Image, ImageGrab, ImageChops): mod._load()
+        def tts():
+            self.tts_manager.ready.wait(30)
+            self.sig_service_ready.emit('tts')
+        threading.Thread(target=preload, daemon=True).start()
+        threading.Thread(target=tts, daemon=True).start()
+
+    def on_ollama_ready(self):
+        OllamaWarmup.touch(self.config)
+        self.on_service_ready('engine')
+
+    def on_ollama_unhealthy(self, reason):
+        # 服务挂掉后模型已不在内存里，恢复后重新预热
+        OllamaWarmup.reset()
+        if 'engine' in self.pending_services: self.on_service_ready('engine')
+        self.tray.setToolTip(f"AI 翻译 • 本地引擎不可用: {reason}")
+
+    def on_service_ready(self, name):
+        self.pending_services.discard(name)
+        log.debug("[startup] %s ready (%.0fms)", name, (time.perf_counter() - START_TIME) * 1000)
+        self.tray.setToolTip("AI 翻译" if not self.pending_services else "AI 翻译 • 初始化中...")
 
     def setup_tray(self):
         self.tray = QSystemTrayIcon(self)
@@ -857,6 +3643,7 @@ class OCRApp(QWidget):
         p.drawText(pix.rect(), Qt.AlignmentFlag.AlignCenter, "AI")
         p.end()
         self.tray.setIcon(QIcon(pix))
+        self.tray.setToolTip("AI 翻译 • 初始化中...")
         self.menu = QMenu()
         self.menu.aboutToShow.connect(self.update_menu)
         self.tray.setContextMenu(self.menu)
@@ -869,15 +3656,48 @@ class OCRApp(QWidget):
         except: print("Hotkey Error")
 
     def start_snip(self):
+        OllamaWarmup.touch()
         if os.name == 'nt': os.startfile("ms-screenclip:")
         self.poller.start()
 
     def on_snip_done(self, img_bytes):
-        self.bubble = FancyBubble(img_bytes, self.tts_manager, app_ref=self)
+        self.bubble = FancyBubble(img_bytes, self.tts_manager, app_ref=self, trace_id=self.poller.trace_id)
         self.bubble.show()
 
+    def start_live(self):
+        self.selector = RegionSelector()
+        self.selector.sig_selected.connect(self.run_live)
+
+    def run_live(self, bbox):
+        self.stop_live()
+        cfg = ConfigManager.load()
+        cfg['live_region'] = self.config['live_region'] = list(bbox)
+        ConfigManager.save(cfg)
+        self.live = LiveCapture(bbox, self.config)
+        self.live.sig_frame.connect(self.on_live_frame)
+        self.live.start()
+        log.debug("[live] region %s at %s fps", bbox, self.config['live_fps'])
+
+    def on_live_frame(self, img_bytes, trace_id):
+        if self.live_bubble is None or not self.live_bubble.isVisible():
+            self.live_bubble = FancyBubble(img_bytes, self.tts_manager, app_ref=self, trace_id=trace_id, live=True)
+            self.live_bubble.sig_closed.connect(self.stop_live)
+        else: self.live_bubble.start_translation(img_bytes, trace_id)
+
+    def stop_live(self):
+        if self.live:
+            self.live.stop()
+            log.debug("[live] stopped: %s", self.live.format_stats())
+            self.live = None
+
     def record_history(self, r, t, b):
-        self.history.insert(0, {"time": datetime.datetime.now().strftime("%H:%M"), "raw":r, "trans":t, "img":b})
+        entry = self.history.add(r, t, b)
+        SearchIndex.instance().add('history', entry['path'], r, t)
+
+    def open_history(self, entry):
+        try: img = self.history.load_image(entry)
+        except OSError: return
+        self.open_bubble({'img': img, 'raw': entry['raw'], 'trans': entry['trans']})
 
     def open_bubble(self, d):
         self.bubble = FancyBubble(d['img'], self.tts_manager, d['raw'], d['trans'], self)
@@ -893,39 +3713,241 @@ class OCRApp(QWidget):
     def open_settings(self):
         SettingsDialog(None).exec()
 
+    def open_diagnostics(self):
+        self.diag_dlg = DiagnosticsDialog(self)
+        self.diag_dlg.show()
+
+    def open_search(self):
+        self.search_dlg = SearchDialog(self)
+        self.search_dlg.show()
+        self.search_dlg.activateWindow()
+
+    def open_search_result(self, d):
+        if d['kind'] == 'fav': return self.open_favorite(d['ref'])
+        entry = self.history.find(d['ref'])
+        if entry: return self.open_history(entry)
+        # 往期会话的历史原图已随退出删除，只展示文字
+        self.open_bubble({'img': b"", 'raw': d['raw'], 'trans': d['trans']})
+
     def update_menu(self):
         self.menu.clear()
+        if self.pending_services:
+            names = {'engine': "引擎", 'tts': "语音"}
+            self.menu.addAction("⏳ 正在初始化: " + " / ".join(names[n] for n in sorted(self.pending_services))).setEnabled(False)
         self.menu.addAction("⚙️ API 设置").triggered.connect(self.open_settings)
         self.menu.addAction("⌨️ 快捷键").triggered.connect(self.change_hotkey)
+        self.menu.addAction("🔍 搜索").triggered.connect(self.open_search)
+        self.menu.addAction("📊 诊断").triggered.connect(self.open_diagnostics)
+        if self.live: self.menu.addAction(f"⏹ 停止实时区域 • {self.live.format_stats()}").triggered.connect(self.stop_live)
+        else:
+            lm = self.menu.addMenu("📺 实时区域")
+            lm.addAction("框选区域...").triggered.connect(self.start_live)
+            if self.config.get('live_region'): lm.addAction("上次区域").triggered.connect(lambda: self.run_live(tuple(self.config['live_region'])))
+        self.add_engine_menu()
         self.menu.addSeparator()
-        hm = self.menu.addMenu(f"🕒 历史 ({len(self.history)})")
-        if self.history:
-            for i in self.history:
+        hm = self.menu.addMenu(f"🕒 历史 ({len(self.history)} • {self.history.memory_footprint() / 1024:.0f} KB)")
+        if len(self.history):
+            limit = self.config['history_menu_items']
+            for i in list(self.history)[:limit]:
                 act = QAction(f"{i['time']} - {i['trans'][:10]}...", self)
-                act.triggered.connect(lambda _, d=i: self.open_bubble(d))
+                if i['thumb']:
+                    pix = QPixmap()
+                    pix.loadFromData(i['thumb'])
+                    act.setIcon(QIcon(pix))
+                act.triggered.connect(lambda _, d=i: self.open_history(d))
                 hm.addAction(act)
+            if len(self.history) > limit: hm.addAction(f"… 另有 {len(self.history) - limit} 条").setEnabled(False)
         else: hm.addAction("空").setEnabled(False)
         
-        fm = self.menu.addMenu("⭐ 收藏")
-        if os.path.exists(SAVE_DIR):
-            for fd in sorted(os.listdir(SAVE_DIR), reverse=True):
-                path = os.path.join(SAVE_DIR, fd)
-                try:
-                    with open(os.path.join(path,"content.json"),'r',encoding='utf-8') as f: d=json.load(f)
-                    with open(os.path.join(path,"capture.png"),'rb') as f: b=f.read()
-                    act = QAction(f"{d['trans'][:10]}...", self)
-                    act.triggered.connect(lambda _, ib=b,r=d['raw'],t=d['trans']: self.open_bubble({'img':ib,'raw':r,'trans':t}))
-                    fm.addAction(act)
-                except: pass
+        self.add_favorites_menu()
         self.menu.addSeparator()
         self.menu.addAction("退出").triggered.connect(self.quit_app)
 
+    def add_favorites_menu(self):
+        total = 0
+        if os.path.exists(SAVE_DIR):
+            fav = FavoritesIndex.instance()
+            fav.reconcile()  # 只列目录，菜单每次打开都能看到程序外增删的收藏
+            total = fav.count()
+        fm = self.menu.addMenu(f"⭐ 收藏 ({total})")
+        if not total:
+            fm.addAction("空").setEnabled(False)
+            return
+        size = self.config['favorites_page_size']
+        self.fill_favorites(fm, 0, size)
+        # 后续每页一个子菜单，鼠标悬停时才查询
+        for offset in range(size, total, size):
+            pm = fm.addMenu(f"📄 {offset + 1}–{min(offset + size, total)}")
+            pm.aboutToShow.connect(lambda m=pm, o=offset: m.isEmpty() and self.fill_favorites(m, o, size))
+
+    def fill_favorites(self, menu, offset, limit):
+        for d in FavoritesIndex.instance().page(offset, limit):
+            act = QAction(f"{d['label']}...", menu)
+            act.triggered.connect(lambda _, fid=d['id']: self.open_favorite(fid))
+            menu.addAction(act)
+
+    def open_favorite(self, fid):
+        d = FavoritesIndex.instance().load(fid)
+        if d: self.open_bubble(d)
+
+    def add_engine_menu(self):
+        em = self.menu.addMenu("🩺 引擎状态")
+        icons = {'closed': "🟢", 'half_open': "🟡", 'open': "🔴"}
+        fmt = lambda v: f"{v:.1f}s" if v is not None else "-"
+        entries = EngineHealth.entries()
+        for engine, model in entries:
+            s = EngineHealth.summary(engine, model)
+            rate = f"{s['success_rate'] * 100:.0f}%" if s['success_rate'] is not None else "-"
+            em.addAction(f"{icons[s['state']]} {engine} • {model} • {rate} • p50 {fmt(s['p50'])} p90 {fmt(s['p90'])}").setEnabled(False)
+        if not entries: em.addAction("暂无数据").setEnabled(False)
+        engines, waits = RequestScheduler.stats()
+        em.addAction("🚦 调度 • " + " • ".join(f"{e} 运行 {r}/{lim} 排队 {q} (峰值 {pk})" for e, (r, q, lim, pk) in engines.items())).setEnabled(False)
+        if waits:
+            names = {'interactive': "翻译", 'chat': "追问", 'batch': "批量"}
+            em.addAction("⏱ 排队等待 p50/p95 • " + " • ".join(f"{names[k]} {p50 * 1000:.0f}/{p95 * 1000:.0f}ms ({n})" for k, (n, p50, p95) in waits.items())).setEnabled(False)
+        svc = OllamaService.instance()
+        states = {'stopped': "⚪ 未启用", 'starting': "⏳ 启动中", 'ready': "🟢 就绪", 'unhealthy': "🔴 无响应", 'missing': "🔴 未找到 ollama"}
+        em.addAction(f"Ollama • {states[svc.state]} • 已自动重启 {svc.restarts} 次").setEnabled(False)
+        icons = {'cold': "❄️", 'loading': "⏳", 'ready': "🔥"}
+        for model, st in OllamaWarmup.status().items():
+            em.addAction(f"{icons[st['status']]} {model} • 冷启动 {fmt(st['ready_s'])} (加载 {fmt(st['load_s'])})").setEnabled(False)
+        if self.config.get('ocr_enabled'):
+            paths = LocalOCR.summary()
+            em.addAction(f"🔤 OCR 快速通道 {paths['ocr'][0]} 次 p50 {fmt(paths['ocr'][1])} • 视觉 {paths['vision'][0]} 次 p50 {fmt(paths['vision'][1])}").setEnabled(False)
+        if self.config.get('tm_enabled', True):
+            tm = TranslationMemory.instance().summary()
+            rate = f"{tm['hit_rate'] * 100:.0f}%" if tm['hit_rate'] is not None else "-"
+            p50 = f"{tm['p50_ms']:.1f}ms" if tm['p50_ms'] is not None else "-"
+            em.addAction(f"📚 翻译记忆 {tm['segments']} 段 • 命中 {rate} (精确 {tm['exact']} / 近似 {tm['fuzzy']} / 未中 {tm['miss']}) • 查询 p50 {p50}").setEnabled(False)
+
     def quit_app(self):
+        self.stop_live()
         self.tts_manager.stop()
-        OllamaService.stop()
+        OllamaService.shutdown()
         QApplication.quit()
 
+# ==============================================================================
+# 7. 批量模式 (Headless)
+# ==============================================================================
+
+class BatchTranslator:
+    """无界面批量翻译：目录或 glob 中的图片经有限并发的线程池翻译，结果逐行追加写入 JSONL，可断点续跑"""
+    EXTS = ('.png', '.jpg', '.jpeg', '.bmp', '.webp')
+
+    def __init__(self, source, out_path, workers=2, progress_every=10):
+        self.source = source
+        self.out_path = out_path
+        self.workers = max(1, workers)
+        self.progress_every = progress_every
+        self.latencies = {}
+        self.lock = threading.Lock()
+
+    def files(self):
+        if os.path.isdir(self.source):
+            for root, _, names in sorted(os.walk(self.source)):
+                for n in sorted(names):
+                    if n.lower().endswith(self.EXTS): yield os.path.join(root, n)
+        else:
+            for p in sorted(glob.glob(self.source, recursive=True)):
+                if p.lower().endswith(self.EXTS): yield p
+
+    def done_files(self):
+        """已成功写入的文件；出错的行会在续跑时重试"""
+        done = set()
+        if os.path.exists(self.out_path):
+            with open(self.out_path, "r", encoding='utf-8') as f:
+                for line in f:
+                    try:
+                        d = json.loads(line)
+                        if not d.get('error'): done.add(d['file'])
+                    except ValueError: pass  # 中断时写了半行
+        return done
+
+    def trim_partial(self):
+        """中断时最后一行可能只写了一半：截到最后一个换行，续写的记录不会粘在半行后面"""
+        if not os.path.exists(self.out_path): return
+        with open(self.out_path, "rb+") as f:
+            size = pos = f.seek(0, 2)
+            while pos > 0:
+                step = min(65536, pos)
+                f.seek(pos - step)
+                i = f.read(step).rfind(b"\n")
+                if i >= 0:
+                    pos = pos - step + i + 1
+                    break
+                pos -= step
+            if pos != size: f.truncate(pos)
+
+    def translate_one(self, path):
+        t0 = time.perf_counter()
+        rec = {'file': path}
+        try:
+            with open(path, "rb") as f: img = f.read()
+            label, content = AIWorker(img, Tracer.new_trace(), RequestScheduler.BATCH).resolve()
+            rec['raw'], rec['trans'] = AIWorker.parse_content(content)
+            rec['engine'] = label
+        except Exception as e:
+            rec['error'], rec['engine'] = str(e), "error"
+        rec['latency'] = round(time.perf_counter() - t0, 3)
+        with self.lock: self.latencies.setdefault(rec['engine'], []).append(rec['latency'])
+        return rec
+
+    def run(self):
+        config = ConfigManager.load()
+        Tracer.configure(config)
+        RequestScheduler.configure(config)
+        self.trim_partial()
+        done = self.done_files()
+        todo = (p for p in self.files() if p not in done)
+        n = errors = 0
+        t0 = time.perf_counter()
+        print(f"[batch] {len(done)} already done, workers={self.workers}, output={self.out_path}")
+        from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+        with ThreadPoolExecutor(self.workers) as pool, open(self.out_path, "a", encoding='utf-8') as out:
+            pending = set()
+            exhausted = False
+            while pending or not exhausted:
+                # 最多 2×workers 个任务在队列里，目录再大也不会一次性全部提交
+                while not exhausted and len(pending) < self.workers * 2:
+                    p = next(todo, None)
+                    if p is None: exhausted = True
+                    else: pending.add(pool.submit(self.translate_one, p))
+                if not pending: break
+                finished, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for fut in finished:
+                    rec = fut.result()
+                    out.write(json.dumps(rec, ensure_ascii=False) + "\n")
+                    out.flush()
+                    n += 1
+                    errors += 'error' in rec
+                    if n % self.progress_every == 0: print(f"[batch] {n} done, {n / (time.perf_counter() - t0):.2f} img/s")
+        self.report(n, errors, time.perf_counter() - t0)
+
+    def report(self, n, errors, elapsed):
+        print(f"[batch] {n} images in {elapsed:.1f}s ({n / elapsed if elapsed else 0:.2f} img/s), {errors} errors")
+        for engine, lat in sorted(self.latencies.items()):
+            lat = sorted(lat)
+            pct = lambda p: lat[int(p * (len(lat) - 1))]
+            print(f"  {engine:<32} n={len(lat):<5} p50={pct(0.5):.2f}s p90={pct(0.9):.2f}s p99={pct(0.99):.2f}s")
+
 if __name__ == "__main__":
+    if "--debug" in sys.argv:
+        # 只打开本程序的 logger，根 logger 保持 WARNING，PIL / urllib3 / httpcore 的调试输出不刷屏
+        handler = logging.StreamHandler()
+        handler.setFormatter(logging.Formatter("%(message)s"))
+        log.addHandler(handler)
+        log.setLevel(logging.DEBUG)
+    if "--batch" in sys.argv:
+        import argparse
+        ap = argparse.ArgumentParser(description="ScreenTranslatorAI 批量翻译")
+        ap.add_argument("--batch", required=True, metavar="DIR_OR_GLOB", help="图片目录或 glob，如 'shots/**/*.png'")
+        ap.add_argument("--out", default="batch_results.jsonl")
+        ap.add_argument("--workers", type=int, default=2)
+        ap.add_argument("--debug", action="store_true", help="打印各阶段的诊断信息")
+        args = ap.parse_args()
+        BatchTranslator(args.batch, args.out, args.workers).run()
+        sys.exit(0)
+
     app = QApplication(sys.argv)
     app.setQuitOnLastWindowClosed(False)
     core = OCRApp()
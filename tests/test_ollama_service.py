@@ -0,0 +1,44 @@
+import os
+import sys
+import unittest
+
+# 仓库根目录放在最前，避免导入到标准库的 test 包
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import test as app
+
+
+class HostUrlTest(unittest.TestCase):
+    """OLLAMA_HOST 的解析要和 ollama 客户端一致，否则守护线程会探测错端口"""
+    CASES = [
+        (None, "http://127.0.0.1:11434"),
+        ("", "http://127.0.0.1:11434"),
+        (":56789", "http://127.0.0.1:56789"),
+        ("0.0.0.0", "http://127.0.0.1:11434"),
+        ("example.com", "http://example.com:11434"),
+        ("example.com:56789", "http://example.com:56789"),
+        ("http://example.com", "http://example.com:80"),
+        ("https://example.com", "https://example.com:443"),
+        ("https://example.com:56789", "https://example.com:56789"),
+        ("https://example.com:56789/path/", "https://example.com:56789/path"),
+        ("example.com/path", "http://example.com:11434/path"),
+        ("[::1]", "http://[::1]:11434"),
+        ("[0001:002:003:0004::1]:56789", "http://[0001:002:003:0004::1]:56789"),
+        ("http://[0001:002:003:0004::1]", "http://[0001:002:003:0004::1]:80"),
+        ("https://[0001:002:003:0004::1]", "https://[0001:002:003:0004::1]:443"),
+        ("[0001:002:003:0004::1]:56789/path", "http://[0001:002:003:0004::1]:56789/path"),
+    ]
+
+    def test_host_url(self):
+        for host, want in self.CASES:
+            with self.subTest(host=host):
+                self.assertEqual(app.OllamaService.host_url(host), want)
+
+    def test_is_local(self):
+        for host, local in [("", True), ("localhost:8080", True), ("[::1]:11434", True), ("https://[::1]", True),
+                            ("https://example.com", False), ("[0001:002:003:0004::1]", False)]:
+            with self.subTest(host=host):
+                self.assertEqual(app.OllamaService("ollama", host=host).is_local(), local)
+
+
+if __name__ == "__main__":
+    unittest.main()
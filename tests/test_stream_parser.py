@@ -0,0 +1,56 @@
+import os
+import sys
+import unittest
+
+# 仓库根目录放在最前，避免导入到标准库的 test 包
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import test as app
+
+
+class StreamParserTest(unittest.TestCase):
+    """流式解析器不管 chunk 怎么切，结果都要和整段的 parse_content 一致"""
+    SAMPLES = [
+        "【Original】\nHello world\n【Translation】\n你好，世界",
+        "【Original】\nOpen file\n【Translation】\n打开文件【Original】不再识别",
+        "只有译文，没有任何标记",
+        "【Original】\n模型没输出译文标记",
+        "【Original】\n停在半个标记上【Trans",
+        "【Original】\n结尾是半个【",
+        "【Orig",
+    ]
+
+    def feed_split(self, content, cuts):
+        p = app.TranslationStreamParser()
+        last = 0
+        for c in cuts + [len(content)]:
+            p.feed(content[last:c])
+            last = c
+        return p
+
+    def test_every_single_split_matches_parse_content(self):
+        for content in self.SAMPLES:
+            want = app.AIWorker.parse_content(content)
+            for i in range(len(content) + 1):
+                with self.subTest(content=content, cut=i):
+                    self.assertEqual(self.feed_split(content, [i]).result(final=True), want)
+
+    def test_split_inside_markers(self):
+        content = self.SAMPLES[0]
+        # 两个标记都从中间切开，逐字喂入也一样
+        cuts = [content.index("Orig") + 2, content.index("【Translation") + 4]
+        self.assertEqual(self.feed_split(content, cuts).result(final=True), ("Hello world", "你好，世界"))
+        self.assertEqual(self.feed_split(content, list(range(1, len(content)))).result(), ("Hello world", "你好，世界"))
+
+    def test_pending_tail_is_flushed(self):
+        p = self.feed_split("【Original】\nabc【Trans", [13])
+        self.assertEqual(p.pending, "【Trans")
+        self.assertEqual(p.result(), ("abc【Trans", ""))
+        self.assertEqual(p.result(final=True), ("...", "【Original】\nabc【Trans"))
+
+    def test_original_shown_while_streaming(self):
+        p = self.feed_split("【Original】\nHello", [])
+        self.assertEqual(p.result(), ("Hello", ""))
+
+
+if __name__ == "__main__":
+    unittest.main()